@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_asgi_application()
+
+# Build the material search index in the background of every worker, or
+# once in the master of pre-forked workers (manage.py serve)
+from bom.search import material_index  # noqa: E402
+
+material_index.warm()
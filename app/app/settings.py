@@ -40,13 +40,16 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
-    'core',
+    'core.apps.CoreConfig',
     'user',
     'article',
-    'bom',
+    'bom.apps.BomConfig',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.AsyncViewsMiddleware',
+    'core.middleware.QueryCountMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,8 +59,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Report query count and database time of each request in response headers
+DEBUG_SQL_HEADERS = os.environ.get('DEBUG_SQL_HEADERS', '') == '1'
+
 ROOT_URLCONF = 'app.urls'
 
+# Urlconf of the requests served by ASGI, ASYNC_VIEWS=1 serves the read
+# heavy endpoints by async views (app.urls_async). Off by default, they
+# did not pay off against the same views sync (benchmark serve).
+ASYNC_URLCONF = 'app.urls_async' \
+    if os.environ.get('ASYNC_VIEWS', '') == '1' else None
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -82,15 +94,76 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE':'django.db.backends.postgresql',
+        'ENGINE':'core.db.backends.postgresql',
         'HOST':os.environ.get('DB_HOST'),
         'NAME':os.environ.get('DB_NAME'),
         'USER':os.environ.get('DB_USER'),
         'PASSWORD':os.environ.get('DB_PASS'),
+        # Seconds a thread keeps its connection, 0 hands it back per request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        # Connections kept open by the process, see core.db.pool
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+            # Open at once, idle or in use; more wait up to TIMEOUT seconds
+            'MAX_CONNECTIONS': int(
+                os.environ.get('DB_POOL_MAX_CONNECTIONS', 20)
+            ),
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_LIFETIME': int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+            'HEALTH_CHECK': int(os.environ.get('DB_POOL_HEALTH_CHECK', 30)),
+        },
     }
 }
 
 
+# Read replicas of the default database, DB_REPLICA_HOSTS=host,host
+# List and retrieve of the catalog viewsets read from them (core.db.routers)
+
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASE_REPLICAS.append(f'replica{number}')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+# Seconds the token of a write reads from the default database only,
+# keep it above the lag replicas are allowed. The pins are kept in the
+# default cache, which has to be shared by the workers: CACHE_DIR on
+# storage every worker mounts (check core.E001).
+# Replicas are healthy while their WAL receiver streams, the database
+# role needs pg_monitor to see its status.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 15))
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bom-app',
+        }
+    }
+
+# Seconds list responses stay cached, 0 disables the response cache
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -129,4 +202,18 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.User'
+
+# Django rest framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+# Seconds a token stays in the token cache of a process, its size.
+# Revocations reach the workers sharing the default cache (CACHE_DIR) on
+# their next request, the others only once the TTL expires.
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+}
@@ -0,0 +1,17 @@
+"""app URL Configuration of the ASGI deployment
+
+Routes as app.urls, with the read heavy routes of the apps served by
+their async views (the async_urlpatterns of the apps).
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+from article.urls import async_urlpatterns as article_urlpatterns
+from bom.urls import async_urlpatterns as bom_urlpatterns
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/user/', include('user.urls')),
+    path('api/article/', include((article_urlpatterns, 'article'))),
+    path('api/bom/', include((bom_urlpatterns, 'bom'))),
+]
@@ -1,10 +1,14 @@
 """
 Serializers for api/article
 """
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from core.models import Color, Article, ArticleInfo, categorize
+from core.models import Color, Article, ArticleInfo, ArticleCatalog, \
+                        Category, ChangeVersion, categorize
 
 
 class ColorSerializer(serializers.ModelSerializer):
@@ -15,6 +19,20 @@ class ColorSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'code')
         read_only_fields = ('id',)
 
+    def update(self, instance, validated_data):
+        """
+        Update a color, also regenerates the artid of its article infos
+        when the color code changes.
+        """
+        code = instance.code
+
+        with transaction.atomic():
+            color = super().update(instance, validated_data)
+            if color.code != code:
+                ArticleInfo.objects.filter(color=color).regenerate_artids()
+
+        return color
+
 
 class ArticleSerializer(serializers.ModelSerializer):
     """Serializer for the article objects"""
@@ -31,16 +49,15 @@ class ArticleSerializer(serializers.ModelSerializer):
         Update a article, also updates the artid if exists.
         If artno number is new, artid in ArticleInfo will also be updated.
         """
-        if str(instance) != validated_data['artno']:
-            article_infos = instance.items.all()
-            newartno = validated_data['artno']
+        artno = instance.artno
 
-            for i in article_infos:
-                newartid = '-'.join([newartno] + str(i).split('-')[1:])
-                i.artid = newartid
-                i.save()
+        with transaction.atomic():
+            article = super().update(instance, validated_data)
+            if article.artno != artno:
+                ArticleInfo.objects.filter(
+                    article=article
+                ).regenerate_artids()
 
-        article = super().update(instance, validated_data)
         return article
 
 
@@ -79,6 +96,159 @@ class ArticleInfoSerializer(serializers.ModelSerializer):
         return article_info
 
 
+class ArticleInfoVariantSerializer(serializers.Serializer):
+    """Serializer for a single variant of the bulk creation"""
+    color = serializers.IntegerField()
+    category = serializers.ChoiceField(choices=Category.choices)
+    price = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                     required=False)
+    basic = serializers.DecimalField(max_digits=6, decimal_places=2,
+                                     required=False)
+    active = serializers.BooleanField(required=False)
+    export = serializers.BooleanField(required=False)
+
+
+class ArticleInfoBulkSerializer(serializers.Serializer):
+    """
+    Serializer for creating article infos of an article in bulk.
+    Variants are given as a list of "variants", as a matrix of
+    "colors" x "categories" sharing the price, active, export, or both.
+    Rows clashing with existing article infos are reported as conflicts.
+    """
+    article = serializers.PrimaryKeyRelatedField(
+        queryset=Article.objects.all()
+    )
+    variants = ArticleInfoVariantSerializer(many=True, required=False)
+    colors = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+    categories = serializers.ListField(
+        child=serializers.ChoiceField(choices=Category.choices),
+        required=False
+    )
+    price = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                     required=False)
+    basic = serializers.DecimalField(max_digits=6, decimal_places=2,
+                                     required=False)
+    active = serializers.BooleanField(required=False)
+    export = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        """
+        Expand the matrix into variants, resolving every color
+        with a single query.
+        """
+        variants = list(attrs.get('variants', []))
+        colors = attrs.get('colors', [])
+        categories = attrs.get('categories', [])
+
+        if bool(colors) != bool(categories):
+            raise serializers.ValidationError(
+                'Both colors and categories are required for a matrix'
+            )
+        defaults = {
+            field: attrs[field]
+            for field in ('price', 'basic', 'active', 'export')
+            if field in attrs
+        }
+        variants += [
+            dict(defaults, color=color, category=category)
+            for color in colors for category in categories
+        ]
+        if not variants:
+            raise serializers.ValidationError('No variants given')
+
+        color_ids = {variant['color'] for variant in variants}
+        found = Color.objects.in_bulk(color_ids)
+        missing = sorted(color_ids - set(found))
+        if missing:
+            raise serializers.ValidationError(
+                {'colors': [f'Invalid pk "{pk}" - object does not exist.'
+                            for pk in missing]}
+            )
+        for variant in variants:
+            variant['color'] = found[variant['color']]
+
+        return {'article': attrs['article'], 'variants': variants}
+
+    def create(self, validated_data):
+        """
+        Create the variants with one uniqueness query and one insert.
+        Returns the created article infos and the conflicting rows.
+        """
+        article = validated_data['article']
+        user = validated_data['user']
+        rows, conflicts = {}, []
+
+        for variant in validated_data['variants']:
+            color, category = variant['color'], variant['category']
+            artid = f'{article.artno}-{color.code}-{category}'
+            if artid in rows:
+                conflicts.append({
+                    'artid': artid, 'color': color.id, 'category': category,
+                    'detail': 'Duplicated in the request.'
+                })
+                continue
+            rows[artid] = ArticleInfo(
+                user=user, article=article, artid=artid,
+                mcategory=categorize(value=category), **variant
+            )
+
+        try:
+            with transaction.atomic():
+                # Bulk creates of the article wait for each other, the
+                # check sees the rows of the one before
+                Article.objects.select_for_update().get(pk=article.pk)
+                conflicts += self.existing(article, rows)
+                created = ArticleInfo.objects.filter(
+                    artid__in=rows
+                ).order_by('id')
+                ArticleInfo.objects.bulk_create(rows.values())
+                ArticleCatalog.objects.sync(created)
+                ChangeVersion.objects.touch(ArticleInfo)
+        except IntegrityError:
+            # Created meanwhile by other endpoints
+            raise serializers.ValidationError(
+                'Article infos were created concurrently, try again.'
+            )
+
+        return {'created': list(created), 'conflicts': conflicts}
+
+    def existing(self, article, rows):
+        """
+        Conflicts of the rows by artid with existing article infos,
+        removed from the rows
+        """
+        existing = ArticleInfo.objects.filter(
+            Q(artid__in=rows) |
+            Q(article=article,
+              color__in={row.color_id for row in rows.values()},
+              category__in={row.category for row in rows.values()})
+        ).values_list('artid', 'color_id', 'category')
+        pairs = {(color, category) for _, color, category in existing}
+        artids = {artid for artid, _, _ in existing}
+
+        conflicts = []
+        for artid, row in list(rows.items()):
+            if artid in artids or (row.color_id, row.category) in pairs:
+                conflicts.append({
+                    'artid': artid, 'color': row.color_id,
+                    'category': row.category,
+                    'detail': 'Article info already exists.'
+                })
+                del rows[artid]
+        return conflicts
+
+    def to_representation(self, instance):
+        """Created article infos with the conflicts"""
+        return {
+            'created': ArticleInfoSerializer(
+                instance['created'], many=True
+            ).data,
+            'conflicts': instance['conflicts'],
+        }
+
+
 class ArticleInfoDetailSerializer(ArticleInfoSerializer):
     """Serialize detailed view of article info"""
     article = serializers.StringRelatedField(read_only=True)
@@ -100,3 +270,17 @@ class ArticlePublicSerializer(serializers.ModelSerializer):
         fields = (
             'article', 'color', 'mcategory', 'price', 'active'
         )
+
+
+class ArticleCatalogSerializer(serializers.ModelSerializer):
+    """
+    Serialize the public view of articles from the catalog read model.
+    Output is identical to ArticlePublicSerializer, without related lookups.
+    """
+    article = serializers.CharField(source='artno', read_only=True)
+
+    class Meta:
+        model = ArticleCatalog
+        fields = (
+            'article', 'color', 'mcategory', 'price', 'active'
+        )
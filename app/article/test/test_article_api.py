@@ -3,12 +3,14 @@ All Article model related tests are here.
 """
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Article
+from core.models import Article, ArticleInfo
 
 from article.serializers import ArticleSerializer, ArticleDetailSerializer
 
@@ -64,7 +66,7 @@ class PrivateArticleApiTests(TestCase):
         serializer = ArticleSerializer(articles, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_user_create_article_unsuccess(self):
         """Test that creating a article is unsuccessful by normal user"""
@@ -129,6 +131,46 @@ class ProtectedArticleApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_update_artno_regenerates_artids(self):
+        """Test changing the artno rewrites the artid of its variants"""
+        article = samples.article(user=self.user)
+        for code, name in [('bk', 'black'), ('br', 'brown')]:
+            color = samples.color(user=self.user, code=code, name=name)
+            samples.article_info(user=self.user, article=article,
+                                 color=color)
+        payload = {'artno': '3291', 'brand': 'pride', 'style': 'covering'}
+
+        res = self.client.put(detail_url(article.id), payload)
+        artids = ArticleInfo.objects.order_by('artid').values_list(
+            'artid', flat=True)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(artids), ['3291-bk-g', '3291-br-g'])
+
+    def test_update_artno_constant_queries(self):
+        """Test artid regeneration costs the same for any variant count"""
+        article = samples.article(user=self.user)
+        queries = []
+        for i in range(1, 12, 5):
+            colors = [
+                samples.color(user=self.user, code=f'{chr(97 + i)}{n}',
+                              name=f'{i}{n}')
+                for n in range(5)
+            ]
+            for color in colors:
+                samples.article_info(user=self.user, article=article,
+                                     color=color)
+            payload = {'artno': f'r{i}', 'brand': 'pride'}
+
+            with CaptureQueriesContext(connection) as captured:
+                self.client.put(detail_url(article.id), payload)
+            queries.append(len(captured))
+
+        self.assertEqual(len(set(queries)), 1)
+        self.assertFalse(
+            ArticleInfo.objects.exclude(artid__startswith='r11-').exists()
+        )
+
     def test_create_duplicate_article_invalid(self):
         """Test that creating article with same artno is invalid"""
         samples.article(user=self.user, artno='3780')
@@ -182,11 +224,11 @@ class FilterArticleApiTests(TestCase):
         serializer4 = ArticleSerializer(article4)
         serializer5 = ArticleSerializer(article5)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
-        self.assertIn(serializer4.data, res.data)
-        self.assertNotIn(serializer5.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+        self.assertIn(serializer4.data, res.data['results'])
+        self.assertNotIn(serializer5.data, res.data['results'])
 
     def test_filter_style(self):
         """Test filter article by style"""
@@ -214,11 +256,11 @@ class FilterArticleApiTests(TestCase):
         serializer4 = ArticleSerializer(article4)
         serializer5 = ArticleSerializer(article5)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
-        self.assertIn(serializer4.data, res.data)
-        self.assertNotIn(serializer5.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+        self.assertIn(serializer4.data, res.data['results'])
+        self.assertNotIn(serializer5.data, res.data['results'])
 
     def test_filter_color(self):
         """Test filter article if the color is available"""
@@ -253,9 +295,9 @@ class FilterArticleApiTests(TestCase):
         serializer2 = ArticleSerializer(article2)
         serializer3 = ArticleSerializer(article3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_category(self):
         """Test filter article by main category"""
@@ -294,7 +336,7 @@ class FilterArticleApiTests(TestCase):
         serializer3 = ArticleSerializer(article3)
         serializer4 = ArticleSerializer(article4)
 
-        self.assertNotIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertIn(serializer3.data, res.data)
-        self.assertIn(serializer4.data, res.data)
+        self.assertNotIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertIn(serializer3.data, res.data['results'])
+        self.assertIn(serializer4.data, res.data['results'])
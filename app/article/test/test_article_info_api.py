@@ -1,15 +1,24 @@
 """
 All ArticleInfo model related tests are here.
 """
+import csv
+import json
+import threading
+
+from unittest import skipUnless
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import ArticleInfo
+from core.pagination import KeysetPagination
 
 from article.serializers import ArticleInfoSerializer, \
                                 ArticleInfoDetailSerializer
@@ -18,6 +27,8 @@ from . import samples
 
 
 ARTICLE_INFO_URL = reverse('article:articleinfo-list')
+ARTICLE_INFO_BULK_URL = reverse('article:articleinfo-bulk')
+ARTICLE_INFO_EXPORT_URL = reverse('article:articleinfo-export')
 
 
 def detail_url(articleinfo_id):
@@ -73,8 +84,8 @@ class PrivateArticleinfoApiTests(TestCase):
         serializer = ArticleInfoSerializer(articles, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
-        self.assertEqual(len(res.data), 3)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(len(res.data['results']), 3)
 
     def test_user_create_articleinfo_unsuccess(self):
         """Test that creating article info is unsuccessful by normal user"""
@@ -202,6 +213,166 @@ class ProtectedArticleinfoApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class BulkArticleinfoApiTests(TestCase):
+    """Test creating article infos in bulk"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='staff@kalalokia.xyz',
+            password='staffpass',
+            is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+        self.article = samples.article(user=self.user)
+        self.color_1 = samples.color(user=self.user)
+        self.color_2 = samples.color(user=self.user, code='br', name='brown')
+
+    def test_bulk_create_matrix(self):
+        """Test creating colors x categories matrix with a shared price"""
+        payload = {
+            'article': self.article.id,
+            'colors': [self.color_1.id, self.color_2.id],
+            'categories': ['g', 'l', 'x'],
+            'price': '299.00',
+        }
+
+        res = self.client.post(ARTICLE_INFO_BULK_URL, payload, format='json')
+        articles = ArticleInfo.objects.order_by('id')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['conflicts'], [])
+        self.assertEqual(
+            res.data['created'],
+            ArticleInfoSerializer(articles, many=True).data
+        )
+        self.assertEqual(
+            set(articles.values_list('artid', flat=True)),
+            {'3290-bk-g', '3290-bk-l', '3290-bk-x',
+             '3290-br-g', '3290-br-l', '3290-br-x'}
+        )
+        self.assertEqual(
+            set(articles.values_list('mcategory', 'price')),
+            {('gents', 299), ('ladies', 299), ('giants', 299)}
+        )
+        self.assertEqual(self.article.items.filter(catalog__isnull=False)
+                         .count(), 6)
+
+    def test_bulk_create_reports_conflicts(self):
+        """Test existing, duplicated variants are reported per row"""
+        samples.article_info(user=self.user, article=self.article,
+                             color=self.color_1, category='g')
+        payload = {
+            'article': self.article.id,
+            'variants': [
+                {'color': self.color_1.id, 'category': 'g', 'price': '250'},
+                {'color': self.color_2.id, 'category': 'g', 'price': '250'},
+                {'color': self.color_2.id, 'category': 'g', 'price': '260'},
+            ],
+        }
+
+        res = self.client.post(ARTICLE_INFO_BULK_URL, payload, format='json')
+        conflicts = {
+            (row['artid'], row['detail']) for row in res.data['conflicts']
+        }
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['created']), 1)
+        self.assertEqual(res.data['created'][0]['artid'], '3290-br-g')
+        self.assertEqual(conflicts, {
+            ('3290-bk-g', 'Article info already exists.'),
+            ('3290-br-g', 'Duplicated in the request.'),
+        })
+
+    def test_bulk_create_all_conflicting(self):
+        """Test nothing created responds with bad request"""
+        samples.article_info(user=self.user, article=self.article,
+                             color=self.color_1, category='g')
+        payload = {
+            'article': self.article.id,
+            'colors': [self.color_1.id],
+            'categories': ['g'],
+        }
+
+        res = self.client.post(ARTICLE_INFO_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['conflicts']), 1)
+
+    def test_bulk_create_invalid(self):
+        """Test invalid colors, incomplete matrix fail"""
+        payload1 = {
+            'article': self.article.id,
+            'colors': [self.color_1.id, 9999],
+            'categories': ['g'],
+        }
+        payload2 = {'article': self.article.id, 'colors': [self.color_1.id]}
+        payload3 = {'article': self.article.id}
+
+        for payload in [payload1, payload2, payload3]:
+            res = self.client.post(ARTICLE_INFO_BULK_URL, payload,
+                                   format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ArticleInfo.objects.exists())
+
+    def test_bulk_create_constant_queries(self):
+        """Test the batch size does not change the query count"""
+        queries = []
+        for i, count in enumerate([1, 10]):
+            colors = [
+                samples.color(user=self.user, code=f'{i}{n}', name=f'{i}{n}')
+                for n in range(count)
+            ]
+            payload = {
+                'article': self.article.id,
+                'colors': [color.id for color in colors],
+                'categories': ['g', 'l', 'k'],
+            }
+            with CaptureQueriesContext(connection) as captured:
+                res = self.client.post(ARTICLE_INFO_BULK_URL, payload,
+                                       format='json')
+            queries.append(len(captured))
+
+            self.assertEqual(len(res.data['created']), count * 3)
+        self.assertEqual(queries[0], queries[1])
+
+    def test_bulk_create_integrity_error(self):
+        """Test rows created concurrently elsewhere fail with bad request"""
+        payload = {
+            'article': self.article.id,
+            'colors': [self.color_1.id],
+            'categories': ['g'],
+        }
+
+        with patch.object(ArticleInfo.objects, 'bulk_create',
+                          side_effect=IntegrityError):
+            res = self.client.post(ARTICLE_INFO_BULK_URL, payload,
+                                   format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ArticleInfo.objects.exists())
+
+    def test_user_bulk_create_forbidden(self):
+        """Test normal users can not create in bulk"""
+        user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(user)
+        payload = {
+            'article': self.article.id,
+            'colors': [self.color_1.id],
+            'categories': ['g'],
+        }
+
+        res = self.client.post(ARTICLE_INFO_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(ArticleInfo.objects.exists())
+
+
 class FilterArticleInfoApiTests(TestCase):
     """
     Test filtering on ArticleInfo model by:
@@ -288,12 +459,12 @@ class FilterArticleInfoApiTests(TestCase):
             {'artno': 'k6012, d4303'}
         )
 
-        self.assertNotIn(self.serializer1.data, res.data)
-        self.assertNotIn(self.serializer2.data, res.data)
-        self.assertNotIn(self.serializer3.data, res.data)
-        self.assertIn(self.serializer4.data, res.data)
-        self.assertIn(self.serializer5.data, res.data)
-        self.assertIn(self.serializer6.data, res.data)
+        self.assertNotIn(self.serializer1.data, res.data['results'])
+        self.assertNotIn(self.serializer2.data, res.data['results'])
+        self.assertNotIn(self.serializer3.data, res.data['results'])
+        self.assertIn(self.serializer4.data, res.data['results'])
+        self.assertIn(self.serializer5.data, res.data['results'])
+        self.assertIn(self.serializer6.data, res.data['results'])
 
     def test_filter_brand(self):
         """Test filter article by brand name"""
@@ -303,12 +474,12 @@ class FilterArticleInfoApiTests(TestCase):
             {'brand': 'pride,  debongo'}
         )
 
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertIn(self.serializer2.data, res.data)
-        self.assertIn(self.serializer3.data, res.data)
-        self.assertIn(self.serializer4.data, res.data)
-        self.assertNotIn(self.serializer5.data, res.data)
-        self.assertNotIn(self.serializer6.data, res.data)
+        self.assertIn(self.serializer1.data, res.data['results'])
+        self.assertIn(self.serializer2.data, res.data['results'])
+        self.assertIn(self.serializer3.data, res.data['results'])
+        self.assertIn(self.serializer4.data, res.data['results'])
+        self.assertNotIn(self.serializer5.data, res.data['results'])
+        self.assertNotIn(self.serializer6.data, res.data['results'])
 
     def test_filter_style(self):
         """Test filter article by style"""
@@ -318,12 +489,12 @@ class FilterArticleInfoApiTests(TestCase):
             {'style': 'sandal'}
         )
 
-        self.assertNotIn(self.serializer1.data, res.data)
-        self.assertNotIn(self.serializer2.data, res.data)
-        self.assertIn(self.serializer3.data, res.data)
-        self.assertNotIn(self.serializer4.data, res.data)
-        self.assertIn(self.serializer5.data, res.data)
-        self.assertIn(self.serializer6.data, res.data)
+        self.assertNotIn(self.serializer1.data, res.data['results'])
+        self.assertNotIn(self.serializer2.data, res.data['results'])
+        self.assertIn(self.serializer3.data, res.data['results'])
+        self.assertNotIn(self.serializer4.data, res.data['results'])
+        self.assertIn(self.serializer5.data, res.data['results'])
+        self.assertIn(self.serializer6.data, res.data['results'])
 
     def test_filter_color(self):
         """Test filter article by their color"""
@@ -333,12 +504,25 @@ class FilterArticleInfoApiTests(TestCase):
             {'color': 'blue'}
         )
 
-        self.assertNotIn(self.serializer1.data, res.data)
-        self.assertNotIn(self.serializer2.data, res.data)
-        self.assertIn(self.serializer3.data, res.data)
-        self.assertNotIn(self.serializer4.data, res.data)
-        self.assertIn(self.serializer5.data, res.data)
-        self.assertIn(self.serializer6.data, res.data)
+        self.assertNotIn(self.serializer1.data, res.data['results'])
+        self.assertNotIn(self.serializer2.data, res.data['results'])
+        self.assertIn(self.serializer3.data, res.data['results'])
+        self.assertNotIn(self.serializer4.data, res.data['results'])
+        self.assertIn(self.serializer5.data, res.data['results'])
+        self.assertIn(self.serializer6.data, res.data['results'])
+
+    def test_filter_color_any_order(self):
+        """Test color codes, names filter alike in any order"""
+        results = [
+            self.client.get(ARTICLE_INFO_URL, {'color': colors}).data[
+                'results']
+            for colors in ('bk,grey', 'grey,bk')
+        ]
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[0]), 2)
+        self.assertIn(self.serializer1.data, results[0])
+        self.assertIn(self.serializer4.data, results[0])
 
     def test_filter_category(self):
         """Test filter article by category"""
@@ -348,12 +532,12 @@ class FilterArticleInfoApiTests(TestCase):
             {'category': 'g, x '}
         )
 
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertIn(self.serializer2.data, res.data)
-        self.assertNotIn(self.serializer3.data, res.data)
-        self.assertIn(self.serializer4.data, res.data)
-        self.assertNotIn(self.serializer5.data, res.data)
-        self.assertNotIn(self.serializer6.data, res.data)
+        self.assertIn(self.serializer1.data, res.data['results'])
+        self.assertIn(self.serializer2.data, res.data['results'])
+        self.assertNotIn(self.serializer3.data, res.data['results'])
+        self.assertIn(self.serializer4.data, res.data['results'])
+        self.assertNotIn(self.serializer5.data, res.data['results'])
+        self.assertNotIn(self.serializer6.data, res.data['results'])
 
     def test_filter_isactive(self):
         """Test filter active articles"""
@@ -363,12 +547,12 @@ class FilterArticleInfoApiTests(TestCase):
             {'active': 'true'}
         )
 
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertNotIn(self.serializer2.data, res.data)
-        self.assertNotIn(self.serializer3.data, res.data)
-        self.assertIn(self.serializer4.data, res.data)
-        self.assertNotIn(self.serializer5.data, res.data)
-        self.assertNotIn(self.serializer6.data, res.data)
+        self.assertIn(self.serializer1.data, res.data['results'])
+        self.assertNotIn(self.serializer2.data, res.data['results'])
+        self.assertNotIn(self.serializer3.data, res.data['results'])
+        self.assertIn(self.serializer4.data, res.data['results'])
+        self.assertNotIn(self.serializer5.data, res.data['results'])
+        self.assertNotIn(self.serializer6.data, res.data['results'])
 
     def test_filter_isexport(self):
         """
@@ -381,12 +565,12 @@ class FilterArticleInfoApiTests(TestCase):
             {'export': 'False'}
         )
 
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertNotIn(self.serializer2.data, res.data)
-        self.assertIn(self.serializer3.data, res.data)
-        self.assertNotIn(self.serializer4.data, res.data)
-        self.assertIn(self.serializer5.data, res.data)
-        self.assertIn(self.serializer6.data, res.data)
+        self.assertIn(self.serializer1.data, res.data['results'])
+        self.assertNotIn(self.serializer2.data, res.data['results'])
+        self.assertIn(self.serializer3.data, res.data['results'])
+        self.assertNotIn(self.serializer4.data, res.data['results'])
+        self.assertIn(self.serializer5.data, res.data['results'])
+        self.assertIn(self.serializer6.data, res.data['results'])
 
     def test_filter_invalid_boolean(self):
         """
@@ -414,3 +598,176 @@ class FilterArticleInfoApiTests(TestCase):
         self.assertEqual(res2.status_code, status.HTTP_200_OK)
         self.assertEqual(res3.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(res4.status_code, status.HTTP_200_OK)
+
+
+class PaginateArticleInfoApiTests(TestCase):
+    """Test cursor pagination of the article-info list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        article = samples.article(user=self.user)
+        for code, name in [('bk', 'black'), ('br', 'brown'), ('gy', 'grey')]:
+            color = samples.color(user=self.user, code=code, name=name)
+            for category in ['g', 'l']:
+                samples.article_info(user=self.user, article=article,
+                                     color=color, category=category,
+                                     active=category == 'g')
+
+    def test_follow_cursor_pages(self):
+        """Test following the next cursor returns every row once"""
+        res = self.client.get(ARTICLE_INFO_URL, {'page_size': 4})
+        ids = [item['id'] for item in res.data['results']]
+
+        self.assertEqual(len(ids), 4)
+        self.assertIsNone(res.data['previous'])
+
+        res = self.client.get(res.data['next'])
+        ids += [item['id'] for item in res.data['results']]
+
+        self.assertIsNone(res.data['next'])
+        self.assertEqual(
+            ids, list(ArticleInfo.objects.order_by('id').values_list(
+                'id', flat=True))
+        )
+
+    def test_page_size_capped(self):
+        """Test the requested page size is capped by the server"""
+        with patch.object(KeysetPagination, 'max_page_size', 5):
+            res = self.client.get(ARTICLE_INFO_URL, {'page_size': 100000})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 5)
+
+    def test_paginate_filtered(self):
+        """Test cursor pages keep the query param filters"""
+        res = self.client.get(ARTICLE_INFO_URL,
+                              {'active': 'true', 'page_size': 2})
+
+        self.assertIn('active=true', res.data['next'])
+
+        res = self.client.get(res.data['next'])
+        results = res.data['results']
+
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0]['active'])
+        self.assertIsNone(res.data['next'])
+
+
+class ExportArticleInfoApiTests(TestCase):
+    """Test streaming export of the article-info rows"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        article = samples.article(user=self.user)
+        for code, name in [('bk', 'black'), ('br', 'brown')]:
+            color = samples.color(user=self.user, code=code, name=name)
+            for category in ['g', 'l']:
+                samples.article_info(user=self.user, article=article,
+                                     color=color, category=category,
+                                     active=category == 'g')
+
+    def test_export_csv(self):
+        """Test exporting article infos as csv, flattened"""
+        res = self.client.get(ARTICLE_INFO_EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        self.assertIn('articleinfo.csv', res['Content-Disposition'])
+
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines()))
+        infos = ArticleInfo.objects.order_by('pk')
+
+        self.assertEqual([row['artid'] for row in rows],
+                         [info.artid for info in infos])
+        self.assertEqual(rows[0]['artno'], infos[0].article.artno)
+        self.assertEqual(rows[0]['color'], infos[0].color.name)
+
+    def test_export_ndjson_filtered(self):
+        """Test exporting as ndjson keeps the list filters"""
+        res = self.client.get(ARTICLE_INFO_EXPORT_URL,
+                              {'output': 'ndjson', 'active': 'true'})
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(all(row['active'] for row in rows))
+        self.assertEqual({row['color'] for row in rows}, {'black', 'brown'})
+
+    def test_export_invalid_output(self):
+        """Test an unknown output format is a bad request"""
+        res = self.client.get(ARTICLE_INFO_EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_constant_queries(self):
+        """Test the export does not query per row"""
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(ARTICLE_INFO_EXPORT_URL)
+            b''.join(res.streaming_content)
+
+        self.assertEqual(len(context), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Needs concurrent transactions')
+class ConcurrentBulkArticleinfoApiTests(TransactionTestCase):
+    """Test concurrent bulk creates of an article"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='staff@kalalokia.xyz',
+            password='staffpass',
+            is_staff=True
+        )
+        self.article = samples.article(user=self.user)
+        self.color = samples.color(user=self.user)
+
+    def test_bulk_create_concurrent(self):
+        """Test the later of two same bulk creates reports conflicts"""
+        payload = {
+            'article': self.article.id,
+            'colors': [self.color.id],
+            'categories': ['g', 'l'],
+        }
+        barrier = threading.Barrier(2)
+        responses = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                res = client.post(ARTICLE_INFO_BULK_URL, payload,
+                                  format='json')
+                responses.append(res)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        created, rejected = sorted(responses, key=lambda res: res.status_code)
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(rejected.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(rejected.data['conflicts']), 2)
+        self.assertEqual(ArticleInfo.objects.count(), 2)
@@ -9,7 +9,7 @@ from django.contrib.auth import get_user_model
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import ArticleInfo
+from core.models import ArticleInfo, ArticleCatalog
 
 from article.serializers import ArticlePublicSerializer
 
@@ -52,5 +52,66 @@ class PublicArticleinfoApiTests(TestCase):
 
         serializer = ArticlePublicSerializer(articles, many=True)
 
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
         self.assertEqual(list(serializer.data[0].keys()), data)
+
+
+class ArticleCatalogSyncTests(TestCase):
+    """Test the public catalog follows writes on the source models"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.article = samples.article(user=self.user)
+        self.color = samples.color(user=self.user)
+        self.articleinfo = samples.article_info(
+            user=self.user, article=self.article, color=self.color
+        )
+
+    def assertCatalogMatches(self):
+        """Public listing equals the serialized source models"""
+        res = self.client.get(ARTICLE_PUBLIC_URL)
+        serializer = ArticlePublicSerializer(
+            ArticleInfo.objects.all(), many=True
+        )
+
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_create_articleinfo_adds_catalog(self):
+        """Test creating article info adds a catalog row"""
+        self.assertTrue(
+            ArticleCatalog.objects.filter(pk=self.articleinfo.pk).exists()
+        )
+        self.assertCatalogMatches()
+
+    def test_update_articleinfo_updates_catalog(self):
+        """Test price, active changes reach the catalog"""
+        self.articleinfo.price = 310
+        self.articleinfo.active = False
+        self.articleinfo.save()
+
+        self.assertCatalogMatches()
+
+    def test_rename_article_updates_catalog(self):
+        """Test changed artno reaches the catalog"""
+        self.article.artno = '3291'
+        self.article.save()
+
+        self.assertCatalogMatches()
+
+    def test_rename_color_updates_catalog(self):
+        """Test changed color name reaches the catalog"""
+        self.color.name = 'jet black'
+        self.color.save()
+
+        self.assertCatalogMatches()
+
+    def test_delete_articleinfo_removes_catalog(self):
+        """Test deleting the article removes its catalog rows"""
+        self.article.delete()
+
+        self.assertFalse(ArticleCatalog.objects.exists())
+        self.assertCatalogMatches()
@@ -9,14 +9,21 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Color
+from core.models import Color, ArticleInfo
 
 from article.serializers import ColorSerializer
 
+from . import samples
+
 
 COLOR_URL = reverse('article:color-list')
 
 
+def detail_url(color_id):
+    """Returns the detailed view of a color"""
+    return reverse('article:color-detail', args=[color_id])
+
+
 class PublicColorTests(TestCase):
     """Test the publically available colors api"""
 
@@ -73,7 +80,7 @@ class ProtectedColorApiTests(TestCase):
         serializer = ColorSerializer(colors, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_create_color_success(self):
         """Test that creating a color is successful"""
@@ -93,3 +100,24 @@ class ProtectedColorApiTests(TestCase):
         res = self.client.post(COLOR_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_code_regenerates_artids(self):
+        """Test changing the color code rewrites artid of its variants"""
+        color = samples.color(user=self.user)
+        other = samples.color(user=self.user, code='br', name='brown')
+        for artno in ['3290', '3780']:
+            article = samples.article(user=self.user, artno=artno)
+            samples.article_info(user=self.user, article=article,
+                                 color=color)
+            samples.article_info(user=self.user, article=article,
+                                 color=other)
+
+        res = self.client.patch(detail_url(color.id), {'code': 'bl'})
+        artids = ArticleInfo.objects.order_by('artid').values_list(
+            'artid', flat=True)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(artids),
+            ['3290-bl-g', '3290-br-g', '3780-bl-g', '3780-br-g']
+        )
@@ -0,0 +1,103 @@
+"""
+Query budgets of the article api endpoints.
+Each list must cost the same number of queries whatever the row count.
+Responses include the change version query of the cache and ETags.
+"""
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Article, ArticleInfo
+from core.testing import QueryBudgetMixin
+
+from . import samples
+
+
+ARTICLE_URL = reverse('article:article-list')
+ARTICLE_INFO_URL = reverse('article:articleinfo-list')
+ARTICLE_PUBLIC_URL = reverse('article:article-minimal-list')
+
+
+def article_detail_url(article_id):
+    """Return the detail url of an article"""
+    return reverse('article:article-detail', args=[article_id])
+
+
+def articleinfo_detail_url(articleinfo_id):
+    """Return the detail url of an article info"""
+    return reverse('article:articleinfo-detail', args=[articleinfo_id])
+
+
+class ArticleQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Test article endpoints stay within their query budgets"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.colors = [
+            samples.color(user=self.user, code=f'c{i}', name=f'color{i}')
+            for i in range(5)
+        ]
+
+    def create_articles(self, count, start=0):
+        """Create articles, each with a variant for every color"""
+        for number in range(start, start + count):
+            article = samples.article(user=self.user, artno=f'{number}')
+            for color in self.colors:
+                samples.article_info(user=self.user, article=article,
+                                     color=color)
+
+    def assertListBudget(self, url, budget):
+        """Listing costs no more than the budget for growing row counts"""
+        for start, count in [(0, 1), (1, 10)]:
+            self.create_articles(count, start=start)
+            with self.assertQueryBudget(budget):
+                res = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(res.data['results'])
+
+    def test_article_list_budget(self):
+        """Test listing articles with their items costs three queries"""
+        self.assertListBudget(ARTICLE_URL, 3)
+
+    def test_articleinfo_list_budget(self):
+        """Test listing article infos costs two queries"""
+        self.assertListBudget(ARTICLE_INFO_URL, 2)
+
+    def test_public_list_budget(self):
+        """Test listing the public catalog costs two queries"""
+        self.assertListBudget(ARTICLE_PUBLIC_URL, 2)
+
+    def test_article_retrieve_budget(self):
+        """Test article detail with nested variants costs three queries"""
+        for count in [1, 5]:
+            self.colors += [
+                samples.color(user=self.user, code=f'{i:02d}', name=f'new{i}')
+                for i in range(len(self.colors), len(self.colors) + count)
+            ]
+            self.create_articles(1, start=count)
+            article = Article.objects.get(artno=f'{count}')
+
+            with self.assertQueryBudget(3):
+                res = self.client.get(article_detail_url(article.id))
+
+            self.assertEqual(len(res.data['items']), len(self.colors))
+
+    def test_articleinfo_retrieve_budget(self):
+        """Test article info detail costs two queries"""
+        self.create_articles(1)
+        articleinfo = ArticleInfo.objects.first()
+
+        with self.assertQueryBudget(2):
+            res = self.client.get(articleinfo_detail_url(articleinfo.id))
+
+        self.assertEqual(res.data['article'], articleinfo.article.artno)
+        self.assertEqual(res.data['color'], articleinfo.color.name)
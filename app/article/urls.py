@@ -6,6 +6,8 @@ main url: host/api/article/
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from core.asyncviews import async_routes
+
 from article import views
 
 
@@ -21,3 +23,9 @@ app_name = 'article'
 urlpatterns = [
     path('', include(router.urls))
 ]
+
+# Read heavy routes served by async views in the ASGI deployment
+ASYNC_ROUTES = ('article-minimal-list', 'articleinfo-list',
+                'articleinfo-detail')
+
+async_urlpatterns = async_routes(urlpatterns, ASYNC_ROUTES)
@@ -1,39 +1,53 @@
 """
 Viewpoint of the api/article
 """
-from rest_framework import viewsets, mixins
-from rest_framework.authentication import TokenAuthentication
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 
+from django.db.models import Q
 from django.http import Http404
 
-from core.models import Color, Article, ArticleInfo, categorize
+from core.authentication import CachedTokenAuthentication
+from core.mixins import QueryPlanMixin, CachedListMixin, \
+                        ConditionalGetMixin, FastListMixin, ExportMixin, \
+                        ReplicaReadMixin, ProtectedDestroyMixin
+from core.models import Color, Article, ArticleInfo, ArticleCatalog, \
+                        categorize
 
 from article import serializers
 
 
-class ColorViewSet(viewsets.ModelViewSet):
+class ColorViewSet(ProtectedDestroyMixin, QueryPlanMixin,
+                   viewsets.ModelViewSet):
     """Manage colors in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAdminUser,)
     queryset = Color.objects.all()
     serializer_class = serializers.ColorSerializer
+    ordering = '-name'
 
     def get_queryset(self):
         """Overriding get queryset to order by name"""
-        return self.queryset.order_by('-name')
+        return self.queryset.order_by(self.ordering)
 
     def perform_create(self, serializer):
         """Create a new color"""
         serializer.save(user=self.request.user)
 
 
-class ArticleViewSet(viewsets.ModelViewSet):
+class ArticleViewSet(ConditionalGetMixin, CachedListMixin, ReplicaReadMixin,
+                     ProtectedDestroyMixin, QueryPlanMixin,
+                     viewsets.ModelViewSet):
     """Manage articles in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     # permission_classes = (IsAuthenticated,)
     queryset = Article.objects.all()
     serializer_class = serializers.ArticleSerializer
+    ordering = '-id'
+    cache_models = (Article, ArticleInfo, Color)
+    list_params = ('brand', 'style', 'color', 'category')
 
     def _params_to_list(self, qs):
         """
@@ -73,8 +87,11 @@ class ArticleViewSet(viewsets.ModelViewSet):
         if cateogories:
             mcategory = self._params_to_list(cateogories)
             queryset = queryset.filter(items__mcategory__in=mcategory)
+        if colors or cateogories:
+            # Joining on items repeats an article once per matching item
+            queryset = queryset.distinct()
 
-        return queryset.order_by('-id')
+        return queryset.order_by(self.ordering)
 
     def perform_create(self, serializer):
         """Create a new article"""
@@ -88,11 +105,24 @@ class ArticleViewSet(viewsets.ModelViewSet):
         return self.serializer_class
 
 
-class ArticleInfoViewSet(viewsets.ModelViewSet):
+class ArticleInfoViewSet(ConditionalGetMixin, CachedListMixin,
+                         ReplicaReadMixin, FastListMixin, ExportMixin,
+                         ProtectedDestroyMixin, QueryPlanMixin,
+                         viewsets.ModelViewSet):
     """Manage article info in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     queryset = ArticleInfo.objects.all()
     serializer_class = serializers.ArticleInfoSerializer
+    ordering = 'id'
+    cache_models = (ArticleInfo, Article, Color)
+    list_params = ('artno', 'brand', 'style', 'color', 'category')
+    export_fields = (
+        ('artid', 'artid'), ('artno', 'article__artno'),
+        ('brand', 'article__brand'), ('style', 'article__style'),
+        ('color', 'color__name'), ('category', 'category'),
+        ('mcategory', 'mcategory'), ('price', 'price'), ('basic', 'basic'),
+        ('active', 'active'), ('export', 'export'),
+    )
 
     def _params_to_list(self, qs):
         """
@@ -119,7 +149,7 @@ class ArticleInfoViewSet(viewsets.ModelViewSet):
         """
         Setting permissions for the List, Retrieve, Create & Update
         """
-        if self.action == 'list' or self.action == 'retrieve':
+        if self.action in ('list', 'retrieve', 'export'):
             permission_classes = [IsAuthenticated, ]
         else:
             permission_classes = [IsAdminUser, ]
@@ -150,11 +180,14 @@ class ArticleInfoViewSet(viewsets.ModelViewSet):
             style = self._params_to_list(styles)
             queryset = queryset.filter(article__style__in=style)
         if colors:
+            # Codes are 2 characters, longer values are names
             color = self._params_to_list(colors)
-            if len(color[0]) == 2:
-                queryset = queryset.filter(color__code__in=color)
-            else:
-                queryset = queryset.filter(color__name__in=color)
+            queryset = queryset.filter(
+                Q(color__code__in=[value for value in color
+                                   if len(value) == 2])
+                | Q(color__name__in=[value for value in color
+                                     if len(value) != 2])
+            )
         if categories:
             category = self._params_to_list(categories)
             queryset = queryset.filter(category__in=category)
@@ -185,16 +218,39 @@ class ArticleInfoViewSet(viewsets.ModelViewSet):
             mcategory=categorize(value=catgry)
         )
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create the variants of an article in one transaction.
+        Conflicting rows are skipped and reported in the response.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+
+        if serializer.instance['created']:
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.data, status=status.HTTP_400_BAD_REQUEST)
+
     def get_serializer_class(self):
         """Return appropriate serializer class"""
         if self.action == 'retrieve':
             return serializers.ArticleInfoDetailSerializer
+        if self.action == 'bulk':
+            return serializers.ArticleInfoBulkSerializer
 
         return self.serializer_class
 
 
-class ArticlePublicViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
-    """Manage article info in the database"""
+class ArticlePublicViewSet(ConditionalGetMixin, CachedListMixin,
+                           ReplicaReadMixin, FastListMixin, QueryPlanMixin,
+                           viewsets.GenericViewSet, mixins.ListModelMixin):
+    """
+    Public listing of article infos.
+    Served from the denormalized catalog, a single scan on its primary key.
+    """
     permission_classes = (AllowAny, )
-    queryset = ArticleInfo.objects.all()
-    serializer_class = serializers.ArticlePublicSerializer
+    queryset = ArticleCatalog.objects.order_by('pk')
+    serializer_class = serializers.ArticleCatalogSerializer
+    ordering = 'pk'
+    cache_models = (ArticleInfo, Article, Color)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class BomConfig(AppConfig):
     name = 'bom'
+
+    def ready(self):
+        from bom import signals  # noqa: F401
@@ -0,0 +1,178 @@
+"""
+Costing engine rolling material prices up into ArticleInfo.basic.
+Costs of the whole catalog are computed by one set based query,
+the database aggregates over every bom line in a single pass.
+"""
+import time
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import connection, transaction
+
+from core.models import ArticleInfo, Bom, BomLine, Material, CostChange, \
+                        ChangeVersion
+
+from bom.queries import MAX_DEPTH, BomDepthError, to_decimal, \
+                        affected_articleinfos, update_column, price_source
+
+
+BASIC_PLACES = Decimal('0.01')
+# Largest basic storable by ArticleInfo.basic
+BASIC_LIMIT = Decimal('9999.99')
+# Article infos costed per query, when costing given ids
+CHUNK_SIZE = 500
+
+# Material price is per purchase uom, cf converts it to the consumption uom.
+# A material without conversion factor (cf=0) is left out of the cost.
+# Lines of materials without a price (none yet as of an instant) are
+# counted, the cost of their root is unknown. The explosion walks a level
+# past MAX_DEPTH, roots reaching it are nested too deep to be costed.
+COST_SQL = """
+WITH RECURSIVE explosion (root_id, bom_id, quantity, depth) AS (
+    SELECT bom.id, bom.id, CAST(1 AS NUMERIC), 0
+    FROM {bom} bom
+    WHERE bom.articleinfo_id IS NOT NULL {roots}
+    UNION ALL
+    SELECT explosion.root_id, line.component_id,
+           explosion.quantity * line.quantity, explosion.depth + 1
+    FROM {line} line
+    JOIN explosion ON line.bom_id = explosion.bom_id
+    WHERE line.component_id IS NOT NULL AND explosion.depth <= %s
+),
+depths (root_id, depth) AS (
+    SELECT root_id, MAX(depth) FROM explosion GROUP BY root_id
+)
+SELECT info.id, info.basic,
+       SUM(explosion.quantity * line.quantity * {price}
+           / NULLIF(material.cf, 0)),
+       COUNT(*) - COUNT({price}), depths.depth
+FROM explosion
+JOIN depths ON depths.root_id = explosion.root_id
+JOIN {bom} root ON root.id = explosion.root_id
+JOIN {info} info ON info.id = root.articleinfo_id
+JOIN {line} line ON line.bom_id = explosion.bom_id
+JOIN {material} material ON material.id = line.material_id
+{prices}
+GROUP BY info.id, info.basic, depths.depth
+"""
+
+
+def _cost_rows(articleinfo_ids=None, as_of=None):
+    """
+    Rows of the article info id, its current basic, rounded cost and
+    whether its bom is nested deeper than MAX_DEPTH, at the prices as of
+    as_of when given. The cost is None when any of its materials had no
+    price then, or its bom is nested too deep. Costs every article info
+    having a bom by a single query, given articleinfo_ids are costed
+    CHUNK_SIZE per query.
+    """
+    price, prices, price_params = price_source(as_of)
+    tables = {
+        'bom': Bom._meta.db_table,
+        'line': BomLine._meta.db_table,
+        'material': Material._meta.db_table,
+        'info': ArticleInfo._meta.db_table,
+        'price': price,
+        'prices': prices,
+    }
+    if articleinfo_ids is None:
+        chunks = [[]]
+        tables['roots'] = ''
+    else:
+        ids = sorted(set(articleinfo_ids))
+        chunks = [ids[i:i + CHUNK_SIZE]
+                  for i in range(0, len(ids), CHUNK_SIZE)]
+
+    with connection.cursor() as cursor:
+        for chunk in chunks:
+            if articleinfo_ids is not None:
+                tables['roots'] = 'AND bom.articleinfo_id IN ({})'.format(
+                    ', '.join(['%s'] * len(chunk))
+                )
+            cursor.execute(COST_SQL.format(**tables),
+                           chunk + [MAX_DEPTH] + price_params)
+            for pk, basic, cost, missing, depth in cursor.fetchall():
+                deep = depth > MAX_DEPTH
+                if missing or deep:
+                    yield pk, to_decimal(basic), None, deep
+                    continue
+                yield pk, to_decimal(basic), to_decimal(cost or 0).quantize(
+                    BASIC_PLACES, rounding=ROUND_HALF_UP
+                ), False
+
+
+def compute_costs(articleinfo_ids=None, as_of=None):
+    """
+    Cost per pair of the article infos having a bom, rounded like basic.
+    Restricted to articleinfo_ids when given, at the prices as of as_of
+    when given. None for the article infos using materials not priced
+    yet as of as_of, their cost is not known. Raises BomDepthError for
+    boms nested deeper than MAX_DEPTH.
+    """
+    costs, deep = {}, []
+    for pk, _, cost, too_deep in _cost_rows(articleinfo_ids, as_of):
+        costs[pk] = cost
+        if too_deep:
+            deep.append(pk)
+    if deep:
+        raise BomDepthError(
+            f"Boms of article infos {deep} are nested deeper than "
+            f"{MAX_DEPTH} levels."
+        )
+    return costs
+
+
+def recost(articleinfo_ids=None, batch_size=1000, materials=None,
+           record=False):
+    """
+    Write the computed costs to ArticleInfo.basic by a bulk update of the
+    rows whose basic changed. With record, each change is logged as a
+    CostChange, caused by the material of the article info in the
+    materials dict, if given. Returns a report of the
+    rows costed, changed, skipped (cost unknown, too large for basic or
+    bom nested deeper than MAX_DEPTH) and the duration.
+    """
+    start = time.perf_counter()
+    costed = 0
+    changed = []
+    skipped = []
+
+    with transaction.atomic():
+        for pk, basic, cost, _ in _cost_rows(articleinfo_ids):
+            costed += 1
+            if cost is None or cost > BASIC_LIMIT:
+                skipped.append(pk)
+            elif cost != basic:
+                changed.append(CostChange(
+                    articleinfo_id=pk, material_id=(materials or {}).get(pk),
+                    old_basic=basic, new_basic=cost
+                ))
+
+        if changed:
+            update_column(ArticleInfo, 'basic',
+                          [(change.articleinfo_id, change.new_basic)
+                           for change in changed], batch_size)
+            if record:
+                CostChange.objects.bulk_create(changed,
+                                               batch_size=batch_size)
+            ChangeVersion.objects.touch(ArticleInfo)
+
+    return {
+        'costed': costed,
+        'changed': len(changed),
+        'skipped': skipped,
+        'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def propagate(material_ids):
+    """
+    Recost only the article infos using the materials, after a change
+    of their price or cf, recording the changes. A change is recorded
+    with its material when the article info uses only one of them,
+    without when several changed together.
+    """
+    affected = affected_articleinfos(material_ids)
+    materials = {pk: next(iter(used)) for pk, used in affected.items()
+                 if len(used) == 1}
+    return recost(list(affected), materials=materials, record=True)
@@ -0,0 +1,257 @@
+"""
+Bulk import of the material master from supplier CSV files.
+The file is read as a stream and upserted on code chunk by chunk,
+each chunk in a transaction of its own.
+"""
+import csv
+import time
+
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+
+from core.models import Material, MaterialPrice, ChangeVersion
+
+from bom import costing, uom
+from bom.queries import update_column
+
+
+FIELDS = ('code', 'name', 'category', 'subcategory', 'uom', 'purchaseuom',
+          'cf', 'price', 'active')
+# Fields matched case insensitively against their choices
+LOWERED = ('category', 'uom', 'purchaseuom')
+BOOLEANS = {'true': True, 't': True, '1': True, 'yes': True,
+            'false': False, 'f': False, '0': False, 'no': False}
+CHUNK_SIZE = 500
+
+
+class ImportFileError(Exception):
+    """Raised for a file which can not be imported at all"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def read_header(reader):
+    """
+    Fields of the csv header. Code is required, other columns are optional,
+    materials keep their values of the columns left out.
+    """
+    header = [column.strip().lower() for column in next(reader, [])]
+    errors = []
+    if 'code' not in header:
+        errors.append('The header has no code column.')
+    unknown = [column for column in header if column not in FIELDS]
+    if unknown:
+        errors.append(f"Unknown columns: {', '.join(unknown)}.")
+    if len(set(header)) != len(header):
+        errors.append('The header repeats a column.')
+    if errors:
+        raise ImportFileError(errors)
+    return header
+
+
+def _cleaner(field):
+    """
+    Function validating and converting a csv cell of the field, by the
+    limits of the model field. Raises ValidationError.
+    """
+    model_field = Material._meta.get_field(field)
+
+    if field == 'active':
+        def clean(raw):
+            if raw.lower() not in BOOLEANS:
+                raise ValidationError('Expected true or false.')
+            return BOOLEANS[raw.lower()]
+        return clean
+
+    if isinstance(model_field, models.DecimalField):
+        places = Decimal(10) ** -model_field.decimal_places
+        limit = 10 ** (model_field.max_digits - model_field.decimal_places)
+
+        def clean(raw):
+            try:
+                value = Decimal(raw)
+                scaled = value.quantize(places)
+            except InvalidOperation:
+                raise ValidationError('Enter a number.')
+            if scaled != value:
+                raise ValidationError(
+                    f'Ensure that there are no more than '
+                    f'{model_field.decimal_places} decimal places.'
+                )
+            if abs(scaled) >= limit:
+                raise ValidationError(f'Ensure that it is less than {limit}.')
+            return scaled
+        return clean
+
+    choices = {value for value, _ in model_field.flatchoices}
+    lowered = field in LOWERED
+
+    def clean(raw):
+        if lowered:
+            raw = raw.lower()
+        if choices and raw not in choices:
+            raise ValidationError(f'Use one of {", ".join(sorted(choices))}.')
+        if len(raw) > model_field.max_length:
+            raise ValidationError(f'Ensure it has at most '
+                                  f'{model_field.max_length} characters.')
+        return raw
+    return clean
+
+
+def clean_row(cleaners, row):
+    """
+    Values of a csv row by field, cleaned by the cleaners of the header
+    columns. Empty cells are left out. Raises ValidationError.
+    """
+    values = {}
+    errors = []
+    for (field, clean), raw in zip(cleaners, row):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            values[field] = clean(raw)
+        except ValidationError as error:
+            errors.append(f"{field}: {' '.join(error.messages)}")
+    if errors:
+        raise ValidationError(errors)
+    if 'code' not in values:
+        raise ValidationError(['code: This field cannot be blank.'])
+    return values
+
+
+def import_materials(stream, dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Upsert the materials of a csv text stream on code. Invalid rows are
+    skipped and reported by line, with dry_run nothing is written and the
+    report has a diff of the new and changed materials. New materials
+    without cf get the standard one of their uoms. Materials whose price
+    or cf changed have their article infos recosted in the transaction
+    of their chunk.
+    Raises ImportFileError for an unusable header.
+    """
+    start = time.perf_counter()
+    reader = csv.reader(stream)
+    header = read_header(reader)
+    cleaners = [(field, _cleaner(field)) for field in header]
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'recosted': 0,
+              'errors': []}
+    if dry_run:
+        report['diff'] = {'new': [], 'changed': []}
+    seen = set()
+    chunk = []
+
+    def flush():
+        _upsert(chunk, dry_run, report)
+        chunk.clear()
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        line = reader.line_num
+        if len(row) > len(header):
+            report['errors'].append(f'Line {line}: too many columns.')
+            continue
+        try:
+            values = clean_row(cleaners, row)
+        except ValidationError as error:
+            report['errors'].append(
+                f"Line {line}: {' '.join(error.messages)}"
+            )
+            continue
+        if values['code'] in seen:
+            report['errors'].append(
+                f"Line {line}: code {values['code']} is repeated."
+            )
+            continue
+        seen.add(values['code'])
+        chunk.append((line, values))
+        if len(chunk) == chunk_size:
+            flush()
+    flush()
+
+    report['duration_ms'] = round((time.perf_counter() - start) * 1000)
+    return report
+
+
+def _upsert(chunk, dry_run, report):
+    """
+    Create and update the materials of a chunk of (line, values),
+    appending new prices to the price history, and recost the article
+    infos of the materials whose price or cf changed.
+    """
+    if not chunk:
+        return
+    existing = Material.objects.in_bulk(
+        [values['code'] for _, values in chunk], field_name='code'
+    )
+    created = []
+    updated = {}
+    recosted = []
+
+    for line, values in chunk:
+        material = existing.get(values['code'])
+        if material is None:
+            if 'name' not in values:
+                report['errors'].append(
+                    f'Line {line}: name is required for a new material.'
+                )
+                continue
+            if 'cf' not in values:
+                cf = uom.default_cf(values.get('uom'),
+                                    values.get('purchaseuom'))
+                if cf is not None:
+                    values['cf'] = cf
+            created.append(Material(**values))
+            if dry_run:
+                report['diff']['new'].append(values)
+            continue
+
+        changes = {
+            field: value for field, value in values.items()
+            if getattr(material, field) != value
+        }
+        if not changes:
+            report['unchanged'] += 1
+            continue
+        if dry_run:
+            report['diff']['changed'].append({
+                'code': material.code,
+                'fields': {
+                    field: {'old': getattr(material, field), 'new': value}
+                    for field, value in changes.items()
+                },
+            })
+        # A bulk update per field, of the materials changing it
+        for field, value in changes.items():
+            updated.setdefault(field, []).append((material.id, value))
+        report['updated'] += 1
+        if 'price' in changes or 'cf' in changes:
+            recosted.append(material.id)
+
+    report['created'] += len(created)
+    if dry_run or not (created or updated):
+        return
+
+    with transaction.atomic():
+        Material.objects.bulk_create(created)
+        for field, values in updated.items():
+            update_column(Material, field, values)
+        prices = updated.get('price', []) + list(
+            Material.objects.filter(
+                code__in=[material.code for material in created]
+            ).values_list('id', 'price')
+        )
+        now = timezone.now()
+        MaterialPrice.objects.bulk_create(
+            MaterialPrice(material_id=pk, price=price, effective_from=now)
+            for pk, price in prices
+        )
+        ChangeVersion.objects.touch(Material)
+        if recosted:
+            report['recosted'] += costing.propagate(recosted)['changed']
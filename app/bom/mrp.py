@@ -0,0 +1,78 @@
+"""
+Material requirements planning: gross material requirement of a
+production plan of artid -> pairs, in purchase uom and costed.
+"""
+from decimal import Decimal, InvalidOperation
+
+from core.models import Bom
+
+from bom import uom
+from bom.queries import CHUNK_SIZE, explode_many
+
+
+class PlanError(Exception):
+    """Raised for a production plan which can not be planned"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def parse_plan(lines):
+    """
+    Sum the pairs of (artid, pairs) plan lines per artid.
+    Raises PlanError listing the invalid lines.
+    """
+    plan = {}
+    errors = []
+
+    for number, (artid, pairs) in enumerate(lines, 1):
+        artid = str(artid).strip()
+        try:
+            pairs = Decimal(str(pairs).strip())
+        except InvalidOperation:
+            pairs = None
+        if not artid or pairs is None or not pairs.is_finite() or pairs <= 0:
+            errors.append(f'Line {number}: expected an artid and '
+                          f'positive pairs.')
+            continue
+        plan[artid] = plan.get(artid, 0) + pairs
+
+    if errors:
+        raise PlanError(errors)
+    if not plan:
+        raise PlanError(['The plan has no lines.'])
+    return plan
+
+
+def requirements(plan, as_of=None):
+    """
+    Material requirement of a plan of artid: pairs, exploded through
+    the boms of the article infos. Quantities in the consumption uom
+    are converted to the purchase uom by cf, and costed at price, each
+    rounded once (see bom.uom). Prices are the ones as of as_of if given.
+    Raises PlanError listing the artids without a bom.
+    """
+    artids = sorted(plan)
+    boms = {}
+    for i in range(0, len(artids), CHUNK_SIZE):
+        boms.update(Bom.objects.filter(
+            articleinfo__artid__in=artids[i:i + CHUNK_SIZE]
+        ).values_list('articleinfo__artid', 'id'))
+
+    missing = [artid for artid in artids if artid not in boms]
+    if missing:
+        raise PlanError([f'No bom for artid {artid}.' for artid in missing])
+
+    rows = explode_many({boms[artid]: plan[artid] for artid in artids},
+                        as_of)
+    purchase_quantities, costs = uom.purchase(
+        [row['quantity'] for row in rows], [row['cf'] for row in rows],
+        [row['price'] for row in rows]
+    )
+    for row, purchase_quantity, cost in zip(rows, purchase_quantities,
+                                            costs):
+        row['purchase_quantity'] = purchase_quantity
+        row['cost'] = cost
+
+    return rows
@@ -0,0 +1,341 @@
+"""
+Set based queries walking the bom graph with recursive CTEs.
+A whole explosion costs a single query, whatever the depth of the bom.
+Also the raw bulk column update shared by the costing and the imports.
+"""
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import BooleanField, DecimalField
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.models import Bom, BomLine, Material, MaterialPrice, BOM_MAX_DEPTH
+
+
+# Deepest sub assembly nesting walked, guards against cyclic boms
+MAX_DEPTH = BOM_MAX_DEPTH
+
+
+class BomDepthError(Exception):
+    """Raised for boms nested deeper than MAX_DEPTH, ie. cyclic boms"""
+
+
+def _tables():
+    """Table names used by the raw queries"""
+    return {
+        'bom': Bom._meta.db_table,
+        'line': BomLine._meta.db_table,
+        'material': Material._meta.db_table,
+    }
+
+
+EXPLODE_SQL = """
+WITH RECURSIVE plan (bom_id, quantity) AS (
+    VALUES {plan}
+),
+explosion (bom_id, quantity, depth) AS (
+    SELECT bom_id, CAST(quantity AS NUMERIC), 0 FROM plan
+    UNION ALL
+    SELECT line.component_id, explosion.quantity * line.quantity,
+           explosion.depth + 1
+    FROM {line} line
+    JOIN explosion ON line.bom_id = explosion.bom_id
+    WHERE line.component_id IS NOT NULL AND explosion.depth <= %s
+)
+SELECT material.id, material.code, material.name, material.uom,
+       material.purchaseuom, material.cf, {price},
+       SUM(explosion.quantity * line.quantity),
+       (SELECT MAX(depth) FROM explosion)
+FROM explosion
+JOIN {line} line ON line.bom_id = explosion.bom_id
+JOIN {material} material ON material.id = line.material_id
+{prices}
+GROUP BY material.id, material.code, material.name, material.uom,
+         material.purchaseuom, material.cf, {price}
+"""
+
+
+# Explodes the base and the other boms at once. The base totals, repeated
+# for every other bom, and the totals of the others are summed side by side
+# per material, the portable equivalent of a full outer join of the two
+# explosions of every pair
+COMPARE_SQL = """
+WITH RECURSIVE roots (bom_id) AS (
+    VALUES {roots}
+),
+explosion (root_id, bom_id, quantity, depth) AS (
+    SELECT bom_id, bom_id, CAST(1 AS NUMERIC), 0 FROM roots
+    UNION ALL
+    SELECT explosion.root_id, line.component_id,
+           explosion.quantity * line.quantity, explosion.depth + 1
+    FROM {line} line
+    JOIN explosion ON line.bom_id = explosion.bom_id
+    WHERE line.component_id IS NOT NULL AND explosion.depth <= %s
+),
+totals (root_id, material_id, quantity) AS (
+    SELECT explosion.root_id, line.material_id,
+           SUM(explosion.quantity * line.quantity)
+    FROM explosion
+    JOIN {line} line ON line.bom_id = explosion.bom_id
+    WHERE line.material_id IS NOT NULL
+    GROUP BY explosion.root_id, line.material_id
+),
+sides (other_id, material_id, base_quantity, quantity) AS (
+    SELECT other.bom_id, base.material_id, base.quantity, NULL
+    FROM roots other
+    JOIN totals base ON base.root_id = %s
+    WHERE other.bom_id <> %s
+    UNION ALL
+    SELECT root_id, material_id, NULL, quantity
+    FROM totals
+    WHERE root_id <> %s
+)
+SELECT sides.other_id, material.id, material.code, material.name,
+       material.uom, SUM(sides.base_quantity), SUM(sides.quantity),
+       (SELECT MAX(depth) FROM explosion)
+FROM sides
+JOIN {material} material ON material.id = sides.material_id
+GROUP BY sides.other_id, material.id, material.code, material.name,
+         material.uom
+"""
+
+
+CONTAINS_SQL = """
+WITH RECURSIVE subassembly (bom_id, depth) AS (
+    SELECT %s, 0
+    UNION
+    SELECT line.component_id, subassembly.depth + 1
+    FROM {line} line
+    JOIN subassembly ON line.bom_id = subassembly.bom_id
+    WHERE line.component_id IS NOT NULL AND subassembly.depth <= %s
+)
+SELECT 1 FROM subassembly WHERE bom_id = %s LIMIT 1
+"""
+
+
+# Walks up from the boms using the materials to every bom containing them,
+# UNION drops the boms already seen, so it ends on any graph
+AFFECTED_SQL = """
+WITH RECURSIVE affected (material_id, bom_id) AS (
+    SELECT line.material_id, line.bom_id
+    FROM {line} line
+    WHERE line.material_id IN ({ids})
+    UNION
+    SELECT affected.material_id, line.bom_id
+    FROM {line} line
+    JOIN affected ON line.component_id = affected.bom_id
+)
+SELECT bom.articleinfo_id, affected.material_id
+FROM affected
+JOIN {bom} bom ON bom.id = affected.bom_id
+WHERE bom.articleinfo_id IS NOT NULL
+"""
+
+# Material ids looked up per query
+CHUNK_SIZE = 500
+
+UPDATE_SQL = """
+UPDATE {table} SET {column} = CASE {pk} {whens} END WHERE {pk} IN ({ids})
+"""
+
+
+def to_decimal(value):
+    """
+    Decimal of a numeric column. Backends without decimal arithmetic
+    (sqlite) give floats, rounded to 12 significant digits to drop the
+    binary representation error.
+    """
+    if value is None or isinstance(value, Decimal):
+        return value
+    return Decimal(f'{value:.12g}')
+
+
+def parse_as_of(value):
+    """
+    Instant of an as_of parameter, an iso datetime or a date meaning
+    its end. Raises ValueError.
+    """
+    value = value.strip()
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date {value}.')
+        when = datetime.combine(day, time.max)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def price_source(as_of=None):
+    """
+    Price column, the join providing it and its params, for queries
+    over the material table: the current price, or the price as of
+    an instant from the price history, resolved by a single range join.
+    """
+    if as_of is None:
+        return 'material.price', '', []
+    sql, params = MaterialPrice.objects.as_of_sql(as_of)
+    return 'price.price', (
+        f'LEFT JOIN ({sql}) price ON price.material_id = material.id'
+    ), params
+
+
+def explode_many(quantities, as_of=None):
+    """
+    Flattened material requirement of a plan, a dict of bom id: quantity.
+    Returns dicts of the material id, code, name, uom, purchaseuom, cf,
+    price and quantity, summed over the plan and every level of sub
+    assemblies. Prices are the ones as of as_of when given, None for
+    materials priced later. Costs a query per CHUNK_SIZE boms of the plan.
+    """
+    plan = sorted(quantities.items())
+    materials = {}
+    price, prices, price_params = price_source(as_of)
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(plan), CHUNK_SIZE):
+            chunk = plan[i:i + CHUNK_SIZE]
+            cursor.execute(EXPLODE_SQL.format(
+                plan=', '.join(['(%s, %s)'] * len(chunk)), price=price,
+                prices=prices, **_tables()
+            ), [value for bom_id, quantity in chunk
+                for value in (bom_id, str(quantity))]
+                + [MAX_DEPTH] + price_params)
+            rows = cursor.fetchall()
+
+            if rows and rows[0][8] > MAX_DEPTH:
+                raise BomDepthError(
+                    f"Boms are nested deeper than {MAX_DEPTH} levels."
+                )
+            for row in rows:
+                if row[0] in materials:
+                    materials[row[0]]['quantity'] += to_decimal(row[7])
+                    continue
+                materials[row[0]] = {
+                    'material': row[0], 'code': row[1], 'name': row[2],
+                    'uom': row[3], 'purchaseuom': row[4],
+                    'cf': to_decimal(row[5]), 'price': to_decimal(row[6]),
+                    'quantity': to_decimal(row[7]),
+                }
+
+    return sorted(materials.values(), key=lambda row: row['code'])
+
+
+def explode(bom_id, quantity=1, as_of=None):
+    """
+    Flattened material requirement of the given quantity of a bom,
+    by a single query. See explode_many().
+    """
+    return explode_many({bom_id: quantity}, as_of)
+
+
+def compare(base_id, other_ids):
+    """
+    Differences of the fully exploded boms of others from the base bom,
+    a dict of other bom id: {'added', 'removed', 'changed'} material
+    rows of the material id, code, name, uom and both quantities.
+    Costs a query per CHUNK_SIZE other boms.
+    """
+    other_ids = sorted(set(other_ids) - {base_id})
+    diffs = {pk: {'added': [], 'removed': [], 'changed': []}
+             for pk in other_ids}
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(other_ids), CHUNK_SIZE):
+            chunk = [base_id] + other_ids[i:i + CHUNK_SIZE]
+            cursor.execute(COMPARE_SQL.format(
+                roots=', '.join(['(%s)'] * len(chunk)), **_tables()
+            ), chunk + [MAX_DEPTH, base_id, base_id, base_id])
+            rows = cursor.fetchall()
+
+            if rows and rows[0][7] > MAX_DEPTH:
+                raise BomDepthError(
+                    f"Boms are nested deeper than {MAX_DEPTH} levels."
+                )
+            for other_id, pk, code, name, uom, base, other, _ in rows:
+                base, other = to_decimal(base), to_decimal(other)
+                if base is None:
+                    change = 'added'
+                elif other is None:
+                    change = 'removed'
+                elif base != other:
+                    change = 'changed'
+                else:
+                    continue
+                diffs[other_id][change].append({
+                    'material': pk, 'code': code, 'name': name, 'uom': uom,
+                    'base_quantity': base, 'quantity': other,
+                })
+
+    for diff in diffs.values():
+        for rows in diff.values():
+            rows.sort(key=lambda row: row['code'])
+    return diffs
+
+
+def contains(bom_id, component_id):
+    """True if the bom is used by component_id, at any level"""
+    with connection.cursor() as cursor:
+        cursor.execute(CONTAINS_SQL.format(**_tables()),
+                       [component_id, MAX_DEPTH, bom_id])
+        return cursor.fetchone() is not None
+
+
+def affected_articleinfos(material_ids):
+    """
+    Article infos whose bom uses any of the materials, directly or
+    through sub assemblies at any level. A dict of article info id: ids
+    of the materials it uses.
+    """
+    material_ids = sorted(set(material_ids))
+    articleinfos = {}
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(material_ids), CHUNK_SIZE):
+            chunk = material_ids[i:i + CHUNK_SIZE]
+            cursor.execute(AFFECTED_SQL.format(
+                ids=', '.join(['%s'] * len(chunk)), **_tables()
+            ), chunk)
+            for articleinfo_id, material_id in cursor.fetchall():
+                articleinfos.setdefault(articleinfo_id, set()).add(
+                    material_id
+                )
+
+    return articleinfos
+
+
+def update_column(model, field, values, batch_size=1000):
+    """
+    Bulk update a field from (pk, value) pairs, a CASE update per batch.
+    Same statement as QuerySet.bulk_update(), without building an
+    expression per row, which dominates its run time on large tables.
+    Decimal and boolean values are passed to the database driver as they
+    are, so decimals have to fit the field already (quantized). Values
+    of other fields are prepared by the field, like save() does.
+    """
+    opts = model._meta
+    model_field = opts.get_field(field)
+    if not isinstance(model_field, (DecimalField, BooleanField)):
+        values = [(pk, model_field.get_db_prep_save(value, connection))
+                  for pk, value in values]
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(
+        ['pk', 'pk', field], values
+    ))
+    sql = UPDATE_SQL.format(
+        table=connection.ops.quote_name(opts.db_table),
+        column=connection.ops.quote_name(model_field.column),
+        pk=connection.ops.quote_name(opts.pk.column),
+        whens='{whens}', ids='{ids}'
+    )
+    with connection.cursor() as cursor:
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i + batch_size]
+            params = [value for pair in batch for value in pair]
+            params += [pk for pk, _ in batch]
+            cursor.execute(sql.format(
+                whens=' '.join(['WHEN %s THEN %s'] * len(batch)),
+                ids=', '.join(['%s'] * len(batch)),
+            ), params)
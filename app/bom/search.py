@@ -0,0 +1,358 @@
+"""
+In-process search index of the materials, for the ?q= search of the
+material api. Results are ranked in tiers: code prefix matches by code,
+then name word prefix matches by word and code, then other matches of
+3+ character terms within any field, found through trigram postings.
+Every tier is read in rank order, a search stops once it has enough hits.
+Queries whose trigrams leave only a few candidates rank those directly.
+The filters of the material list are applied to the hits in memory.
+"""
+import threading
+
+from array import array
+from bisect import bisect_left, insort
+
+from django.db import connection
+
+from core.models import Material, ChangeVersion
+
+
+FIELDS = ('code', 'name', 'category', 'subcategory')
+# Material fields filtered by value, kept as stored
+FILTERS = ('category', 'subcategory', 'active')
+# Candidates few enough to be ranked one by one, not read in rank order
+DIRECT_RANK = 2000
+
+
+def normalize(text):
+    """Lower case text with single spaces"""
+    return ' '.join(str(text or '').lower().split())
+
+
+def trigrams(text):
+    """Distinct 3 character substrings of the text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def match(term, doc):
+    """
+    True if the term is within a field of the doc,
+    terms shorter than 3 characters have to start a word
+    """
+    if len(term) >= 3:
+        return any(term in field for field in doc)
+    return any(word.startswith(term)
+               for field in doc for word in field.split())
+
+
+def selected(filters, doc, values):
+    """
+    Whether a material passes the filters, a dict of the code, name
+    (contained, normalized), category, subcategory (lists of values) and
+    active of the material list
+    """
+    for field, index in (('code', 0), ('name', 1)):
+        if field in filters and normalize(filters[field]) not in doc[index]:
+            return False
+    for field, value in zip(FILTERS, values):
+        if field not in filters:
+            continue
+        if field == 'active':
+            if value != filters[field]:
+                return False
+        elif value not in filters[field]:
+            return False
+    return True
+
+
+def rank(terms, doc, pk):
+    """
+    Sort key of the doc for the search terms, None if it is no hit.
+    Matches every term, ranked by the first one.
+    """
+    if not all(match(term, doc) for term in terms):
+        return None
+    first, code = terms[0], doc[0]
+    if code.startswith(first):
+        return (0, code, 0)
+    words = [word for word in doc[1].split() if word.startswith(first)]
+    if words:
+        return (1, min(words), code)
+    if len(first) >= 3:
+        return (2, '', pk)
+    return None
+
+
+class IndexState:
+    """
+    Snapshot of the index, swapped in by a rebuild or an update.
+    A state is never changed once searched, updates change a copy.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        # id: normalized (code, name, category, subcategory)
+        self.docs = {}
+        # id: (category, subcategory, active)
+        self.values = {}
+        # sorted (code, id), (name word, code, id)
+        self.codes = []
+        self.words = []
+        # trigram: sorted array of ids
+        self.grams = {}
+
+    def copy(self):
+        """
+        State to update, sharing the postings with this one.
+        add(), remove() replace the postings they change.
+        """
+        state = IndexState(self.version)
+        state.docs = dict(self.docs)
+        state.values = dict(self.values)
+        state.codes = list(self.codes)
+        state.words = list(self.words)
+        state.grams = dict(self.grams)
+        return state
+
+    def entries(self, pk, doc):
+        """Code and name word entries of the doc"""
+        return [(doc[0], pk)], [(word, doc[0], pk)
+                                for word in set(doc[1].split())]
+
+    def add(self, pk, doc, values):
+        """Index the doc and filter values, replacing earlier versions"""
+        self.remove(pk)
+        self.docs[pk] = doc
+        self.values[pk] = values
+        codes, words = self.entries(pk, doc)
+        for entry in codes:
+            insort(self.codes, entry)
+        for entry in words:
+            insort(self.words, entry)
+        for gram in set().union(*map(trigrams, doc)):
+            posting = array('I', self.grams.get(gram, ()))
+            index = bisect_left(posting, pk)
+            if index == len(posting) or posting[index] != pk:
+                posting.insert(index, pk)
+            self.grams[gram] = posting
+
+    def remove(self, pk):
+        """Drop the doc, from the entries and postings"""
+        doc = self.docs.pop(pk, None)
+        if doc is None:
+            return
+        del self.values[pk]
+        codes, words = self.entries(pk, doc)
+        for entries, entry in [(self.codes, entry) for entry in codes] + \
+                [(self.words, entry) for entry in words]:
+            index = bisect_left(entries, entry)
+            if index < len(entries) and entries[index] == entry:
+                del entries[index]
+        for gram in set().union(*map(trigrams, doc)):
+            posting = array('I', self.grams.get(gram, ()))
+            index = bisect_left(posting, pk)
+            if index < len(posting) and posting[index] == pk:
+                del posting[index]
+            if posting:
+                self.grams[gram] = posting
+            else:
+                self.grams.pop(gram, None)
+
+    def prefixed(self, entries, prefix):
+        """Ids of the sorted entries starting with prefix, in order"""
+        index = bisect_left(entries, (prefix,))
+        while index < len(entries) and entries[index][0].startswith(prefix):
+            yield entries[index][-1]
+            index += 1
+
+    def matching(self, terms):
+        """
+        Ids having every trigram of the 3+ character terms, a superset of
+        the hits. None when there are no such terms.
+        """
+        postings = sorted(
+            (self.grams.get(gram, ()) for term in terms if len(term) >= 3
+             for gram in trigrams(term)),
+            key=len
+        )
+        if not postings:
+            return None
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            if len(ids) <= DIRECT_RANK:
+                break
+            ids.intersection_update(posting)
+        return ids
+
+    def candidates(self, terms, ids):
+        """Ids in rank order, a superset of the hits within ids"""
+        first = terms[0]
+        yield from self.prefixed(self.codes, first)
+        yield from self.prefixed(self.words, first)
+        if len(first) >= 3:
+            yield from sorted(ids)
+
+
+class MaterialIndex:
+    """
+    Search index of the materials, kept in this process.
+    Built in a background thread by warm(), updated by the material
+    signals of this process, rebuilt when another process changed the
+    materials (their ChangeVersion moved). Searches of a cold index
+    return None, callers fall back to the database.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self.enabled = False
+        self._state = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._state is not None
+
+    @property
+    def version(self):
+        """Change version the index is built from"""
+        return self._state.version if self._state is not None else None
+
+    def warm(self):
+        """Enable the index and build it, at worker start"""
+        self.enabled = True
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the index, in a background thread unless disabled"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+
+        if not self.background:
+            self._build()
+            return
+        self._thread = threading.Thread(target=self._build,
+                                        name='material-index', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """Wait for a background build to finish"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def after_fork(self):
+        """
+        Reset a forked copy of the index: the build thread and lock
+        holders of the parent do not exist in the child. The built
+        state is kept, a missing one is built again.
+        """
+        self._lock = threading.Lock()
+        self._building = False
+        self._thread = None
+        if self.enabled and not self.ready:
+            self.refresh()
+
+    def _build(self):
+        """Read every material, swap in the new index state"""
+        try:
+            version, = ChangeVersion.objects.versions(Material)
+            state = IndexState(version)
+            columns = list(dict.fromkeys(FIELDS + FILTERS))
+            for pk, *row in Material.objects.values_list(
+                    'id', *columns).order_by('id').iterator(chunk_size=5000):
+                row = dict(zip(columns, row))
+                doc = tuple(normalize(row[field]) for field in FIELDS)
+                state.docs[pk] = doc
+                state.values[pk] = tuple(row[field] for field in FILTERS)
+                codes, words = state.entries(pk, doc)
+                state.codes += codes
+                state.words += words
+                for gram in set().union(*map(trigrams, doc)):
+                    posting = state.grams.get(gram)
+                    if posting is None:
+                        posting = state.grams[gram] = array('I')
+                    posting.append(pk)
+            state.codes.sort()
+            state.words.sort()
+            with self._lock:
+                self._state = state
+        finally:
+            self._building = False
+            if self.background:
+                connection.close()
+
+    def update(self, pk, material=None, version=None):
+        """
+        Index a material saved by this process, or drop it when deleted.
+        If the index was current at version, the change version written
+        along is adopted, sparing a rebuild.
+        """
+        with self._lock:
+            if self._state is None:
+                return
+            state = self._state.copy()
+            if material is None:
+                state.remove(pk)
+            else:
+                state.add(pk, tuple(normalize(getattr(material, field))
+                                    for field in FIELDS),
+                          tuple(getattr(material, field)
+                                for field in FILTERS))
+            if version is not None and version == state.version:
+                state.version, = ChangeVersion.objects.versions(Material)
+            self._state = state
+
+    def search(self, query, limit=None, filters=None):
+        """
+        Ids of the materials matching every word of the query, ranked,
+        only those passing the filters when given (see selected()).
+        Returns None when the index is cold.
+        """
+        state = self._state
+        if state is None:
+            if self.enabled:
+                self.refresh()
+            return None
+        if ChangeVersion.objects.versions(Material)[0] != state.version:
+            self.refresh()
+            # Built already unless in the background
+            state = self._state
+
+        terms = normalize(query).split()
+        if not terms:
+            return []
+
+        ids = state.matching(terms)
+        if ids is not None and len(ids) <= DIRECT_RANK:
+            hits = sorted(
+                (key, pk) for key, pk in (
+                    (rank(terms, state.docs[pk], pk), pk)
+                    for pk in ids if pk in state.docs and (
+                        not filters or selected(filters, state.docs[pk],
+                                                state.values[pk])
+                    )
+                ) if key is not None
+            )
+            return [pk for _, pk in hits[:limit]]
+
+        hits = []
+        seen = set()
+        for pk in state.candidates(terms, ids):
+            if pk in seen or (ids is not None and pk not in ids):
+                continue
+            seen.add(pk)
+            doc = state.docs.get(pk)
+            if doc is None or filters and not selected(filters, doc,
+                                                       state.values[pk]):
+                continue
+            if rank(terms, doc, pk) is not None:
+                hits.append(pk)
+                if len(hits) == limit:
+                    break
+        return hits
+
+
+material_index = MaterialIndex()
@@ -1,9 +1,12 @@
 """
 Serializer for api/bom
 """
+from django.db import transaction
 from rest_framework import serializers
 
-from core.models import Material
+from core.models import Material, Bom, BomLine, CostChange
+
+from bom import queries, costing, uom
 
 
 class MaterialSerializer(serializers.ModelSerializer):
@@ -16,3 +19,138 @@ class MaterialSerializer(serializers.ModelSerializer):
             'uom', 'purchaseuom', 'cf', 'price', 'active'
         )
         read_only_fields = ('id',)
+
+    def validate(self, attrs):
+        """A new material without cf gets the standard cf of its uoms"""
+        if self.instance is None and 'cf' not in attrs:
+            cf = uom.default_cf(attrs.get('uom'), attrs.get('purchaseuom'))
+            if cf is not None:
+                attrs['cf'] = cf
+        return attrs
+
+    def update(self, instance, validated_data):
+        """
+        Update a material, also recosts the article infos using it
+        when its price or cf changes.
+        """
+        price, cf = instance.price, instance.cf
+
+        with transaction.atomic():
+            material = super().update(instance, validated_data)
+            if material.price != price or material.cf != cf:
+                costing.propagate([material.id])
+
+        return material
+
+
+class BomLineSerializer(serializers.ModelSerializer):
+    """Serializer for the BomLine model"""
+
+    class Meta:
+        model = BomLine
+        fields = ('id', 'bom', 'material', 'component', 'quantity')
+        read_only_fields = ('id',)
+
+    def validate_quantity(self, value):
+        """Quantity consumed has to be positive"""
+        if value <= 0:
+            raise serializers.ValidationError(
+                'Ensure this value is greater than 0.'
+            )
+        return value
+
+    def validate(self, attrs):
+        """
+        A line consumes either a material or a sub assembly bom,
+        which must not contain the bom itself.
+        """
+        def current(field):
+            if field in attrs:
+                return attrs[field]
+            return getattr(self.instance, field, None)
+
+        bom = current('bom')
+        material = current('material')
+        component = current('component')
+
+        if (material is None) == (component is None):
+            raise serializers.ValidationError(
+                'Provide either a material or a component.'
+            )
+        if component is not None and queries.contains(bom.id, component.id):
+            raise serializers.ValidationError(
+                {'component': 'Component contains this bom already.'}
+            )
+        return attrs
+
+
+class BomSerializer(serializers.ModelSerializer):
+    """Serializer for the Bom model"""
+
+    class Meta:
+        model = Bom
+        fields = ('id', 'code', 'name', 'articleinfo')
+        read_only_fields = ('id',)
+
+
+class BomDetailSerializer(BomSerializer):
+    """Serializer for the Bom detail, with its lines"""
+    lines = BomLineSerializer(many=True, read_only=True)
+
+    class Meta(BomSerializer.Meta):
+        fields = BomSerializer.Meta.fields + ('lines',)
+
+
+class ExplosionSerializer(serializers.Serializer):
+    """Serializer for a material row of a bom explosion"""
+    material = serializers.IntegerField()
+    code = serializers.CharField()
+    name = serializers.CharField()
+    uom = serializers.CharField()
+    quantity = serializers.DecimalField(max_digits=24, decimal_places=6)
+    price = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                     allow_null=True)
+
+
+class CostChangeSerializer(serializers.ModelSerializer):
+    """Serializer for the CostChange log"""
+    artid = serializers.CharField(source='articleinfo.artid', read_only=True)
+
+    class Meta:
+        model = CostChange
+        fields = ('id', 'articleinfo', 'artid', 'material', 'old_basic',
+                  'new_basic', 'changed_at')
+        read_only_fields = fields
+
+
+class WhereUsedSerializer(serializers.Serializer):
+    """Serializer for an article info using a material"""
+    articleinfo = serializers.IntegerField()
+    artid = serializers.CharField()
+    quantity = serializers.DecimalField(max_digits=24, decimal_places=6)
+
+
+class RequirementSerializer(serializers.Serializer):
+    """Serializer for a material row of a requirements plan"""
+    material = serializers.IntegerField()
+    code = serializers.CharField()
+    name = serializers.CharField()
+    uom = serializers.CharField()
+    quantity = serializers.DecimalField(max_digits=24, decimal_places=6)
+    purchaseuom = serializers.CharField()
+    purchase_quantity = serializers.DecimalField(max_digits=24,
+                                                 decimal_places=4)
+    price = serializers.DecimalField(max_digits=5, decimal_places=2)
+    cost = serializers.DecimalField(max_digits=24, decimal_places=2)
+
+
+class CompareSerializer(serializers.Serializer):
+    """Serializer for a material row of a bom comparison"""
+    material = serializers.IntegerField()
+    code = serializers.CharField()
+    name = serializers.CharField()
+    uom = serializers.CharField()
+    base_quantity = serializers.DecimalField(max_digits=24, decimal_places=6,
+                                             allow_null=True)
+    quantity = serializers.DecimalField(max_digits=24, decimal_places=6,
+                                        allow_null=True)
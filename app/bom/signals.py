@@ -0,0 +1,35 @@
+"""
+Signal handlers keeping the material search index of this process fresh
+"""
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+                                     post_delete
+from django.dispatch import receiver
+
+from core.models import Material, ChangeVersion
+
+from bom import search
+
+
+@receiver(pre_save, sender=Material)
+@receiver(pre_delete, sender=Material)
+def remember_material_version(sender, instance, **kwargs):
+    """Keep the change version the write starts from"""
+    instance._index_version = None
+    if search.material_index.ready:
+        instance._index_version, = ChangeVersion.objects.versions(Material)
+
+
+@receiver(post_save, sender=Material)
+def index_material(sender, instance, **kwargs):
+    """Index the saved material"""
+    search.material_index.update(
+        instance.pk, instance, getattr(instance, '_index_version', None)
+    )
+
+
+@receiver(post_delete, sender=Material)
+def unindex_material(sender, instance, **kwargs):
+    """Drop the deleted material from the index"""
+    search.material_index.update(
+        instance.pk, version=getattr(instance, '_index_version', None)
+    )
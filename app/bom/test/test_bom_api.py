@@ -0,0 +1,212 @@
+"""
+All Bom, BomLine model related tests are here.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Material, Bom, BomLine, Article, ArticleInfo, \
+                        Color
+from core.testing import QueryBudgetMixin
+
+from bom import queries
+
+
+BOM_URL = reverse('bom:bom-list')
+BOM_LINE_URL = reverse('bom:bomline-list')
+
+
+def detail_url(bom_id):
+    """Returns the detailed view of a bom"""
+    return reverse('bom:bom-detail', args=[bom_id])
+
+
+def explode_url(bom_id):
+    """Returns the explosion url of a bom"""
+    return reverse('bom:bom-explode', args=[bom_id])
+
+
+def sample_material(**params):
+    """Create and return a sample material"""
+    defaults = {
+        'code': '5-co07-0002',
+        'name': 'M40 Black',
+        'category': 'component',
+        'uom': 'nos',
+    }
+    defaults.update(params)
+
+    return Material.objects.create(**defaults)
+
+
+def sample_bom(user, **params):
+    """Create and return a sample bom"""
+    defaults = {
+        'code': 'b-3290-bk-g',
+        'name': '3290 black gents',
+    }
+    defaults.update(params)
+
+    return Bom.objects.create(user=user, **defaults)
+
+
+class BomApiTests(QueryBudgetMixin, TestCase):
+    """Test bom, bom line requests and the explosion"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.sole = sample_material(code='4-so01-0001', name='Sole')
+        self.rexin = sample_material(code='3-re01-0001', name='Rexin',
+                                     category='rexin', uom='meter')
+        self.bom = sample_bom(self.user)
+
+    def add_line(self, bom, quantity, material=None, component=None):
+        """Add a line to the bom"""
+        return BomLine.objects.create(bom=bom, material=material,
+                                      component=component, quantity=quantity)
+
+    def test_explode_single_level(self):
+        """Test explosion of a bom of materials only"""
+        self.add_line(self.bom, '1', material=self.sole)
+        self.add_line(self.bom, '0.25', material=self.rexin)
+
+        res = self.client.get(explode_url(self.bom.id), {'quantity': 10})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        quantities = {row['code']: Decimal(row['quantity'])
+                      for row in res.data['materials']}
+        self.assertEqual(quantities, {'4-so01-0001': Decimal('10'),
+                                      '3-re01-0001': Decimal('2.5')})
+
+    def test_explode_nested_single_query(self):
+        """Test a bom 6 levels deep is exploded by a single query"""
+        parent = self.bom
+        for level in range(6):
+            self.add_line(parent, '1', material=self.sole)
+            child = sample_bom(self.user, code=f'sub-{level}',
+                               name=f'Upper {level}')
+            self.add_line(parent, '2', component=child)
+            parent = child
+        self.add_line(parent, '0.5', material=self.rexin)
+
+        with self.assertQueryBudget(1):
+            materials = queries.explode(self.bom.id)
+
+        quantities = {row['code']: row['quantity'] for row in materials}
+        # sole: 1 + 2 + 4 + 8 + 16 + 32, rexin: 2 ** 6 * 0.5
+        self.assertEqual(quantities['4-so01-0001'], Decimal('63'))
+        self.assertEqual(quantities['3-re01-0001'], Decimal('32'))
+
+    def test_explode_shared_subassembly(self):
+        """Test a sub assembly used on several lines is summed"""
+        upper = sample_bom(self.user, code='upper', name='Upper')
+        self.add_line(upper, '0.2', material=self.rexin)
+        self.add_line(self.bom, '1', component=upper)
+        self.add_line(self.bom, '1', component=upper)
+
+        materials = queries.explode(self.bom.id, 5)
+
+        self.assertEqual(len(materials), 1)
+        self.assertEqual(materials[0]['quantity'], Decimal('2'))
+
+    def test_explode_invalid_quantity(self):
+        """Test the explosion quantity is validated"""
+        for quantity in ['abc', '-1', '0', 'nan']:
+            res = self.client.get(explode_url(self.bom.id),
+                                  {'quantity': quantity})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_bom_lines(self):
+        """Test the bom detail lists its lines"""
+        self.add_line(self.bom, '1', material=self.sole)
+
+        res = self.client.get(detail_url(self.bom.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['lines']), 1)
+        self.assertEqual(res.data['lines'][0]['material'], self.sole.id)
+
+    def test_line_material_or_component(self):
+        """Test a line has exactly one of a material or a component"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.add_line(self.bom, '1')
+
+        self.user.is_staff = True
+        self.user.save()
+        upper = sample_bom(self.user, code='upper', name='Upper')
+        res = self.client.post(BOM_LINE_URL, {
+            'bom': self.bom.id, 'material': self.sole.id,
+            'component': upper.id, 'quantity': '1',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_line_cycle_rejected(self):
+        """Test a bom can not be made a component of itself"""
+        self.user.is_staff = True
+        self.user.save()
+        upper = sample_bom(self.user, code='upper', name='Upper')
+        self.add_line(self.bom, '1', component=upper)
+
+        for bom, component in [(upper, self.bom), (upper, upper)]:
+            res = self.client.post(BOM_LINE_URL, {
+                'bom': bom.id, 'component': component.id, 'quantity': '1',
+            })
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('component', res.data)
+
+    def test_create_bom_admin_only(self):
+        """Test only admins can create boms"""
+        payload = {'code': 'upper', 'name': 'Upper'}
+        res = self.client.post(BOM_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        res = self.client.post(BOM_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Bom.objects.get(code='upper').user, self.user)
+
+    def test_delete_used_rejected(self):
+        """Test deleting what boms still use is a conflict naming them"""
+        self.user.is_staff = True
+        self.user.save()
+        article = Article.objects.create(user=self.user, artno='3290')
+        color = Color.objects.create(user=self.user, code='bk', name='black')
+        info = ArticleInfo.objects.create(user=self.user, article=article,
+                                          color=color, category='g')
+        upper = sample_bom(self.user, code='upper', name='Upper',
+                           articleinfo=info)
+        self.add_line(upper, '1', material=self.sole)
+        self.add_line(self.bom, '1', component=upper)
+
+        for url, boms in [
+                (reverse('bom:material-detail', args=[self.sole.id]),
+                 ['upper']),
+                (detail_url(upper.id), [self.bom.code]),
+                (reverse('article:articleinfo-detail', args=[info.id]),
+                 [self.bom.code])]:
+            res = self.client.delete(url)
+
+            self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(res.data['boms'], boms)
+
+        self.assertTrue(Bom.objects.filter(id=upper.id).exists())
+        res = self.client.delete(detail_url(self.bom.id))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        res = self.client.delete(detail_url(upper.id))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,142 @@
+"""
+Tests of the bom closure and the where-used lookup of materials.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Article, ArticleInfo, Color, Material, Bom, BomLine, \
+                        BomClosure
+from core.testing import QueryBudgetMixin
+
+
+def where_used_url(material_id):
+    """Returns the where-used url of a material"""
+    return reverse('bom:material-where-used', args=[material_id])
+
+
+def closure():
+    """Closure rows as a dict of (ancestor, descendant): (quantity, paths)"""
+    return {
+        (row.ancestor_id, row.descendant_id): (row.quantity, row.paths)
+        for row in BomClosure.objects.all()
+    }
+
+
+class BomClosureTests(QueryBudgetMixin, TestCase):
+    """Test the closure follows the bom lines, answers where-used"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.rexin = Material.objects.create(code='3-re01-0001', name='Rexin')
+        self.boms = {
+            code: Bom.objects.create(user=self.user, code=code, name=code)
+            for code in ['gents', 'ladies', 'upper', 'lining']
+        }
+
+    def line(self, bom, quantity, component=None, material=None):
+        """Add a line to the named bom"""
+        return BomLine.objects.create(
+            bom=self.boms[bom], quantity=quantity, material=material,
+            component=self.boms[component] if component else None
+        )
+
+    def assertClosureRebuilt(self):
+        """Assert the maintained closure equals a full rebuild"""
+        maintained = closure()
+        BomClosure.objects.rebuild()
+
+        self.assertEqual(maintained, closure())
+
+    def test_closure_follows_lines(self):
+        """Test adding, changing, deleting lines keeps the closure"""
+        upper = self.boms['upper']
+        lining = self.boms['lining']
+        gents = self.boms['gents']
+
+        self.line('upper', 2, component='lining')
+        first = self.line('gents', 1, component='upper')
+        self.line('gents', '0.5', component='upper')
+
+        self.assertEqual(closure()[(gents.id, lining.id)],
+                         (Decimal('3'), 2))
+        self.assertClosureRebuilt()
+
+        first.quantity = 3
+        first.save()
+
+        self.assertEqual(closure()[(gents.id, upper.id)],
+                         (Decimal('3.5'), 2))
+        self.assertClosureRebuilt()
+
+        first.delete()
+
+        self.assertEqual(closure()[(gents.id, lining.id)], (Decimal('1'), 1))
+        self.assertClosureRebuilt()
+
+        BomLine.objects.filter(bom=gents).delete()
+
+        self.assertNotIn((gents.id, upper.id), closure())
+        self.assertClosureRebuilt()
+
+    def test_closure_move_line(self):
+        """Test moving a line to another bom relinks its paths"""
+        self.line('upper', 1, component='lining')
+        line = self.line('gents', 1, component='upper')
+
+        line.bom = self.boms['ladies']
+        line.save()
+
+        self.assertNotIn((self.boms['gents'].id, self.boms['lining'].id),
+                         closure())
+        self.assertIn((self.boms['ladies'].id, self.boms['lining'].id),
+                      closure())
+        self.assertClosureRebuilt()
+
+    def test_where_used(self):
+        """Test where-used sums direct, indirect use per article info"""
+        article = Article.objects.create(user=self.user, artno='3290')
+        color = Color.objects.create(user=self.user, code='bk', name='black')
+        for code, category in [('gents', 'g'), ('ladies', 'l')]:
+            bom = self.boms[code]
+            bom.articleinfo = ArticleInfo.objects.create(
+                user=self.user, article=article, color=color,
+                category=category, artid=f'3290-bk-{category}'
+            )
+            bom.save()
+
+        self.line('lining', '0.25', material=self.rexin)
+        self.line('upper', 2, component='lining')
+        self.line('upper', '0.1', material=self.rexin)
+        self.line('gents', 1, component='upper')
+        self.line('gents', 1, component='lining')
+        self.line('ladies', '0.3', material=self.rexin)
+
+        with self.assertQueryBudget(2):
+            res = self.client.get(where_used_url(self.rexin.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['code'], '3-re01-0001')
+        quantities = {row['artid']: Decimal(row['quantity'])
+                      for row in res.data['used_in']}
+        # gents: upper (2 * 0.25 + 0.1) + lining 0.25
+        self.assertEqual(quantities, {'3290-bk-g': Decimal('0.85'),
+                                      '3290-bk-l': Decimal('0.3')})
+
+    def test_where_used_unused(self):
+        """Test where-used of a material not in any bom is empty"""
+        res = self.client.get(where_used_url(self.rexin.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['used_in'], [])
@@ -0,0 +1,122 @@
+"""
+Tests of the comparison of the exploded boms of variants.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Article, ArticleInfo, Color, Material, Bom, BomLine
+from core.testing import QueryBudgetMixin
+
+
+COMPARE_URL = reverse('bom:compare')
+
+
+class BomCompareTests(QueryBudgetMixin, TestCase):
+    """Test the differences of variant boms, over every level"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.materials = {
+            code: Material.objects.create(code=code, name=code, uom='nos')
+            for code in ['rexin-bk', 'rexin-br', 'sole', 'buckle']
+        }
+        article = Article.objects.create(user=self.user, artno='3290')
+        self.boms = {}
+        for code, lines in [
+                ('upper-bk', [('rexin-bk', '0.2'), ('buckle', 2)]),
+                ('upper-br', [('rexin-br', '0.2'), ('buckle', 2)])]:
+            self.boms[code] = self.bom(code, lines)
+
+        for color, upper, lines in [
+                ('bk', 'upper-bk', [('sole', 1)]),
+                ('br', 'upper-br', [('sole', 1), ('buckle', 1)]),
+                ('tn', 'upper-bk', [('sole', 2)]),
+                ('gy', 'upper-bk', [('sole', 1)])]:
+            info = ArticleInfo.objects.create(
+                user=self.user, article=article, category='g',
+                color=Color.objects.create(user=self.user, code=color,
+                                           name=color),
+                artid=f'3290-{color}-g'
+            )
+            bom = self.bom(info.artid, lines, articleinfo=info)
+            BomLine.objects.create(bom=bom, component=self.boms[upper],
+                                   quantity=1)
+
+    def bom(self, code, lines, articleinfo=None):
+        """Bom with (material code, quantity) lines"""
+        bom = Bom.objects.create(user=self.user, code=code, name=code,
+                                 articleinfo=articleinfo)
+        for material, quantity in lines:
+            BomLine.objects.create(bom=bom, material=self.materials[material],
+                                   quantity=quantity)
+        return bom
+
+    def diff(self, comparison):
+        """Comparison as change: {code: (base quantity, quantity)}"""
+        return {
+            change: {
+                row['code']: tuple(
+                    None if value is None else Decimal(value)
+                    for value in (row['base_quantity'], row['quantity'])
+                ) for row in comparison[change]
+            } for change in ('added', 'removed', 'changed')
+        }
+
+    def test_compare(self):
+        """Test added, removed, changed materials over all levels"""
+        with self.assertQueryBudget(2):
+            res = self.client.get(COMPARE_URL, {'a': '3290-bk-g',
+                                                'b': '3290-br-g'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['a'], '3290-bk-g')
+        comparison, = res.data['comparisons']
+        self.assertEqual(comparison['b'], '3290-br-g')
+        self.assertEqual(self.diff(comparison), {
+            'added': {'rexin-br': (None, Decimal('0.2'))},
+            'removed': {'rexin-bk': (Decimal('0.2'), None)},
+            'changed': {'buckle': (Decimal('2'), Decimal('3'))},
+        })
+
+    def test_compare_many(self):
+        """Test one base compared against many variants in one call"""
+        with self.assertQueryBudget(2):
+            res = self.client.get(COMPARE_URL, {
+                'a': '3290-bk-g', 'b': '3290-tn-g, 3290-gy-g,3290-bk-g'
+            })
+
+        self.assertEqual([comparison['b'] for comparison
+                          in res.data['comparisons']],
+                         ['3290-tn-g', '3290-gy-g', '3290-bk-g'])
+        tan, grey, same = map(self.diff, res.data['comparisons'])
+        self.assertEqual(tan['changed'], {'sole': (Decimal('1'),
+                                                   Decimal('2'))})
+        empty = {'added': {}, 'removed': {}, 'changed': {}}
+        self.assertEqual(grey, empty)
+        self.assertEqual(same, empty)
+
+    def test_compare_invalid(self):
+        """Test missing params and artids without a bom are rejected"""
+        for params in [{'a': '3290-bk-g'}, {'b': '3290-bk-g'},
+                       {'a': '3290-bk-g', 'b': 'nope'}]:
+            res = self.client.get(COMPARE_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compare_unauthenticated(self):
+        """Test authentication is required"""
+        res = APIClient().get(COMPARE_URL, {'a': '3290-bk-g',
+                                            'b': '3290-br-g'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
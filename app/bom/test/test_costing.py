@@ -0,0 +1,253 @@
+"""
+Tests of the bom costing engine.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Article, ArticleInfo, Color, Material, Bom, BomLine, \
+                        ChangeVersion, CostChange
+
+from bom import costing, queries
+
+
+RECOST_URL = reverse('bom:bom-recost')
+COST_CHANGE_URL = reverse('bom:costchange-list')
+
+
+def material_url(material_id):
+    """Returns the detailed view of a material"""
+    return reverse('bom:material-detail', args=[material_id])
+
+
+class CostingTests(TestCase):
+    """Test rolling material costs up into ArticleInfo.basic"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        article = Article.objects.create(user=self.user, artno='3290')
+        color = Color.objects.create(user=self.user, code='bk', name='black')
+        self.info = ArticleInfo.objects.create(
+            user=self.user, article=article, color=color, category='g',
+            artid='3290-bk-g'
+        )
+        self.bom = Bom.objects.create(user=self.user, code='3290-bk-g',
+                                      name='3290 black', articleinfo=self.info)
+
+        # 20.00 a roll of 10 meter, 2.00 a meter
+        self.rexin = Material.objects.create(
+            code='3-re01-0001', name='Rexin', uom='meter', purchaseuom='roll',
+            cf=10, price=20
+        )
+        self.sole = Material.objects.create(code='4-so01-0001', name='Sole',
+                                            price='45.50')
+        upper = Bom.objects.create(user=self.user, code='upper', name='Upper')
+        BomLine.objects.create(bom=upper, material=self.rexin, quantity='0.3')
+        BomLine.objects.create(bom=self.bom, component=upper, quantity=2)
+        BomLine.objects.create(bom=self.bom, material=self.sole, quantity=1)
+
+    def test_compute_costs(self):
+        """Test cost sums quantity * price / cf over every level"""
+        costs = costing.compute_costs()
+
+        # 2 * 0.3 * 20 / 10 + 45.50
+        self.assertEqual(costs, {self.info.id: Decimal('46.70')})
+
+    def test_recost_writes_changed(self):
+        """Test recost writes basic, then reports nothing changed"""
+        version = ChangeVersion.objects.versions(ArticleInfo)
+
+        report = costing.recost()
+        self.info.refresh_from_db()
+
+        self.assertEqual(self.info.basic, Decimal('46.70'))
+        self.assertEqual(report['costed'], 1)
+        self.assertEqual(report['changed'], 1)
+        self.assertNotEqual(ChangeVersion.objects.versions(ArticleInfo),
+                            version)
+
+        report = costing.recost()
+
+        self.assertEqual(report['changed'], 0)
+
+    def test_recost_rounds_half_up(self):
+        """Test the cost is rounded to the basic precision"""
+        self.sole.price = Decimal('0.01')
+        self.sole.save()
+        BomLine.objects.filter(material=self.sole).update(quantity='0.5')
+
+        self.assertEqual(costing.compute_costs()[self.info.id],
+                         Decimal('1.21'))
+
+    def test_recost_skips_overflow(self):
+        """Test costs too large for basic are reported, not written"""
+        self.sole.price = Decimal('999.99')
+        self.sole.save()
+        BomLine.objects.filter(material=self.sole).update(quantity=100)
+
+        report = costing.recost()
+        self.info.refresh_from_db()
+
+        self.assertEqual(report['skipped'], [self.info.id])
+        self.assertEqual(self.info.basic, Decimal('0'))
+
+    def nest(self, levels):
+        """Bom of sub assemblies nested levels deep, rexin at the bottom"""
+        bottom = Bom.objects.create(user=self.user, code='level0', name='L')
+        BomLine.objects.create(bom=bottom, material=self.rexin, quantity=10)
+        for level in range(1, levels):
+            parent = Bom.objects.create(user=self.user, code=f'level{level}',
+                                        name='L')
+            BomLine.objects.create(bom=parent, component=bottom, quantity=1)
+            bottom = parent
+        BomLine.objects.get(bom=self.bom, component__isnull=False).delete()
+        BomLine.objects.create(bom=self.bom, component=bottom, quantity=2)
+
+    def test_recost_max_depth(self):
+        """Test boms nested to the depth limit are costed whole"""
+        self.nest(queries.MAX_DEPTH)
+
+        costing.recost()
+        self.info.refresh_from_db()
+
+        # 2 * 10 * 20 / 10 + 45.50
+        self.assertEqual(self.info.basic, Decimal('85.50'))
+
+    def test_recost_skips_too_deep(self):
+        """Test boms nested deeper than the limit are not costed"""
+        self.nest(queries.MAX_DEPTH + 1)
+
+        report = costing.recost()
+        self.info.refresh_from_db()
+
+        self.assertEqual(report['skipped'], [self.info.id])
+        self.assertEqual(self.info.basic, Decimal('0'))
+        with self.assertRaises(queries.BomDepthError):
+            costing.compute_costs()
+
+    def test_recost_given_ids(self):
+        """Test recosting only the given article infos"""
+        self.assertEqual(costing.recost([])['costed'], 0)
+        self.assertEqual(costing.recost([self.info.id])['changed'], 1)
+
+    def test_recost_command(self):
+        """Test the recost command reports the rows changed"""
+        out = StringIO()
+        call_command('recost', '3290-bk-g', stdout=out)
+
+        self.assertIn('Costed 1 article infos, changed 1', out.getvalue())
+
+    def test_recost_endpoint(self):
+        """Test recosting is for admins, reports the rows changed"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.post(RECOST_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        res = client.post(RECOST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['changed'], 1)
+        self.assertIn('duration_ms', res.data)
+
+
+class CostPropagationTests(TestCase):
+    """Test recosting the article infos affected by a material change"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass',
+            is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+        article = Article.objects.create(user=self.user, artno='3290')
+        color = Color.objects.create(user=self.user, code='bk', name='black')
+        self.gents, self.ladies = [
+            ArticleInfo.objects.create(user=self.user, article=article,
+                                       color=color, category=category,
+                                       artid=f'3290-bk-{category}')
+            for category in ['g', 'l']
+        ]
+        self.rexin = Material.objects.create(code='3-re01-0001', name='Rexin',
+                                             cf=10, price=20)
+        self.sole = Material.objects.create(code='4-so01-0001', name='Sole',
+                                            price=45)
+
+        # gents: bom -> upper -> lining -> rexin, ladies: sole only
+        lining = Bom.objects.create(user=self.user, code='lining', name='L')
+        upper = Bom.objects.create(user=self.user, code='upper', name='U')
+        BomLine.objects.create(bom=lining, material=self.rexin, quantity=1)
+        BomLine.objects.create(bom=upper, component=lining, quantity=2)
+        for info, line in [(self.gents, {'component': upper}),
+                           (self.ladies, {'material': self.sole})]:
+            bom = Bom.objects.create(user=self.user, code=info.artid,
+                                     name=info.artid, articleinfo=info)
+            BomLine.objects.create(bom=bom, quantity=1, **line)
+        costing.recost()
+
+    def test_affected_articleinfos(self):
+        """Test finding the article infos using materials at any level"""
+        self.assertEqual(queries.affected_articleinfos([self.rexin.id]),
+                         {self.gents.id: {self.rexin.id}})
+        self.assertEqual(
+            queries.affected_articleinfos([self.rexin.id, self.sole.id]),
+            {self.gents.id: {self.rexin.id}, self.ladies.id: {self.sole.id}}
+        )
+        self.assertEqual(queries.affected_articleinfos([]), {})
+
+    def test_price_change_recosts_users(self):
+        """Test a price update recosts only the article infos using it"""
+        res = self.client.patch(material_url(self.rexin.id), {'price': 30})
+        self.gents.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.gents.basic, Decimal('6.00'))
+
+        change = CostChange.objects.get(material=self.rexin)
+        self.assertEqual(change.articleinfo, self.gents)
+        self.assertEqual(change.old_basic, Decimal('4.00'))
+        self.assertEqual(change.new_basic, Decimal('6.00'))
+
+    def test_cf_change_recosts(self):
+        """Test a cf update recosts the article infos using it"""
+        report = costing.propagate([self.rexin.id])
+        self.assertEqual(report['costed'], 1)
+        self.assertEqual(report['changed'], 0)
+
+        self.client.patch(material_url(self.rexin.id), {'cf': 20})
+        self.gents.refresh_from_db()
+
+        self.assertEqual(self.gents.basic, Decimal('2.00'))
+
+    def test_other_change_no_recost(self):
+        """Test updating other fields of a material does not recost"""
+        count = CostChange.objects.count()
+        self.client.patch(material_url(self.sole.id), {'name': 'PU sole'})
+
+        self.assertEqual(CostChange.objects.count(), count)
+
+    def test_list_cost_changes(self):
+        """Test listing the cost changes of an artid"""
+        self.client.patch(material_url(self.sole.id), {'price': 50})
+
+        res = self.client.get(COST_CHANGE_URL, {'artid': '3290-bk-l'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['new_basic'], '50.00')
+        self.assertEqual(res.data['results'][0]['material'], self.sole.id)
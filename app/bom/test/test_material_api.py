@@ -1,6 +1,8 @@
 """
 All Material model related tests are here.
 """
+import csv
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
@@ -9,11 +11,13 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Material
+from core.testing import QueryBudgetMixin
 
 from bom.serializers import MaterialSerializer
 
 
 MATERIAL_URL = reverse('bom:material-list')
+MATERIAL_EXPORT_URL = reverse('bom:material-export')
 
 
 def detail_url(material_id):
@@ -72,7 +76,7 @@ class PrivateMaterialApiTests(TestCase):
         serializer = MaterialSerializer(materials, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_user_create_material_unsuccess(self):
         """Test that creating a material is unsuccessful for normal user"""
@@ -204,11 +208,11 @@ class FilterMaterialApiTest(TestCase):
             {'code': '5-co07'}
         )
 
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertIn(self.serializer2.data, res.data)
-        self.assertIn(self.serializer3.data, res.data)
-        self.assertNotIn(self.serializer4.data, res.data)
-        self.assertNotIn(self.serializer5.data, res.data)
+        self.assertIn(self.serializer1.data, res.data['results'])
+        self.assertIn(self.serializer2.data, res.data['results'])
+        self.assertIn(self.serializer3.data, res.data['results'])
+        self.assertNotIn(self.serializer4.data, res.data['results'])
+        self.assertNotIn(self.serializer5.data, res.data['results'])
 
     def test_filter_name(self):
         """Test filter material by name"""
@@ -216,11 +220,11 @@ class FilterMaterialApiTest(TestCase):
             MATERIAL_URL,
             {'name': 'red'}
         )
-        self.assertNotIn(self.serializer1.data, res.data)
-        self.assertNotIn(self.serializer2.data, res.data)
-        self.assertIn(self.serializer3.data, res.data)
-        self.assertIn(self.serializer4.data, res.data)
-        self.assertNotIn(self.serializer5.data, res.data)
+        self.assertNotIn(self.serializer1.data, res.data['results'])
+        self.assertNotIn(self.serializer2.data, res.data['results'])
+        self.assertIn(self.serializer3.data, res.data['results'])
+        self.assertIn(self.serializer4.data, res.data['results'])
+        self.assertNotIn(self.serializer5.data, res.data['results'])
 
     def test_filter_category(self):
         """Test filter material by category"""
@@ -228,11 +232,11 @@ class FilterMaterialApiTest(TestCase):
             MATERIAL_URL,
             {'category': 'component'}
         )
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertIn(self.serializer2.data, res.data)
-        self.assertIn(self.serializer3.data, res.data)
-        self.assertIn(self.serializer4.data, res.data)
-        self.assertNotIn(self.serializer5.data, res.data)
+        self.assertIn(self.serializer1.data, res.data['results'])
+        self.assertIn(self.serializer2.data, res.data['results'])
+        self.assertIn(self.serializer3.data, res.data['results'])
+        self.assertIn(self.serializer4.data, res.data['results'])
+        self.assertNotIn(self.serializer5.data, res.data['results'])
 
     def test_filter_subcategory(self):
         """Test filter material by subcategory"""
@@ -240,11 +244,11 @@ class FilterMaterialApiTest(TestCase):
             MATERIAL_URL,
             {'scategory': 'non pasted, tape'}
         )
-        self.assertNotIn(self.serializer1.data, res.data)
-        self.assertNotIn(self.serializer2.data, res.data)
-        self.assertNotIn(self.serializer3.data, res.data)
-        self.assertIn(self.serializer4.data, res.data)
-        self.assertIn(self.serializer5.data, res.data)
+        self.assertNotIn(self.serializer1.data, res.data['results'])
+        self.assertNotIn(self.serializer2.data, res.data['results'])
+        self.assertNotIn(self.serializer3.data, res.data['results'])
+        self.assertIn(self.serializer4.data, res.data['results'])
+        self.assertIn(self.serializer5.data, res.data['results'])
 
     def test_filter_active(self):
         """Test filter material by active or not"""
@@ -252,11 +256,11 @@ class FilterMaterialApiTest(TestCase):
             MATERIAL_URL,
             {'active': 'true'}
         )
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertIn(self.serializer2.data, res.data)
-        self.assertNotIn(self.serializer3.data, res.data)
-        self.assertNotIn(self.serializer4.data, res.data)
-        self.assertIn(self.serializer5.data, res.data)
+        self.assertIn(self.serializer1.data, res.data['results'])
+        self.assertIn(self.serializer2.data, res.data['results'])
+        self.assertNotIn(self.serializer3.data, res.data['results'])
+        self.assertNotIn(self.serializer4.data, res.data['results'])
+        self.assertIn(self.serializer5.data, res.data['results'])
 
     def test_filter_invalid_boolean(self):
         """Test invalid boolean value in queryparams fails"""
@@ -282,3 +286,161 @@ class FilterMaterialApiTest(TestCase):
         self.assertEqual(res2.status_code, status.HTTP_200_OK)
         self.assertEqual(res3.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(res4.status_code, status.HTTP_200_OK)
+
+
+class MaterialQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Test material endpoints stay within their query budgets"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_material_list_budget(self):
+        """Test listing materials costs two, with the change versions"""
+        for start, count in [(0, 1), (1, 20)]:
+            for number in range(start, start + count):
+                sample_material(code=f'5-co07-{number:04}')
+
+            with self.assertQueryBudget(2):
+                res = self.client.get(MATERIAL_URL, {'category': 'component'})
+
+            self.assertEqual(len(res.data['results']), start + count)
+
+
+class CachedMaterialApiTests(QueryBudgetMixin, TestCase):
+    """Test caching of the material list responses"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        sample_material()
+        sample_material(code='5-nl02-0002', name='Kashmirblack',
+                        category='rexin')
+
+    def test_equivalent_filters_share_entry(self):
+        """Test reordered filters are answered from the cache"""
+        res1 = self.client.get(MATERIAL_URL,
+                               {'category': 'Rexin,component'})
+
+        with self.assertQueryBudget(1):
+            res2 = self.client.get(MATERIAL_URL,
+                                   {'category': 'component, rexin'})
+
+        self.assertEqual(res1.data['results'], res2.data['results'])
+        self.assertEqual(len(res2.data['results']), 2)
+
+    def test_write_invalidates_cache(self):
+        """Test creating, updating a material invalidates the list"""
+        self.client.get(MATERIAL_URL)
+
+        material = sample_material(code='5-co07-0003', name='m40 red')
+        res1 = self.client.get(MATERIAL_URL)
+        material.name = 'm40 dark red'
+        material.save()
+        res2 = self.client.get(MATERIAL_URL)
+
+        self.assertEqual(len(res1.data['results']), 3)
+        self.assertEqual(res2.data['results'][-1]['name'], 'm40 dark red')
+
+
+class ConditionalMaterialApiTests(QueryBudgetMixin, TestCase):
+    """Test ETag, If-None-Match handling of the material api"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.material = sample_material()
+
+    def test_not_modified(self):
+        """Test a matching ETag is answered with 304 by one query"""
+        res1 = self.client.get(MATERIAL_URL)
+
+        with self.assertQueryBudget(1):
+            res2 = self.client.get(
+                MATERIAL_URL, HTTP_IF_NONE_MATCH=res1['ETag']
+            )
+
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
+        self.assertEqual(res2.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res2['ETag'], res1['ETag'])
+        self.assertFalse(res2.content)
+
+    def test_etag_changes_on_write(self):
+        """Test writing a material changes the ETag of list and detail"""
+        list1 = self.client.get(MATERIAL_URL)
+        detail1 = self.client.get(detail_url(self.material.id))
+
+        self.material.price = 12
+        self.material.save()
+        list2 = self.client.get(MATERIAL_URL,
+                                HTTP_IF_NONE_MATCH=list1['ETag'])
+        detail2 = self.client.get(detail_url(self.material.id),
+                                  HTTP_IF_NONE_MATCH=detail1['ETag'])
+
+        self.assertEqual(list2.status_code, status.HTTP_200_OK)
+        self.assertEqual(detail2.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(list1['ETag'], list2['ETag'])
+        self.assertNotEqual(detail1['ETag'], detail2['ETag'])
+
+    def test_etag_follows_filters(self):
+        """Test equivalent filters share an ETag, others do not"""
+        res1 = self.client.get(MATERIAL_URL, {'category': 'rexin,component'})
+        res2 = self.client.get(MATERIAL_URL, {'category': 'Component,rexin'})
+        res3 = self.client.get(MATERIAL_URL, {'category': 'rexin'})
+
+        self.assertEqual(res1['ETag'], res2['ETag'])
+        self.assertNotEqual(res1['ETag'], res3['ETag'])
+
+    def test_unauthenticated_not_modified_denied(self):
+        """Test authentication is checked before the ETag"""
+        etag = self.client.get(MATERIAL_URL)['ETag']
+        self.client.force_authenticate(None)
+
+        res = self.client.get(MATERIAL_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ExportMaterialApiTests(TestCase):
+    """Test streaming export of the materials"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_export_csv_filtered(self):
+        """Test exporting the filtered materials as csv"""
+        sample_material(code='5-co07-0002', price=10.5)
+        sample_material(code='3-re01-0001', name='Rexin', category='rexin')
+
+        res = self.client.get(MATERIAL_EXPORT_URL, {'category': 'component'})
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines()))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['code'], '5-co07-0002')
+        self.assertEqual(rows[0]['price'], '10.50')
+
+    def test_export_unauth(self):
+        """Test the export requires authentication"""
+        self.client.force_authenticate(None)
+        res = self.client.get(MATERIAL_EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
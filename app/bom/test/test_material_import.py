@@ -0,0 +1,250 @@
+"""
+Tests of the bulk material import.
+"""
+import tempfile
+
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Article, ArticleInfo, Color, Material, Bom, BomLine, \
+                        ChangeVersion, CostChange
+
+from bom import costing, importer
+
+
+IMPORT_URL = reverse('bom:material-import')
+
+SUPPLIER_CSV = """Code,Name,Category,UOM,PurchaseUOM,CF,Price
+3-re01-0001,Rexin,rexin,meter,roll,10,30
+5-co07-0002,M40 Black,Component,nos,nos,1,2.50
+9-pa01-0001,Box Brown,packing,nos,nos,1,4
+"""
+
+
+def upload(content):
+    """Csv file to post"""
+    return SimpleUploadedFile('materials.csv', content.encode(),
+                              content_type='text/csv')
+
+
+class MaterialImportTests(TestCase):
+    """Test importing the material master from csv"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass',
+            is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+        self.rexin = Material.objects.create(
+            code='3-re01-0001', name='Rexin', category='rexin', uom='meter',
+            purchaseuom='roll', cf=10, price=20
+        )
+        self.box = Material.objects.create(
+            code='9-pa01-0001', name='Box Brown', category='packing',
+            uom='nos', purchaseuom='nos', price=4
+        )
+
+        article = Article.objects.create(user=self.user, artno='3290')
+        color = Color.objects.create(user=self.user, code='bk', name='black')
+        self.info = ArticleInfo.objects.create(
+            user=self.user, article=article, color=color, category='g',
+            artid='3290-bk-g'
+        )
+        bom = Bom.objects.create(user=self.user, code='3290-bk-g',
+                                 name='3290 black', articleinfo=self.info)
+        BomLine.objects.create(bom=bom, material=self.rexin, quantity=2)
+
+    def test_import_upserts(self):
+        """Test new codes are created, existing ones updated, recosted"""
+        version = ChangeVersion.objects.versions(Material)
+        res = self.client.post(IMPORT_URL, {'file': upload(SUPPLIER_CSV)})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 1)
+        self.assertEqual(res.data['updated'], 1)
+        self.assertEqual(res.data['unchanged'], 1)
+        self.assertEqual(res.data['errors'], [])
+        self.assertEqual(res.data['recosted'], 1)
+
+        component = Material.objects.get(code='5-co07-0002')
+        self.assertEqual(component.category, 'component')
+        self.assertEqual(component.price, Decimal('2.50'))
+        self.rexin.refresh_from_db()
+        self.assertEqual(self.rexin.price, Decimal('30'))
+        # 2 meter of 30.00 a roll of 10 meter
+        self.info.refresh_from_db()
+        self.assertEqual(self.info.basic, Decimal('6.00'))
+        self.assertNotEqual(ChangeVersion.objects.versions(Material), version)
+
+    def test_import_dry_run(self):
+        """Test a dry run reports the diff without writing"""
+        res = self.client.post(IMPORT_URL + '?dry_run=true',
+                               {'file': upload(SUPPLIER_CSV)})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['code'] for row in res.data['diff']['new']],
+                         ['5-co07-0002'])
+        self.assertEqual(res.data['diff']['changed'], [{
+            'code': '3-re01-0001',
+            'fields': {'price': {'old': Decimal('20.00'),
+                                 'new': Decimal('30.00')}},
+        }])
+        self.assertEqual(res.data['unchanged'], 1)
+        self.assertFalse(Material.objects.filter(code='5-co07-0002').exists())
+        self.rexin.refresh_from_db()
+        self.assertEqual(self.rexin.price, Decimal('20'))
+
+    def test_import_partial_columns(self):
+        """Test columns left out keep the values of the materials"""
+        res = self.client.post(IMPORT_URL, {
+            'file': upload('code,price\n9-pa01-0001,5\n')
+        })
+
+        self.assertEqual(res.data['updated'], 1)
+        self.box.refresh_from_db()
+        self.assertEqual(self.box.price, Decimal('5'))
+        self.assertEqual(self.box.uom, 'nos')
+
+    def test_import_invalid_rows(self):
+        """Test invalid rows are reported by line and skipped"""
+        res = self.client.post(IMPORT_URL, {'file': upload(
+            'code,name,uom,category,price\n'
+            '1-xx01-0001,Thread,spool,,1\n'
+            '1-xx01-0002,Glue,,glue,1\n'
+            '1-xx01-0003,Foam,meter,,abc\n'
+            '1-xx01-0004,,meter,,1\n'
+            '1-xx01-0005,Lace,pairs,,1\n'
+            '1-xx01-0005,Lace,pairs,,1\n'
+        )})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([error.split(':')[0] for error in res.data['errors']],
+                         ['Line 2', 'Line 3', 'Line 4', 'Line 7', 'Line 5'])
+        self.assertEqual(res.data['created'], 1)
+        self.assertTrue(Material.objects.filter(code='1-xx01-0005').exists())
+
+    def test_import_invalid_file(self):
+        """Test a file without code column or file is rejected"""
+        res = self.client.post(IMPORT_URL, {
+            'file': upload('name,colour\nRexin,black\n')
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['file']), 2)
+
+        res = self.client.post(IMPORT_URL, {})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_admin_only(self):
+        """Test non staff users can not import"""
+        self.user.is_staff = False
+        self.user.save()
+
+        res = self.client.post(IMPORT_URL, {'file': upload(SUPPLIER_CSV)})
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_import_chunked(self):
+        """Test chunks import like a single one"""
+        report = importer.import_materials(StringIO(SUPPLIER_CSV),
+                                           chunk_size=1)
+
+        self.assertEqual((report['created'], report['updated'],
+                          report['unchanged']), (1, 1, 1))
+        self.assertEqual(Material.objects.count(), 3)
+
+    def test_recost_recorded_by_material(self):
+        """Test the cost changes are recorded with the material changed"""
+        importer.import_materials(StringIO(SUPPLIER_CSV))
+
+        change = CostChange.objects.get()
+        self.assertEqual(change.articleinfo, self.info)
+        self.assertEqual(change.material, self.rexin)
+        self.assertEqual(change.new_basic, Decimal('6.00'))
+
+    def test_recost_several_materials_unrecorded(self):
+        """Test changes caused by several materials record none of them"""
+        BomLine.objects.create(bom=self.info.bom, material=self.box,
+                               quantity=1)
+
+        importer.import_materials(StringIO(
+            'code,price\n3-re01-0001,30\n9-pa01-0001,5\n'
+        ))
+
+        change = CostChange.objects.get()
+        self.assertIsNone(change.material)
+        # 2 meter of 30.00 a roll of 10 meter, a box of 5.00
+        self.assertEqual(change.new_basic, Decimal('11.00'))
+
+    def test_recost_queries_per_chunk(self):
+        """Test a chunk recosts by the same queries for any changes"""
+        BomLine.objects.create(bom=self.info.bom, material=self.box,
+                               quantity=1)
+        queries = []
+        for prices in ['30,4', '40,6']:
+            rexin, box = prices.split(',')
+            with CaptureQueriesContext(connection) as captured:
+                importer.import_materials(StringIO(
+                    f'code,price\n3-re01-0001,{rexin}\n'
+                    f'9-pa01-0001,{box}\n'
+                ))
+            queries.append(len(captured))
+
+        self.assertEqual(queries[0], queries[1])
+
+    def test_recost_failure_rolled_back(self):
+        """Test prices are not written when their recost fails"""
+        prices = self.rexin.prices.count()
+        with patch.object(costing, 'propagate', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                importer.import_materials(StringIO(SUPPLIER_CSV))
+
+        self.rexin.refresh_from_db()
+        self.assertEqual(self.rexin.price, Decimal('20'))
+        self.assertEqual(self.rexin.prices.count(), prices)
+        self.assertFalse(Material.objects.filter(code='5-co07-0002').exists())
+
+    def test_import_command(self):
+        """Test the command imports a file, or prints its diff"""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as materials:
+            materials.write(SUPPLIER_CSV)
+            materials.flush()
+
+            out = StringIO()
+            call_command('import_materials', materials.name, '--dry-run',
+                         stdout=out)
+            self.assertIn('+ 5-co07-0002', out.getvalue())
+            self.assertIn('~ 3-re01-0001 price: 20.00 -> 30.00',
+                          out.getvalue())
+            self.assertFalse(
+                Material.objects.filter(code='5-co07-0002').exists()
+            )
+
+            call_command('import_materials', materials.name,
+                         stdout=StringIO())
+            self.assertTrue(
+                Material.objects.filter(code='5-co07-0002').exists()
+            )
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as materials:
+            materials.write('name\nRexin\n')
+            materials.flush()
+            with self.assertRaises(CommandError):
+                call_command('import_materials', materials.name,
+                             stdout=StringIO())
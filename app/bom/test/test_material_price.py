@@ -0,0 +1,184 @@
+"""
+Tests of the material price history and the as_of queries.
+"""
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Article, ArticleInfo, Color, Material, \
+                        MaterialPrice, Bom, BomLine
+
+from bom import costing, importer, queries
+
+
+def instant(*args):
+    """Aware datetime"""
+    return timezone.make_aware(datetime(*args))
+
+
+class MaterialPriceTests(TestCase):
+    """Test the price history follows the prices, answers as of queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        # 2.00 a meter since 2025, 2.50 since June 2025, 3.00 now
+        self.rexin = Material.objects.create(
+            code='3-re01-0001', name='Rexin', uom='meter', purchaseuom='roll',
+            cf=10, price=30
+        )
+        for price, effective_from in [(20, instant(2025, 1, 1)),
+                                      (25, instant(2025, 6, 1, 10))]:
+            MaterialPrice.objects.create(material=self.rexin, price=price,
+                                         effective_from=effective_from)
+        self.sole = Material.objects.create(code='4-so01-0001', name='Sole',
+                                            price=45)
+
+        article = Article.objects.create(user=self.user, artno='3290')
+        color = Color.objects.create(user=self.user, code='bk', name='black')
+        self.info = ArticleInfo.objects.create(
+            user=self.user, article=article, color=color, category='g',
+            artid='3290-bk-g'
+        )
+        self.bom = Bom.objects.create(user=self.user, code='3290-bk-g',
+                                      name='3290 black', articleinfo=self.info)
+        BomLine.objects.create(bom=self.bom, material=self.rexin, quantity=2)
+        BomLine.objects.create(bom=self.bom, material=self.sole, quantity=1)
+
+    def test_history_appended(self):
+        """Test new and changed prices are appended, others are not"""
+        self.sole.name = 'PU Sole'
+        self.sole.save()
+        self.sole.price = '47.50'
+        self.sole.save()
+
+        self.assertEqual(
+            list(self.sole.prices.order_by('id').values_list('price',
+                                                             flat=True)),
+            [Decimal('45'), Decimal('47.50')]
+        )
+
+    def test_price_as_of(self):
+        """Test the price of a material as of instants and dates"""
+        for as_of, price in [(instant(2024, 12, 31), None),
+                             (instant(2025, 3, 1), Decimal('20')),
+                             (queries.parse_as_of('2025-06-01'),
+                              Decimal('25')),
+                             (timezone.now(), Decimal('30'))]:
+            self.assertEqual(
+                MaterialPrice.objects.price_as_of(self.rexin.id, as_of), price
+            )
+
+    def test_prices_as_of(self):
+        """Test all prices as of an instant come from a single query"""
+        with self.assertNumQueries(1):
+            prices = MaterialPrice.objects.prices_as_of(instant(2025, 3, 1))
+
+        self.assertEqual(prices, {self.rexin.id: Decimal('20')})
+        self.assertEqual(
+            MaterialPrice.objects.prices_as_of(timezone.now()),
+            {self.rexin.id: Decimal('30'), self.sole.id: Decimal('45')}
+        )
+
+    def test_costing_as_of(self):
+        """Test costs at past prices, unknown while not all were priced"""
+        self.assertEqual(costing.compute_costs(as_of=instant(2025, 3, 1)),
+                         {self.info.id: None})
+        self.assertEqual(costing.compute_costs(), {self.info.id:
+                                                   Decimal('51.00')})
+
+        res = self.client.get(reverse('bom:bom-costs'),
+                              {'as_of': '2025-06-01', 'artid': '3290-bk-g'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'articleinfo': self.info.id,
+                                     'artid': '3290-bk-g',
+                                     'cost': None, 'missing_prices': True}])
+
+        MaterialPrice.objects.create(material=self.sole, price=40,
+                                     effective_from=instant(2025, 1, 1))
+        res = self.client.get(reverse('bom:bom-costs'),
+                              {'as_of': '2025-06-01', 'artid': '3290-bk-g'})
+        self.assertEqual(res.data, [{'articleinfo': self.info.id,
+                                     'artid': '3290-bk-g',
+                                     'cost': Decimal('45.00'),
+                                     'missing_prices': False}])
+
+    def test_update_column_prepares_values(self):
+        """Test values of fields other than decimals are prepared"""
+        price = self.rexin.prices.earliest('effective_from')
+        # 2024-12-31 21:30 UTC
+        effective_from = datetime.fromisoformat('2025-01-01T03:00:00+05:30')
+
+        queries.update_column(MaterialPrice, 'effective_from',
+                              [(price.id, effective_from)])
+
+        self.assertEqual(
+            MaterialPrice.objects.get(id=price.id).effective_from,
+            effective_from
+        )
+        self.assertTrue(MaterialPrice.objects.filter(
+            id=price.id, effective_from__lt=instant(2024, 12, 31, 22)
+        ).exists())
+
+    def test_explode_as_of(self):
+        """Test the explosion has the prices as of ?as_of="""
+        url = reverse('bom:bom-explode', args=[self.bom.id])
+
+        res = self.client.get(url, {'as_of': '2025-03-01T12:00:00'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        prices = {row['code']: row['price'] for row in res.data['materials']}
+        self.assertEqual(prices, {'3-re01-0001': '20.00',
+                                  '4-so01-0001': None})
+
+        res = self.client.get(url, {'as_of': 'last season'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_mrp_as_of(self):
+        """Test the requirement is costed at the prices as of ?as_of="""
+        res = self.client.post(
+            reverse('bom:bom-mrp') + '?as_of=2025-03-01',
+            {'plan': [{'artid': '3290-bk-g', 'pairs': 10}]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['cost'] for row in res.data], ['40.00', None])
+
+    def test_price_api(self):
+        """Test the price endpoints of the materials"""
+        res = self.client.get(
+            reverse('bom:material-price', args=[self.rexin.id]),
+            {'as_of': '2025-06-01'}
+        )
+        self.assertEqual(res.data['price'], Decimal('25'))
+
+        res = self.client.get(reverse('bom:material-prices'),
+                              {'as_of': '2025-01-01'})
+        self.assertEqual(res.data['prices'], [
+            {'material': self.rexin.id, 'price': Decimal('20')}
+        ])
+
+    def test_import_appends_history(self):
+        """Test bulk imported prices are appended to the history"""
+        importer.import_materials(StringIO(
+            'code,name,price\n3-re01-0001,Rexin,32\n5-co07-0002,Buckle,3\n'
+        ))
+
+        prices = MaterialPrice.objects.prices_as_of(timezone.now())
+        buckle = Material.objects.get(code='5-co07-0002')
+        self.assertEqual(prices[self.rexin.id], Decimal('32'))
+        self.assertEqual(prices[buckle.id], Decimal('3'))
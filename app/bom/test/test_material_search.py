@@ -0,0 +1,211 @@
+"""
+Tests of the material search index and the ?q= search of the api.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Material, ChangeVersion
+
+from bom import search
+
+
+MATERIAL_URL = reverse('bom:material-list')
+
+
+class MaterialSearchTests(TestCase):
+    """Test searching materials through the index and the database"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        for code, name, category in [
+                ('5-co07-0002', 'M40 Black', 'component'),
+                ('5-co07-0003', 'Buckle Black', 'component'),
+                ('3-re01-0001', 'Rexin Black', 'rexin'),
+                ('9-pa01-0001', 'Box Brown', 'packing')]:
+            Material.objects.create(code=code, name=name, category=category)
+
+        self.index = search.MaterialIndex(background=False)
+        self.index.warm()
+        patcher = patch.object(search, 'material_index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def codes(self, ids):
+        """Material codes of the ids, in order"""
+        materials = Material.objects.in_bulk(ids)
+        return [materials[pk].code for pk in ids]
+
+    def test_search_ranked(self):
+        """Test code matches rank above name matches"""
+        self.assertEqual(self.codes(self.index.search('5-co07-0002')),
+                         ['5-co07-0002'])
+        self.assertEqual(self.codes(self.index.search('bla')),
+                         ['3-re01-0001', '5-co07-0002', '5-co07-0003'])
+        self.assertEqual(self.codes(self.index.search('co07')),
+                         ['5-co07-0002', '5-co07-0003'])
+        self.assertEqual(self.codes(self.index.search('3-re')),
+                         ['3-re01-0001'])
+
+    def test_search_terms(self):
+        """Test every word of the query has to match, short as prefix"""
+        self.assertEqual(self.codes(self.index.search('black comp')),
+                         ['5-co07-0002', '5-co07-0003'])
+        self.assertEqual(self.codes(self.index.search('b')),
+                         ['3-re01-0001', '5-co07-0002', '5-co07-0003',
+                          '9-pa01-0001'])
+        self.assertEqual(self.index.search('lack x'), [])
+        self.assertEqual(self.index.search('   '), [])
+
+    def test_search_limit(self):
+        """Test the best results are returned up to the limit"""
+        self.assertEqual(self.codes(self.index.search('black', 1)),
+                         ['3-re01-0001'])
+
+    def test_index_follows_signals(self):
+        """Test saved and deleted materials are searched at once"""
+        material = Material.objects.create(code='4-so01-0001',
+                                           name='PU Sole')
+        self.assertEqual(self.index.search('sole'), [material.id])
+
+        material.name = 'TPR Sole'
+        material.save()
+        self.assertEqual(self.index.search('tpr'), [material.id])
+        self.assertEqual(self.index.search('pu s'), [])
+
+        material.delete()
+        self.assertEqual(self.index.search('sole'), [])
+        # Writes of this process do not leave the index stale
+        self.assertEqual(self.index.version,
+                         ChangeVersion.objects.versions(Material)[0])
+
+    def test_updates_copy_on_write(self):
+        """Test updates swap in a new state, postings left exact"""
+        material = Material.objects.get(code='3-re01-0001')
+        state = self.index._state
+
+        material.name = 'Rexin Brown'
+        material.save()
+        material.save()
+
+        self.assertEqual(state.docs[material.id][1], 'rexin black')
+        self.assertIn(material.id, state.grams['bla'])
+        updated = self.index._state
+        self.assertNotIn(material.id, updated.grams['bla'])
+        self.assertEqual(list(updated.grams['bro']).count(material.id), 1)
+        self.assertEqual(list(updated.grams['bro']),
+                         sorted(updated.grams['bro']))
+
+    def test_search_filtered(self):
+        """Test hits are limited to the materials passing the filters"""
+        components = {'category': ['component']}
+
+        self.assertEqual(self.codes(self.index.search('black', 1,
+                                                      components)),
+                         ['5-co07-0002'])
+        self.assertEqual(self.index.search('box', None, components), [])
+        filters = {'name': 'buckle', 'active': True}
+        self.assertEqual(self.codes(self.index.search('bl', None, filters)),
+                         ['5-co07-0003'])
+        self.assertEqual(self.index.search('black', None, {'active': False}),
+                         [])
+
+        material = Material.objects.get(code='5-co07-0003')
+        material.active = False
+        material.save()
+        self.assertEqual(
+            self.codes(self.index.search('black', None, {'active': False})),
+            ['5-co07-0003']
+        )
+
+    def test_index_rebuilt_when_stale(self):
+        """Test changes of other processes are picked up by a rebuild"""
+        Material.objects.filter(code='9-pa01-0001').update(name='Carton')
+        self.assertEqual(self.index.search('carton'), [])
+
+        ChangeVersion.objects.touch(Material)
+        self.index.search('carton')
+
+        self.assertEqual(self.codes(self.index.search('carton')),
+                         ['9-pa01-0001'])
+
+    def test_after_fork(self):
+        """Test a fork taken mid build resets, builds the index again"""
+        forked = search.MaterialIndex(background=False)
+        forked.enabled = True
+        # The build thread, the lock holder of the parent are gone
+        forked._building = True
+        forked._lock.acquire()
+
+        forked.after_fork()
+
+        self.assertEqual(self.codes(forked.search('rexin')), ['3-re01-0001'])
+        state = self.index._state
+        self.index.after_fork()
+        self.assertIs(self.index._state, state)
+
+    def test_api_search(self):
+        """Test ?q= lists materials ranked, keeping other filters"""
+        res = self.client.get(MATERIAL_URL, {'q': 'black'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['code'] for item in res.data['results']],
+                         ['3-re01-0001', '5-co07-0002', '5-co07-0003'])
+
+        res = self.client.get(MATERIAL_URL,
+                              {'q': 'black', 'category': 'component'})
+
+        self.assertEqual([item['code'] for item in res.data['results']],
+                         ['5-co07-0002', '5-co07-0003'])
+
+    def test_api_search_filtered_page(self):
+        """Test filters apply before the ranking, pages follow offset"""
+        Material.objects.filter(code='3-re01-0001').update(active=False)
+        ChangeVersion.objects.touch(Material)
+        params = {'q': 'black', 'active': 'true', 'page_size': 1}
+
+        res = self.client.get(MATERIAL_URL, params)
+
+        self.assertEqual([item['code'] for item in res.data['results']],
+                         ['5-co07-0002'])
+        self.assertIsNone(res.data['previous'])
+        # The change version for the cache, for the index, the page,
+        # the filtered ids are not read
+        with self.assertNumQueries(3):
+            res = self.client.get(res.data['next'])
+        self.assertEqual([item['code'] for item in res.data['results']],
+                         ['5-co07-0003'])
+        self.assertIsNone(res.data['next'])
+        self.assertIsNotNone(res.data['previous'])
+
+        with patch.object(search, 'material_index', search.MaterialIndex()):
+            cold = self.client.get(MATERIAL_URL, dict(params, offset=1))
+        self.assertEqual(cold.data['results'], res.data['results'])
+
+    def test_api_search_offset_invalid(self):
+        """Test a negative or malformed offset is rejected"""
+        for offset in ('-1', 'x'):
+            res = self.client.get(MATERIAL_URL, {'q': 'black',
+                                                 'offset': offset})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_api_search_cold(self):
+        """Test a cold index falls back to the database, same ranking"""
+        warm = self.client.get(MATERIAL_URL, {'q': 'black co'})
+
+        with patch.object(search, 'material_index', search.MaterialIndex()):
+            cold = self.client.get(MATERIAL_URL, {'q': 'black co'})
+
+        self.assertEqual(cold.data['results'], warm.data['results'])
+        self.assertEqual(len(cold.data['results']), 2)
@@ -0,0 +1,134 @@
+"""
+Tests of the material requirements planning.
+"""
+import csv
+import tempfile
+
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Article, ArticleInfo, Color, Material, Bom, BomLine
+
+from bom import queries
+
+
+MRP_URL = reverse('bom:bom-mrp')
+
+
+class MrpTests(TestCase):
+    """Test planning the material requirement of a production plan"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        article = Article.objects.create(user=self.user, artno='3290')
+        color = Color.objects.create(user=self.user, code='bk', name='black')
+        # 25.00 a roll of 10 meter
+        self.rexin = Material.objects.create(
+            code='3-re01-0001', name='Rexin', uom='meter', purchaseuom='roll',
+            cf=10, price=25
+        )
+        self.sole = Material.objects.create(
+            code='4-so01-0001', name='Sole', uom='pairs', purchaseuom='pairs',
+            price='45.50'
+        )
+        upper = Bom.objects.create(user=self.user, code='upper', name='Upper')
+        BomLine.objects.create(bom=upper, material=self.rexin, quantity='0.2')
+
+        self.boms = []
+        for category in ['g', 'l']:
+            info = ArticleInfo.objects.create(
+                user=self.user, article=article, color=color,
+                category=category, artid=f'3290-bk-{category}'
+            )
+            bom = Bom.objects.create(user=self.user, code=info.artid,
+                                     name=info.artid, articleinfo=info)
+            BomLine.objects.create(bom=bom, component=upper, quantity=1)
+            BomLine.objects.create(bom=bom, material=self.sole, quantity=1)
+            self.boms.append(bom)
+
+    def test_mrp_json(self):
+        """Test the plan is aggregated, converted and costed"""
+        plan = [
+            {'artid': '3290-bk-g', 'pairs': 100},
+            {'artid': '3290-bk-l', 'pairs': '50'},
+            {'artid': '3290-bk-g', 'pairs': 50},
+        ]
+        res = self.client.post(MRP_URL, {'plan': plan}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rexin, sole = res.data
+        # 200 pairs * 0.2 meter = 40 meter = 4 rolls of 25.00
+        self.assertEqual(rexin['code'], '3-re01-0001')
+        self.assertEqual(Decimal(rexin['quantity']), Decimal('40'))
+        self.assertEqual(rexin['purchase_quantity'], '4.0000')
+        self.assertEqual(rexin['cost'], '100.00')
+        self.assertEqual(Decimal(sole['quantity']), Decimal('200'))
+        self.assertEqual(sole['cost'], '9100.00')
+
+    def test_mrp_csv(self):
+        """Test the requirement is streamed as csv"""
+        res = self.client.post(MRP_URL + '?output=csv', {
+            'plan': [{'artid': '3290-bk-g', 'pairs': 10}]
+        }, format='json')
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(
+            b''.join(res.streaming_content).decode().splitlines()
+        ))
+        self.assertEqual([row['code'] for row in rows],
+                         ['3-re01-0001', '4-so01-0001'])
+        self.assertEqual(rows[0]['purchase_quantity'], '0.2000')
+
+    def test_mrp_invalid_plan(self):
+        """Test unknown artids and invalid pairs are rejected"""
+        for plan in [[{'artid': '3290-bk-g', 'pairs': -1}],
+                     [{'artid': '3290-bk-g', 'pairs': 'ten'}],
+                     [{'artid': 'nope', 'pairs': 1}],
+                     [], 'plan']:
+            res = self.client.post(MRP_URL, {'plan': plan}, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('plan', res.data)
+
+    def test_explode_many_chunked(self):
+        """Test chunked explosion sums like a single query"""
+        plan = {self.boms[0].id: 3, self.boms[1].id: Decimal('1.5')}
+        rows = queries.explode_many(plan)
+
+        with patch.object(queries, 'CHUNK_SIZE', 1):
+            self.assertEqual(queries.explode_many(plan), rows)
+
+        self.assertEqual(rows[0]['quantity'], Decimal('0.9'))
+
+    def test_mrp_command(self):
+        """Test the mrp command plans a csv file"""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as plan:
+            plan.write('artid,pairs\n3290-bk-g,10\n3290-bk-l,10\n')
+            plan.flush()
+            out = StringIO()
+            call_command('mrp', plan.name, stdout=out)
+
+        rows = list(csv.DictReader(out.getvalue().splitlines()))
+        self.assertEqual(rows[1]['code'], '4-so01-0001')
+        self.assertEqual(rows[1]['cost'], '910.00')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as plan:
+            plan.write('artid,pairs\nnope,10\n')
+            plan.flush()
+            with self.assertRaises(CommandError):
+                call_command('mrp', plan.name, stdout=StringIO())
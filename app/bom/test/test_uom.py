@@ -0,0 +1,145 @@
+"""
+Tests of the uom conversions and the purchase quantity math.
+"""
+import random
+
+from decimal import Decimal
+from fractions import Fraction
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Material, Uom
+
+from bom import importer, uom
+
+
+def rounded(value, places):
+    """Exact fraction rounded half up to places, as Decimal"""
+    scaled, remainder = divmod(value * 10 ** places, 1)
+    if remainder >= Fraction(1, 2):
+        scaled += 1
+    return Decimal(int(scaled)).scaleb(-places)
+
+
+def reference(quantity, cf, price):
+    """Purchase quantity and cost from the exact fractions"""
+    quantity, cf, price = map(Fraction, (quantity, cf, price))
+    return rounded(quantity / cf, 4), rounded(quantity * price / cf, 2)
+
+
+def purchased(quantities, cfs, prices):
+    """Purchase quantities and costs paired"""
+    return list(zip(*uom.purchase(quantities, cfs, prices)))
+
+
+class UomTests(TestCase):
+    """Test the conversion table and the purchase math"""
+
+    def test_table(self):
+        """Test standard conversions, inverses and identities"""
+        self.assertEqual(uom.factor(Uom.KILOGRAM, Uom.GRAM), 1000)
+        self.assertEqual(uom.factor(Uom.GRAM, Uom.KILOGRAM) * 1000, 1)
+        self.assertEqual(uom.factor(Uom.ROLL, Uom.ROLL), 1)
+        with self.assertRaises(uom.ConversionError):
+            uom.factor(Uom.METER, Uom.ROLL)
+
+    def test_table_chains(self):
+        """Test conversions chain through a common uom"""
+        table = uom.compile_table([(Uom.KILOGRAM, Uom.GRAM, 1000),
+                                   (Uom.CONE, Uom.GRAM, 250)])
+
+        self.assertEqual(table[Uom.KILOGRAM, Uom.CONE], 4)
+        self.assertEqual(table[Uom.CONE, Uom.KILOGRAM] * 4, 1)
+
+    def test_default_cf(self):
+        """Test the standard cf, uom units per purchase uom"""
+        self.assertEqual(uom.default_cf(Uom.GRAM, Uom.KILOGRAM),
+                         Decimal('1000'))
+        self.assertEqual(uom.default_cf(Uom.KILOGRAM, Uom.GRAM),
+                         Decimal('0.001'))
+        self.assertIsNone(uom.default_cf(Uom.METER, Uom.ROLL))
+        self.assertIsNone(uom.default_cf('', ''))
+
+    def test_purchase_exact(self):
+        """Test the results are the exact values rounded once"""
+        generator = random.Random(18)
+        quantities, cfs, prices = [], [], []
+        for _ in range(5000):
+            quantities.append(Decimal(generator.randrange(1, 10 ** 12))
+                              .scaleb(-generator.randrange(0, 25)))
+            cfs.append(Decimal(generator.randrange(1, 10 ** 8)).scaleb(-4))
+            prices.append(Decimal(generator.randrange(0, 10 ** 5)).scaleb(-2))
+
+        expected = [reference(*row) for row in zip(quantities, cfs, prices)]
+
+        self.assertEqual(purchased(quantities, cfs, prices), expected)
+
+    def test_purchase_ties(self):
+        """Test halves round up, quantities are not rounded before"""
+        quantities = [Decimal('0.00005'), Decimal('0.00004999999'),
+                      Decimal('1.25'), Decimal('0.125')]
+        cfs = [Decimal('1'), Decimal('1'), Decimal('10'), Decimal('1')]
+        prices = [Decimal('1'), Decimal('1'), Decimal('0.01'), Decimal('1')]
+
+        self.assertEqual(
+            purchased(quantities, cfs, prices),
+            [reference(*row) for row in zip(quantities, cfs, prices)]
+        )
+        self.assertEqual([row[0] for row in purchased(quantities, cfs,
+                                                      prices)][:2],
+                         [Decimal('0.0001'), Decimal('0.0000')])
+
+    def test_purchase_without_cf(self):
+        """Test a cf of 0 has no purchase quantity nor cost"""
+        self.assertEqual(purchased([Decimal('1')], [Decimal('0')],
+                                   [Decimal('1')]), [(None, None)])
+        self.assertEqual(purchased([Decimal('1')], [Decimal('1')], [None]),
+                         [(Decimal('1.0000'), None)])
+
+    def test_new_material_default_cf(self):
+        """Test materials created without cf get the standard one"""
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(
+            'test@kalalokia.xyz', 'testpass', is_staff=True
+        ))
+        url = reverse('bom:material-list')
+
+        res = client.post(url, {'code': '6-ch01-0001', 'name': 'Adhesive',
+                                'uom': 'gram', 'purchaseuom': 'kilogram'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(res.data['cf']), Decimal('1000'))
+
+        res = client.post(url, {'code': '6-ch01-0002', 'name': 'Solvent',
+                                'uom': 'gram', 'purchaseuom': 'kilogram',
+                                'cf': '900'})
+        self.assertEqual(Decimal(res.data['cf']), Decimal('900'))
+
+        # Units without a standard conversion keep the model default
+        res = client.post(url, {'code': '3-re01-0001', 'name': 'Rexin',
+                                'uom': 'meter', 'purchaseuom': 'roll'})
+        self.assertEqual(Decimal(res.data['cf']), Decimal('1'))
+
+        # Updates never change the cf
+        res = client.patch(reverse('bom:material-detail',
+                                   args=[res.data['id']]),
+                           {'uom': 'gram', 'purchaseuom': 'kilogram'})
+        self.assertEqual(Decimal(res.data['cf']), Decimal('1'))
+
+    def test_imported_material_default_cf(self):
+        """Test new imported materials without cf get the standard one"""
+        importer.import_materials(StringIO(
+            'code,name,uom,purchaseuom\n'
+            '6-ch01-0001,Adhesive,gram,kilogram\n'
+            '3-re01-0001,Rexin,meter,roll\n'
+        ))
+
+        self.assertEqual(
+            dict(Material.objects.values_list('code', 'cf')),
+            {'6-ch01-0001': Decimal('1000'), '3-re01-0001': Decimal('1')}
+        )
@@ -0,0 +1,94 @@
+"""
+Unit of measurement conversions and the purchase quantity math of the
+bulk calculations, in Decimal with every result rounded once.
+"""
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+from fractions import Fraction
+from itertools import product
+
+from core.models import Material, Uom
+
+
+# Standard conversions, 1 source uom is factor target uom
+STANDARD = [
+    (Uom.KILOGRAM, Uom.GRAM, 1000),
+]
+
+PURCHASE = Decimal('0.0001')
+COST = Decimal('0.01')
+CF_PLACES = Material._meta.get_field('cf').decimal_places
+# Digits of the purchase math. Products of quantities (up to 70 digits)
+# and prices are exact. The digits of a quotient by a cf (12 digits at
+# most) never repeat a 0 or a 9 more than 12 times unless they end, so
+# 13+ digits past the rounding place round like the exact quotient.
+PRECISION = 80
+
+
+class ConversionError(Exception):
+    """Raised for units without a conversion between them"""
+
+
+def compile_table(standard=STANDARD):
+    """
+    Uom x Uom table of the exact factors converting a quantity of the
+    source uom to the target uom, from the standard conversions,
+    their inverses and their chains.
+    """
+    table = {(uom, uom): Fraction(1) for uom in Uom.values}
+    for source, target, factor in standard:
+        table[source, target] = Fraction(factor)
+        table[target, source] = 1 / Fraction(factor)
+    for via, source, target in product(Uom.values, repeat=3):
+        if (source, via) in table and (via, target) in table:
+            table.setdefault((source, target),
+                             table[source, via] * table[via, target])
+    return table
+
+
+TABLE = compile_table()
+
+
+def factor(source, target):
+    """Exact factor converting source uom quantities to target uom"""
+    try:
+        return TABLE[source, target]
+    except KeyError:
+        raise ConversionError(f'No conversion from {source} to {target}.')
+
+
+def default_cf(uom, purchaseuom):
+    """
+    Standard cf of a material, uom units per purchase uom, or None if
+    the units do not convert or the factor does not fit in cf.
+    """
+    try:
+        cf = factor(purchaseuom, uom)
+    except ConversionError:
+        return None
+    scaled = cf * 10 ** CF_PLACES
+    if scaled.denominator != 1:
+        return None
+    return Decimal(scaled.numerator).scaleb(-CF_PLACES)
+
+
+def purchase(quantities, cfs, prices):
+    """
+    Purchase quantities (quantity / cf) and costs (quantity * price / cf)
+    of Decimal quantities, cfs and prices, each rounded half up once from
+    the exact value, to PURCHASE and COST. None for a cf of 0, which has
+    no conversion, no cost for a price of None.
+    """
+    purchase_quantities = []
+    costs = []
+    with localcontext() as context:
+        context.prec = PRECISION
+        context.rounding = ROUND_HALF_UP
+        for quantity, cf, price in zip(quantities, cfs, prices):
+            if cf:
+                purchase_quantities.append((quantity / cf).quantize(PURCHASE))
+                costs.append(None if price is None
+                             else (quantity * price / cf).quantize(COST))
+            else:
+                purchase_quantities.append(None)
+                costs.append(None)
+    return purchase_quantities, costs
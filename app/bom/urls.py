@@ -5,14 +5,25 @@ main url: host/api/bom
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from core.asyncviews import async_routes
+
 from bom import views
 
 
 router = DefaultRouter()
 router.register('materials', views.MaterialViewSet)
+router.register('boms', views.BomViewSet)
+router.register('lines', views.BomLineViewSet)
+router.register('cost-changes', views.CostChangeViewSet)
 
 app_name = 'bom'
 
 urlpatterns = [
+    path('compare/', views.BomCompareView.as_view(), name='compare'),
     path('', include(router.urls))
 ]
+
+# Read heavy routes served by async views in the ASGI deployment
+ASYNC_ROUTES = ('material-list',)
+
+async_urlpatterns = async_routes(urlpatterns, ASYNC_ROUTES)
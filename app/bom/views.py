@@ -1,28 +1,65 @@
 """
-Viewpoint of api/material
+Viewpoint of api/bom
 """
+import csv
+import io
+
+from decimal import Decimal, InvalidOperation
+
 from rest_framework import viewsets
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from django.db.models import DecimalField, F, Q, Sum
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+
+from core.authentication import CachedTokenAuthentication
+from core.mixins import QueryPlanMixin, CachedListMixin, \
+                        ConditionalGetMixin, FastListMixin, ExportMixin, \
+                        ReplicaReadMixin, ProtectedDestroyMixin, Echo
+from core.models import Material, MaterialPrice, ArticleInfo, Bom, BomLine, \
+                        CostChange
 
-from django.http import Http404
+from bom import serializers, queries, costing, mrp, search, importer
 
-from core.models import Material
 
-from bom import serializers
+def as_of_param(request):
+    """Instant of the ?as_of= parameter, None when not given"""
+    value = request.query_params.get('as_of', '')
+    if not value.strip():
+        return None
+    try:
+        return queries.parse_as_of(value)
+    except ValueError:
+        raise ValidationError({'as_of': 'Enter a date or a datetime.'})
 
 
-class MaterialViewSet(viewsets.ModelViewSet):
+class MaterialViewSet(ConditionalGetMixin, CachedListMixin, ReplicaReadMixin,
+                      FastListMixin, ExportMixin, ProtectedDestroyMixin,
+                      QueryPlanMixin, viewsets.ModelViewSet):
     """Manage materials in the databse"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     queryset = Material.objects.all()
     serializer_class = serializers.MaterialSerializer
+    ordering = 'id'
+    cache_models = (Material,)
+    list_params = ('category', 'scategory')
+    export_fields = tuple((field, field) for field in (
+        'code', 'name', 'category', 'subcategory', 'uom', 'purchaseuom',
+        'cf', 'price', 'active'
+    ))
 
     def get_permissions(self):
         """
         Setting permissions for the List, Retrieve, Create & Update
         """
-        if self.action == 'list' or self.action == 'retrieve':
+        if self.action in ('list', 'retrieve', 'export', 'where_used',
+                           'price', 'prices'):
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [IsAdminUser]
@@ -76,3 +113,415 @@ class MaterialViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(active=active)
 
         return queryset
+
+    def search_filters(self):
+        """
+        Filters of the query params as get_queryset() applies them, for
+        the search index
+        """
+        params = self.request.query_params
+        filters = {}
+        for field, param in (('code', 'code'), ('name', 'name')):
+            if params.get(param):
+                filters[field] = params[param]
+        for field, param in (('category', 'category'),
+                             ('subcategory', 'scategory')):
+            if params.get(param):
+                filters[field] = self._params_to_list(params[param])
+        if params.get('active'):
+            filters['active'] = self._params_to_boolean(params['active'])
+        return filters
+
+    def list(self, request, *args, **kwargs):
+        """
+        List materials, ranked by relevance when searched by ?q=,
+        paged by ?offset= within the ranking
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            offset = -1
+        if offset < 0:
+            raise ValidationError({'offset': 'Enter a whole number.'})
+        size = self.paginator.get_page_size(request)
+
+        # Ranked among the filtered materials only, filtered in memory by
+        # the index. One extra tells whether there is a next page
+        queryset = self.get_queryset()
+        ids = search.material_index.search(query, offset + size + 1,
+                                           self.search_filters())
+        if ids is None:
+            ids = self.search_database(queryset, query, offset + size + 1)
+
+        page = ids[offset:offset + size]
+        materials = queryset.in_bulk(page)
+        serializer = self.get_serializer(
+            [materials[pk] for pk in page if pk in materials], many=True
+        )
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'offset', offset + size)
+            if len(ids) > offset + size else None,
+            'previous': None if not offset else
+            replace_query_param(url, 'offset', max(offset - size, 0)),
+            'results': serializer.data
+        })
+
+    def search_database(self, queryset, query, limit):
+        """
+        Ranked ids of the materials of the queryset matching the query
+        like the search index does, for a cold index
+        """
+        terms = search.normalize(query).split()
+        for term in terms:
+            queryset = queryset.filter(
+                Q(code__icontains=term) | Q(name__icontains=term)
+                | Q(category__icontains=term) | Q(subcategory__icontains=term)
+            )
+        hits = []
+        for row in queryset.values_list('id', *search.FIELDS):
+            doc = tuple(search.normalize(value) for value in row[1:])
+            key = search.rank(terms, doc, row[0])
+            if key is not None:
+                hits.append((key, row[0]))
+        return [pk for _, pk in sorted(hits)[:limit]]
+
+    @action(detail=False, methods=['post'], url_path='import',
+            url_name='import')
+    def import_csv(self, request):
+        """
+        Upsert materials on code from an uploaded csv file, streamed in
+        chunks. With ?dry_run=true nothing is written, the report has
+        the diff of new and changed materials instead.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'Upload a csv file.'})
+        dry_run = self._params_to_boolean(
+            request.query_params.get('dry_run', 'false')
+        )
+
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig',
+                                  newline='')
+        try:
+            report = importer.import_materials(stream, dry_run=dry_run)
+        except importer.ImportFileError as error:
+            raise ValidationError({'file': error.errors})
+        except UnicodeDecodeError:
+            raise ValidationError({'file': 'Expected an utf-8 csv file.'})
+
+        return Response(report)
+
+    @action(detail=True)
+    def price(self, request, pk=None):
+        """Price of the material as of ?as_of=, now by default"""
+        material = self.get_object()
+        as_of = as_of_param(request) or timezone.now()
+
+        return Response({
+            'material': material.id,
+            'code': material.code,
+            'as_of': as_of,
+            'price': MaterialPrice.objects.price_as_of(material.id, as_of),
+        })
+
+    @action(detail=False)
+    def prices(self, request):
+        """
+        Price of every material as of ?as_of=, now by default,
+        resolved from the price history by a single query.
+        """
+        as_of = as_of_param(request) or timezone.now()
+        prices = MaterialPrice.objects.prices_as_of(as_of)
+
+        return Response({
+            'as_of': as_of,
+            'prices': [{'material': material, 'price': price}
+                       for material, price in sorted(prices.items())],
+        })
+
+    @action(detail=True, url_path='where-used')
+    def where_used(self, request, pk=None):
+        """
+        Article infos using the material, directly or through sub
+        assemblies, with the quantity consumed per pair. Answered from
+        the bom closure by a single query.
+        """
+        material = self.get_object()
+        link = 'bom__ancestor_links'
+        used_in = BomLine.objects.filter(
+            material=material,
+            **{f'{link}__ancestor__articleinfo__isnull': False}
+        ).values(
+            articleinfo=F(f'{link}__ancestor__articleinfo'),
+            artid=F(f'{link}__ancestor__articleinfo__artid'),
+        ).annotate(
+            quantity=Sum(F('quantity') * F(f'{link}__quantity'),
+                         output_field=DecimalField())
+        ).order_by('artid')
+
+        return Response({
+            'material': material.id,
+            'code': material.code,
+            'used_in': serializers.WhereUsedSerializer(
+                used_in, many=True
+            ).data,
+        })
+
+
+class BomViewSet(ProtectedDestroyMixin, QueryPlanMixin,
+                 viewsets.ModelViewSet):
+    """Manage boms in the database"""
+    authentication_classes = (CachedTokenAuthentication,)
+    queryset = Bom.objects.all()
+    serializer_class = serializers.BomSerializer
+    ordering = 'id'
+
+    def get_permissions(self):
+        """
+        Setting permissions for the List, Retrieve, Explode & others
+        """
+        if self.action in ('list', 'retrieve', 'explode', 'mrp', 'costs'):
+            permission_classes = [IsAuthenticated]
+        else:
+            permission_classes = [IsAdminUser]
+        return [permission() for permission in permission_classes]
+
+    def get_queryset(self):
+        """Filter boms by code or by the artid of its variant"""
+        queryset = self.queryset
+
+        code = self.request.query_params.get('code')
+        artid = self.request.query_params.get('artid')
+
+        if code:
+            queryset = queryset.filter(code__icontains=code)
+        if artid:
+            queryset = queryset.filter(articleinfo__artid=artid.strip())
+
+        return queryset.order_by(self.ordering)
+
+    def get_serializer_class(self):
+        """Return appropriate serializer"""
+        if self.action == 'retrieve':
+            return serializers.BomDetailSerializer
+
+        return self.serializer_class
+
+    def perform_create(self, serializer):
+        """Create a new bom"""
+        serializer.save(user=self.request.user)
+
+    @action(detail=True)
+    def explode(self, request, pk=None):
+        """
+        Flattened material requirement of the bom for ?quantity= pairs,
+        computed over all sub assembly levels by a single query.
+        Prices are the ones as of ?as_of= when given.
+        """
+        bom = self.get_object()
+        as_of = as_of_param(request)
+        try:
+            quantity = Decimal(request.query_params.get('quantity', '1'))
+        except InvalidOperation:
+            quantity = None
+        if quantity is None or not quantity.is_finite() or quantity <= 0:
+            raise ValidationError({'quantity': 'Enter a positive number.'})
+
+        try:
+            materials = queries.explode(bom.id, quantity, as_of)
+        except queries.BomDepthError as error:
+            raise ValidationError(str(error))
+
+        return Response({
+            'bom': bom.id,
+            'code': bom.code,
+            'quantity': quantity,
+            'materials': serializers.ExplosionSerializer(
+                materials, many=True
+            ).data,
+        })
+
+    @action(detail=False, methods=['post'])
+    def mrp(self, request):
+        """
+        Material requirement of a production plan posted as
+        {"plan": [{"artid": ..., "pairs": ...}, ...]}, in purchase uom
+        and costed, at the prices as of ?as_of= when given.
+        Responds JSON, or streams CSV with ?output=csv.
+        """
+        output = request.query_params.get('output', 'json').strip().lower()
+        if output not in ('csv', 'json'):
+            raise ValidationError({'output': 'Use one of csv, json.'})
+        as_of = as_of_param(request)
+
+        lines = request.data.get('plan') if hasattr(request.data, 'get') \
+            else None
+        if not isinstance(lines, list):
+            raise ValidationError({'plan': 'Expected a list of lines.'})
+        try:
+            plan = mrp.parse_plan(
+                (line.get('artid', ''), line.get('pairs', ''))
+                if isinstance(line, dict) else ('', '')
+                for line in lines
+            )
+            rows = mrp.requirements(plan, as_of)
+        except mrp.PlanError as error:
+            raise ValidationError({'plan': error.errors})
+        except queries.BomDepthError as error:
+            raise ValidationError(str(error))
+
+        data = serializers.RequirementSerializer(rows, many=True).data
+        if output == 'json':
+            return Response(data)
+
+        fields = list(serializers.RequirementSerializer().fields)
+        writer = csv.writer(Echo())
+        content = (writer.writerow(row) for row in [fields] + [
+            [row[field] for field in fields] for row in data
+        ])
+        response = StreamingHttpResponse(content, content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="mrp.csv"'
+        return response
+
+    @action(detail=False)
+    def costs(self, request):
+        """
+        Cost per pair of the article infos having a bom, at the prices as
+        of ?as_of= (current prices by default), without writing basic.
+        Restricted to the comma separated ?artid= when given. Costs using
+        materials not priced yet as of ?as_of= are null, missing_prices.
+        Boms nested deeper than the depth limit fail with bad request.
+        """
+        as_of = as_of_param(request)
+        infos = ArticleInfo.objects.filter(bom__isnull=False)
+        artids = request.query_params.get('artid')
+        if artids:
+            infos = infos.filter(artid__in=[
+                artid.strip() for artid in artids.split(',')
+            ])
+        infos = dict(infos.values_list('id', 'artid'))
+
+        try:
+            costs = costing.compute_costs(list(infos) if artids else None,
+                                          as_of)
+        except queries.BomDepthError as error:
+            raise ValidationError(str(error))
+        return Response([
+            {'articleinfo': pk, 'artid': infos[pk], 'cost': cost,
+             'missing_prices': cost is None}
+            for pk, cost in sorted(costs.items()) if pk in infos
+        ])
+
+    @action(detail=False, methods=['post'])
+    def recost(self, request):
+        """
+        Recompute basic cost of every article info having a bom,
+        reporting the rows costed, changed and the time taken.
+        """
+        return Response(costing.recost())
+
+
+class BomLineViewSet(QueryPlanMixin, viewsets.ModelViewSet):
+    """Manage bom lines in the database"""
+    authentication_classes = (CachedTokenAuthentication,)
+    queryset = BomLine.objects.all()
+    serializer_class = serializers.BomLineSerializer
+    ordering = 'id'
+
+    def get_permissions(self):
+        """
+        Setting permissions for the List, Retrieve, Create & Update
+        """
+        if self.action == 'list' or self.action == 'retrieve':
+            permission_classes = [IsAuthenticated]
+        else:
+            permission_classes = [IsAdminUser]
+        return [permission() for permission in permission_classes]
+
+    def get_queryset(self):
+        """Filter lines by their bom"""
+        queryset = self.queryset
+
+        bom = self.request.query_params.get('bom')
+        if bom:
+            if not bom.strip().isdigit():
+                raise Http404("Something went wrong")
+            queryset = queryset.filter(bom_id=int(bom))
+
+        return queryset.order_by(self.ordering)
+
+
+class CostChangeViewSet(QueryPlanMixin, viewsets.ReadOnlyModelViewSet):
+    """List the basic cost changes written by the costing engine"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    queryset = CostChange.objects.all()
+    serializer_class = serializers.CostChangeSerializer
+    ordering = '-id'
+
+    def get_queryset(self):
+        """Filter the changes by artid or material"""
+        queryset = self.queryset
+
+        artid = self.request.query_params.get('artid')
+        material = self.request.query_params.get('material')
+
+        if artid:
+            queryset = queryset.filter(articleinfo__artid=artid.strip())
+        if material:
+            if not material.strip().isdigit():
+                raise Http404("Something went wrong")
+            queryset = queryset.filter(material_id=int(material))
+
+        return queryset.order_by(self.ordering)
+
+
+class BomCompareView(APIView):
+    """
+    Compare the exploded bom of variant ?a= against the variants ?b=
+    (comma separated): materials added, removed and changed quantities
+    per pair, for all of them in one query.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        base = request.query_params.get('a', '').strip()
+        others = [artid.strip() for artid
+                  in request.query_params.get('b', '').split(',')
+                  if artid.strip()]
+        if not base or not others:
+            raise ValidationError('Provide an artid a, and artids b.')
+
+        artids = sorted(set(others) | {base})
+        boms = {}
+        for i in range(0, len(artids), queries.CHUNK_SIZE):
+            boms.update(Bom.objects.filter(
+                articleinfo__artid__in=artids[i:i + queries.CHUNK_SIZE]
+            ).values_list('articleinfo__artid', 'id'))
+        missing = [artid for artid in artids if artid not in boms]
+        if missing:
+            raise ValidationError(
+                [f'No bom for artid {artid}.' for artid in missing]
+            )
+
+        try:
+            diffs = queries.compare(boms[base],
+                                    [boms[artid] for artid in others])
+        except queries.BomDepthError as error:
+            raise ValidationError(str(error))
+
+        comparisons = []
+        for artid in dict.fromkeys(others):
+            diff = diffs.get(boms[artid], {})
+            comparisons.append({'b': artid, **{
+                change: serializers.CompareSerializer(
+                    diff.get(change, []), many=True
+                ).data for change in ('added', 'removed', 'changed')
+            }})
+        return Response({'a': base, 'comparisons': comparisons})
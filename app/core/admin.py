@@ -31,3 +31,8 @@ admin.site.register(models.Color)
 admin.site.register(models.Article)
 admin.site.register(models.ArticleInfo)
 admin.site.register(models.Material)
+admin.site.register(models.Bom)
+admin.site.register(models.BomLine)
+admin.site.register(models.CostChange)
+admin.site.register(models.BomClosure)
+admin.site.register(models.MaterialPrice)
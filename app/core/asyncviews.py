@@ -0,0 +1,57 @@
+"""
+Async views of the api, served by the ASGI deployment
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.db import close_old_connections
+from django.urls import URLPattern, URLResolver
+
+from core.middleware import count_queries
+
+
+def to_async(view):
+    """
+    Async view running a sync view in a worker thread of its own, with
+    its own database connection. Under ASGI, Django runs the sync views
+    one at a time on a single thread; these run side by side while the
+    event loop keeps accepting requests.
+    """
+    def run(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            with count_queries() as stats:
+                response = view(request, *args, **kwargs)
+                if callable(getattr(response, 'render', None)):
+                    response.render()
+            if stats is not None:
+                stats.report(response)
+            return response
+        finally:
+            close_old_connections()
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False)(
+            request, *args, **kwargs
+        )
+
+    return async_view
+
+
+def async_routes(urlpatterns, names):
+    """Copy of the urlpatterns, the routes with these names async"""
+    routes = []
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(
+                pattern.pattern,
+                async_routes(pattern.url_patterns, names),
+                pattern.default_kwargs, pattern.app_name, pattern.namespace
+            )
+        elif pattern.name in names:
+            pattern = URLPattern(pattern.pattern, to_async(pattern.callback),
+                                 pattern.default_args, pattern.name)
+        routes.append(pattern)
+    return routes
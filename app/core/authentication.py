@@ -0,0 +1,135 @@
+"""
+Authentication of the api
+"""
+import copy
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+
+# Cache key of the revocation generation of every token
+GENERATION_KEY = 'auth:tokens:generation'
+
+
+def revocation_key(key):
+    """Cache key of the revocation generation of a token"""
+    return f'auth:tokens:{key}'
+
+
+class TokenCache:
+    """
+    Tokens of the process by key, with their user, least recently used
+    first. Entries expire after settings.TOKEN_CACHE_TTL seconds, at
+    most settings.TOKEN_CACHE_SIZE are kept. Revocations are published
+    as a new generation, of every token or of given ones, in the default
+    cache. Entries cached at an earlier generation are no hits anymore,
+    in every process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: (token, expiry, generation)
+        self.entries = OrderedDict()
+
+    def current(self, key):
+        """
+        Revocation generation of the token in the default cache, of
+        every token and of this one, read before looking it up
+        """
+        values = cache.get_many([GENERATION_KEY, revocation_key(key)])
+        return (values.get(GENERATION_KEY), values.get(revocation_key(key)))
+
+    def get(self, key, generation=None):
+        """
+        Cached token of the key, None when missing, expired or cached at
+        another generation than the given one
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if (entry[1] <= time.monotonic()
+                    or generation is not None and entry[2] != generation):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, token, generation):
+        """
+        Cache a token looked up at the generation, evicting the least
+        recently used. Revocations coming meanwhile moved the generation,
+        the entry is no hit then.
+        """
+        if settings.TOKEN_CACHE_SIZE <= 0:
+            return
+        expiry = time.monotonic() + settings.TOKEN_CACHE_TTL
+        with self.lock:
+            self.entries[token.key] = (token, expiry, generation)
+            self.entries.move_to_end(token.key)
+            while len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def revoke(self, keys=None):
+        """
+        Drop the tokens of the keys, every token by default, in every
+        process sharing the default cache
+        """
+        generation = uuid.uuid4().hex
+        if keys is None:
+            cache.set(GENERATION_KEY, generation, None)
+            self.clear()
+            return
+        keys = list(keys)
+        # Outlives the entries cached before
+        cache.set_many({revocation_key(key): generation for key in keys},
+                       settings.TOKEN_CACHE_TTL)
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        """Drop every token of this process"""
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def _clone(instance):
+    """Copy of a model instance with a state of its own"""
+    clone = copy.copy(instance)
+    clone._state = copy.copy(instance._state)
+    clone._state.fields_cache = {}
+    return clone
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication looking the tokens up in the token cache first.
+    Deleted tokens and users saved with a new password, active or staff
+    flag revoke their cached tokens (core.signals): at once in this
+    process, on their next request in processes sharing the default
+    cache, after settings.TOKEN_CACHE_TTL at most in the others.
+    Bulk writes send no signals, QuerySet.update() of users, raw sql
+    have to be followed by token_cache.revoke().
+    """
+
+    def authenticate_credentials(self, key):
+        generation = token_cache.current(key)
+        token = token_cache.get(key, generation)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(token, generation)
+        # Requests get copies, changes to them stay with the request
+        user = _clone(token.user)
+        token = _clone(token)
+        token.user = user
+        return (user, token)
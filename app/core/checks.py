@@ -0,0 +1,30 @@
+"""
+System checks of the settings
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+# Caches kept by each process, not seen by the other workers
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pins(app_configs, **kwargs):
+    """
+    Replicas need a cache shared by the workers: the pin of a write
+    made through one worker has to keep the reads of the other workers
+    on the primary (core.db.routers.pin)
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DATABASE_REPLICAS and backend in PROCESS_CACHES:
+        return [Error(
+            'DATABASE_REPLICAS need a cache shared by the workers.',
+            hint=f'The default cache is a {backend.rsplit(".", 1)[-1]}, '
+                 'set CACHE_DIR or DB_REPLICA_HOSTS= (no replicas).',
+            id='core.E001',
+        )]
+    return []
@@ -0,0 +1,92 @@
+"""
+PostgreSQL backend handing connections back to a pool of the process
+instead of closing them. Configured by the "POOL" key of the database
+settings, {'MAX_SIZE', 'MAX_CONNECTIONS', 'TIMEOUT', 'MAX_LIFETIME',
+'HEALTH_CHECK'}, leave it out for the plain Django backend.
+"""
+from django.db.backends.postgresql import base, creation
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from core.db import pool
+
+
+def check(connection):
+    """Whether a psycopg2 connection still answers"""
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except base.Database.Error:
+        return False
+    return True
+
+
+def reset(connection):
+    """
+    Roll back, end the session state of a psycopg2 connection (settings,
+    temporary tables, prepared statements, advisory locks), whether it
+    can be reused
+    """
+    try:
+        if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        # DISCARD ALL cannot run in a transaction
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute('DISCARD ALL')
+    except base.Database.Error:
+        return False
+    return True
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Test databases are dropped without pooled connections to them"""
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        pool.close_all()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Pooled PostgreSQL connections"""
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return super().get_new_connection(conn_params)
+
+        self.pool = pool.get_pool(
+            (self.alias, tuple(sorted(conn_params.items()))),
+            max_size=options.get('MAX_SIZE', 10),
+            max_connections=options.get('MAX_CONNECTIONS'),
+            timeout=options.get('TIMEOUT', 30),
+            max_lifetime=options.get('MAX_LIFETIME'),
+            health_check=options.get('HEALTH_CHECK', 0),
+            check=check,
+        )
+        try:
+            connection = self.pool.acquire(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params
+                )
+            )
+        except pool.PoolTimeout as error:
+            raise base.Database.OperationalError(str(error)) from error
+        # Set by get_new_connection for new connections
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+
+        connection = self.connection
+        reusable = not connection.closed and reset(connection)
+        self.pool.release(connection, reusable)
@@ -0,0 +1,184 @@
+"""
+Pools of database connections kept open across requests, per process
+"""
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """No connection of the pool freed up in time"""
+
+
+class ConnectionPool:
+    """
+    Idle connections of one database, handed out again instead of
+    connecting anew. Connections idle for more than health_check seconds
+    are checked before reuse, connections older than max_lifetime
+    seconds are closed instead of reused, and at most max_size idle
+    connections are kept. At most max_connections are open, idle or in
+    use; acquire waits up to timeout seconds for one to free up.
+    """
+
+    def __init__(self, max_size=10, max_connections=None, timeout=30,
+                 max_lifetime=None, health_check=0, check=None):
+        self.max_size = max_size
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+        self.check = check
+        self.lock = threading.Condition()
+        # (connection, idle since), the most recently used last
+        self.idle = []
+        # Opening time of every connection open, in use or idle
+        self.born = {}
+        # Connections being opened, counted against max_connections
+        self.connecting = 0
+        self.counters = dict.fromkeys(
+            ('opened', 'reused', 'failed', 'recycled', 'closed', 'timeouts'),
+            0
+        )
+
+    def count(self, counter):
+        """Increment a counter"""
+        with self.lock:
+            self.counters[counter] += 1
+
+    def expired(self, connection, now):
+        """Whether the connection outlived max_lifetime"""
+        return (self.max_lifetime is not None
+                and now - self.born[connection] >= self.max_lifetime)
+
+    def full(self):
+        """Whether max_connections are open, the lock held"""
+        return (self.max_connections is not None
+                and len(self.born) + self.connecting >= self.max_connections)
+
+    def acquire(self, connect):
+        """
+        An idle connection passing the checks, or connect() while under
+        max_connections. Raises PoolTimeout when none frees up in time.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.lock:
+                while not self.idle and self.full():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'{self.max_connections} connections in use '
+                            f'for {self.timeout}s'
+                        )
+                    self.lock.wait(remaining)
+                if not self.idle:
+                    self.connecting += 1
+                    break
+                connection, since = self.idle.pop()
+            now = time.monotonic()
+            if self.expired(connection, now):
+                self.discard(connection, 'recycled')
+            elif (self.check is not None
+                  and now - since >= self.health_check
+                  and not self.check(connection)):
+                self.discard(connection, 'failed')
+            else:
+                self.count('reused')
+                return connection
+
+        try:
+            connection = connect()
+        except Exception:
+            with self.lock:
+                self.connecting -= 1
+                self.counters['failed'] += 1
+                self.lock.notify()
+            raise
+        with self.lock:
+            self.connecting -= 1
+            self.born[connection] = time.monotonic()
+            self.counters['opened'] += 1
+        return connection
+
+    def release(self, connection, reusable=True):
+        """Put a connection back, or close it"""
+        now = time.monotonic()
+        with self.lock:
+            if (reusable and len(self.idle) < self.max_size
+                    and not self.expired(connection, now)):
+                self.idle.append((connection, now))
+                self.lock.notify()
+                return
+        self.discard(connection, 'closed')
+
+    def discard(self, connection, counter):
+        """Close a connection of the pool"""
+        with self.lock:
+            self.born.pop(connection, None)
+            self.counters[counter] += 1
+            self.lock.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close the idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self.discard(connection, 'closed')
+
+    def stats(self):
+        """Counters, the number of idle and in use connections"""
+        with self.lock:
+            return {**self.counters, 'idle': len(self.idle),
+                    'in_use': len(self.born) - len(self.idle)}
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+# Connections of the parent process, never used nor closed by its forks
+inherited = []
+
+
+def get_pool(key, **options):
+    """The pool of the key, created with options on first use"""
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(**options)
+        return pools[key]
+
+
+def close_all():
+    """Close the idle connections of every pool"""
+    with pools_lock:
+        all_pools = list(pools.values())
+    for pool in all_pools:
+        pool.close()
+
+
+def stats():
+    """Counters of every pool summed up"""
+    with pools_lock:
+        all_pools = list(pools.values())
+    total = {}
+    for pool in all_pools:
+        for counter, value in pool.stats().items():
+            total[counter] = total.get(counter, 0) + value
+    return total
+
+
+def forget_pools():
+    """
+    Drop the pools inherited by a forked process. Their connections
+    share sockets with the parent, which closing them would end.
+    """
+    inherited.extend(pools.values())
+    pools.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=forget_pools)
@@ -0,0 +1,150 @@
+"""
+Routing of the reads to the read replicas of the primary database
+"""
+import hashlib
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+# Set while the reads of the current request may go to the replicas
+reading = ContextVar('replica_reading', default=False)
+
+# Seconds the replica is behind, 0 when not replaying (a primary),
+# NULL when it does not stream from the primary: its replay timestamp
+# stops moving while disconnected, unlike the lag
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                     WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+@contextmanager
+def replica_reads():
+    """Send the reads to the replicas meanwhile"""
+    token = reading.set(True)
+    try:
+        yield
+    finally:
+        reading.reset(token)
+
+
+def pin_key(request):
+    """Cache key pinning the token of the request, None without token"""
+    words = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(words) != 2 or words[0].lower() != 'token':
+        return None
+    return f'replica:pin:{hashlib.sha1(words[1].encode()).hexdigest()}'
+
+
+def pin(request):
+    """
+    Keep the reads of the token on the primary for a while, in every
+    worker: the default cache is a shared one (check core.E001)
+    """
+    key = pin_key(request)
+    if key is not None:
+        cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+
+
+def pinned(request):
+    """Whether the token of the request wrote recently"""
+    key = pin_key(request)
+    return key is not None and cache.get(key, False)
+
+
+class ReplicaMonitor:
+    """
+    Replicas lagging at most settings.REPLICA_MAX_LAG seconds, their
+    lag measured at most every settings.REPLICA_CHECK_INTERVAL seconds
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = None
+        self.available = []
+
+    def lag(self, alias):
+        """
+        Seconds the replica is behind, None when unreachable or not
+        streaming from the primary
+        """
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(LAG_SQL)
+                    lag, = cursor.fetchone()
+                    return None if lag is None else float(lag)
+                cursor.execute('SELECT 1')
+                return 0.0
+        except DatabaseError:
+            return None
+
+    def check(self):
+        """Measure the lag of every replica"""
+        available = []
+        for alias in settings.DATABASE_REPLICAS:
+            lag = self.lag(alias)
+            if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+                available.append(alias)
+        self.available = available
+
+    def due(self):
+        """Whether the lags are to be measured again"""
+        return (self.checked is None or time.monotonic() - self.checked
+                >= settings.REPLICA_CHECK_INTERVAL)
+
+    def healthy(self):
+        """
+        Replicas to read from. One thread measures the lags when due,
+        the others go on with the last ones unless there are none yet.
+        """
+        if self.due() and self.lock.acquire(blocking=self.checked is None):
+            try:
+                if self.due():
+                    self.check()
+                    self.checked = time.monotonic()
+            finally:
+                self.lock.release()
+        return self.available
+
+
+monitor = ReplicaMonitor()
+
+
+class ReplicaRouter:
+    """
+    Reads made under replica_reads() go to a healthy replica of
+    settings.DATABASE_REPLICAS, any other query to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not reading.get() or not settings.DATABASE_REPLICAS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return None
+        replicas = monitor.healthy()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
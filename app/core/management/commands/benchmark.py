@@ -0,0 +1,449 @@
+import asyncio
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from itertools import product
+from string import ascii_lowercase, digits
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from core.mixins import values_plan, render_values
+from core.models import Article, ArticleInfo, ArticleCatalog, Color, \
+                        Category, Material, MaterialPrice, Bom, BomLine, \
+                        categorize
+
+from article.serializers import ArticleInfoSerializer
+from bom import queries, costing, mrp, search, importer, uom
+from bom.serializers import MaterialSerializer
+
+
+class Rollback(Exception):
+    """Raised for discarding the benchmark data"""
+
+
+class Command(BaseCommand):
+    """
+    Django command to benchmark the bulk code paths of the api.
+    Sample data is created inside a transaction which is rolled back,
+    except for the scenarios querying from other threads, which commit
+    it and delete it afterwards.
+    """
+    help = 'Benchmark bulk code paths, sample data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios())
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[100, 1000],
+            help='Sample sizes to run the scenario with'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Worker threads serving the requests of "serve"'
+        )
+
+    @classmethod
+    def scenarios(cls):
+        """Benchmarks are the "bench_<scenario>" methods"""
+        return [name[6:] for name in dir(cls) if name.startswith('bench_')]
+
+    def handle(self, *args, **options):
+        bench = getattr(self, f"bench_{options['scenario']}")
+        self.workers = options['workers']
+
+        for rows in options['rows']:
+            if getattr(bench, 'commits', False):
+                self.user = get_user_model().objects.create_user(
+                    'benchmark@kalalokia.xyz'
+                )
+                try:
+                    bench(rows)
+                finally:
+                    self.user.delete()
+                continue
+            try:
+                with transaction.atomic():
+                    self.user = get_user_model().objects.create_user(
+                        'benchmark@kalalokia.xyz'
+                    )
+                    bench(rows)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def measure(self, label, rows, func, *args, **kwargs):
+        """Run func, reporting its round trips and duration"""
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            duration = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{label:<32} rows={rows:<8} queries={len(queries):<6} '
+            f'time={duration * 1000:.1f}ms'
+        )
+        return result
+
+    def sample_colors(self, count):
+        """Create colors with two character codes not yet in use"""
+        used = set(Color.objects.values_list('code', flat=True))
+        codes = (
+            code for code in map(''.join, product(ascii_lowercase + digits,
+                                                  repeat=2))
+            if code not in used
+        )
+        Color.objects.bulk_create(
+            Color(user=self.user, code=code, name=f'~bench {i}')
+            for i, code in zip(range(count), codes)
+        )
+        return list(Color.objects.filter(name__startswith='~bench '))
+
+    def sample_variants(self, articles, colors):
+        """Create a variant for every article, color and category"""
+        categories = Category.values
+        ArticleInfo.objects.bulk_create(
+            ArticleInfo(
+                user=self.user, article=article, color=color,
+                category=category, mcategory=categorize(category),
+                artid=f'{article.artno}-{color.code}-{category}'
+            )
+            for article, color, category in product(articles, colors,
+                                                    categories)
+        )
+
+    def sample_articles(self, count):
+        """Create articles with distinct art numbers"""
+        Article.objects.bulk_create(
+            Article(user=self.user, artno=f'~{i}') for i in range(count)
+        )
+        return list(Article.objects.filter(artno__startswith='~'))
+
+    def bench_artids(self, rows):
+        """Regenerating artids after renaming an article, recoding a color"""
+        per_item = len(Category.values)
+        article, *others = self.sample_articles(-(-rows // per_item) + 1)
+        color, *colors = self.sample_colors(-(-rows // per_item) + 1)
+        # One article in every color, one color on every article
+        self.sample_variants([article], colors)
+        self.sample_variants(others, [color])
+
+        def rename():
+            article.artno = '~new'
+            article.save()
+            ArticleInfo.objects.filter(article=article).regenerate_artids()
+
+        def recode():
+            color.code = '~~'
+            color.save()
+            ArticleInfo.objects.filter(color=color).regenerate_artids()
+
+        self.measure('rename article', article.items.count(), rename)
+        self.measure('recode color', color.articleinfo_set.count(), recode)
+
+    def bench_explode(self, rows):
+        """Exploding a 6 level bom holding rows lines in total"""
+        levels = 6
+        Material.objects.bulk_create(
+            Material(code=f'~{i}', name=f'benchmark {i}', uom='nos')
+            for i in range(rows)
+        )
+        materials = list(Material.objects.filter(code__startswith='~'))
+        Bom.objects.bulk_create(
+            Bom(user=self.user, code=f'~{level}', name=f'benchmark {level}')
+            for level in range(levels)
+        )
+        boms = list(Bom.objects.filter(code__startswith='~').order_by('id'))
+
+        lines = [BomLine(bom=parent, component=child, quantity=2)
+                 for parent, child in zip(boms, boms[1:])]
+        lines += [BomLine(bom=boms[i % levels], material=material,
+                          quantity='0.5')
+                  for i, material in enumerate(materials)]
+        BomLine.objects.bulk_create(lines)
+
+        self.measure('explode bom', len(lines), queries.explode, boms[0].id)
+
+    def sample_boms(self, rows):
+        """
+        Create rows variants with a bom each, holding lines of materials
+        and a shared upper sub assembly
+        """
+        per_item = len(Category.values)
+        articles = self.sample_articles(-(-rows // per_item))
+        self.sample_variants(articles, self.sample_colors(1))
+        Material.objects.bulk_create(
+            Material(code=f'~{i}', name=f'benchmark {i}', cf='2.5000',
+                     price='10.25', uom='meter', purchaseuom='roll')
+            for i in range(8)
+        )
+        materials = list(Material.objects.filter(code__startswith='~'))
+        upper = Bom.objects.create(user=self.user, code='~upper',
+                                   name='benchmark upper')
+
+        infos = ArticleInfo.objects.filter(article__artno__startswith='~')
+        Bom.objects.bulk_create(
+            Bom(user=self.user, code=f'~{pk}', name='benchmark',
+                articleinfo_id=pk)
+            for pk in infos.values_list('pk', flat=True)
+        )
+        lines = [BomLine(bom=upper, material=material, quantity='0.125')
+                 for material in materials[:5]]
+        for bom in Bom.objects.filter(articleinfo__in=infos):
+            lines.append(BomLine(bom=bom, component=upper, quantity=2))
+            lines += [BomLine(bom=bom, material=material, quantity='1.5')
+                      for material in materials[5:]]
+        BomLine.objects.bulk_create(lines, batch_size=5000)
+        return infos, materials
+
+    def bench_recost(self, rows):
+        """Costing rows variants, each with lines and a shared upper"""
+        infos, materials = self.sample_boms(rows)
+
+        count = infos.count()
+        self.measure('recost catalog', count, costing.recost)
+        self.measure('recost unchanged', count, costing.recost)
+
+        # Every variant uses the upper, the worst case of a price change
+        Material.objects.filter(pk=materials[0].pk).update(price='11.00')
+        self.measure('propagate price change', count, costing.propagate,
+                     [materials[0].pk])
+
+        # A price a month over two years for every material
+        start = timezone.now() - timedelta(days=730)
+        MaterialPrice.objects.bulk_create(
+            MaterialPrice(material=material, price=10 + month % 7,
+                          effective_from=start + timedelta(days=30 * month))
+            for material in materials for month in range(24)
+        )
+        as_of = start + timedelta(days=365)
+        self.measure('prices as of', len(materials) * 24,
+                     MaterialPrice.objects.prices_as_of, as_of)
+        self.measure('cost catalog as of', count, costing.compute_costs,
+                     as_of=as_of)
+
+    def bench_compare(self, rows):
+        """Comparing a variant bom against the rows other variants"""
+        infos, _ = self.sample_boms(rows)
+        base, *others = Bom.objects.filter(
+            articleinfo__in=infos
+        ).order_by('id').values_list('id', flat=True)
+
+        self.measure('compare one', 1, queries.compare, base, others[:1])
+        self.measure('compare many', len(others), queries.compare, base,
+                     others)
+
+    def bench_mrp(self, rows):
+        """Planning a production plan of rows lines over 1000 variants"""
+        infos, _ = self.sample_boms(1000)
+        artids = list(infos.values_list('artid', flat=True))
+        lines = [(artids[i % len(artids)], 1 + i % 50) for i in range(rows)]
+
+        self.measure('mrp plan', rows,
+                     lambda: mrp.requirements(mrp.parse_plan(lines)))
+
+    def bench_search(self, rows):
+        """Building the material search index, searching it"""
+        words = ['black', 'brown', 'tan', 'rexin', 'buckle', 'sole', 'pu',
+                 'eva', 'lining', 'thread', 'box', 'label', 'nylon', 'mesh']
+        Material.objects.bulk_create(
+            Material(code=f'~{i % 9}-{words[i % 14][:2]}{i % 97:02}-{i:05}',
+                     name=f'{words[i % 14]} {words[i * 7 % 13]} {i % 500}',
+                     category='component', subcategory=words[i % 5])
+            for i in range(rows)
+        )
+        index = search.MaterialIndex(background=False)
+
+        self.measure('build search index', rows, index.warm)
+        for query in ['bla', 'black sole 42', 'b', '~3-bo', 'nomatch']:
+            self.measure(f'search {query!r}', rows, index.search, query, 100)
+
+    def bench_import(self, rows):
+        """Importing a material csv: creating, dry run, price changes"""
+        def sample_csv(price):
+            header = 'code,name,category,uom,purchaseuom,cf,price\n'
+            return StringIO(header + ''.join(
+                f'~{i:06},benchmark {i},component,meter,roll,10,{price}\n'
+                for i in range(rows)
+            ))
+
+        self.measure('import new', rows, importer.import_materials,
+                     sample_csv(10))
+        self.measure('import dry run', rows, importer.import_materials,
+                     sample_csv(12), dry_run=True)
+        self.measure('import unchanged', rows, importer.import_materials,
+                     sample_csv(10))
+        self.measure('import price change', rows, importer.import_materials,
+                     sample_csv(12))
+
+    def bench_uom(self, rows):
+        """Purchase quantities and costs, as the mrp computes them"""
+        quantities = [Decimal(i % 9973).scaleb(-3) for i in range(rows)]
+        cfs = [Decimal(1 + i % 997).scaleb(-1) for i in range(rows)]
+        prices = [Decimal(i % 99991).scaleb(-2) for i in range(rows)]
+
+        self.measure('purchase', rows, uom.purchase, quantities, cfs, prices)
+
+    def bench_serializers(self, rows):
+        """Rendering lists through the serializers against values() rows"""
+        per_item = len(Category.values)
+        articles = self.sample_articles(-(-rows // per_item))
+        self.sample_variants(articles, self.sample_colors(1))
+        Material.objects.bulk_create(
+            Material(code=f'~{i}', name=f'benchmark {i}', cf='1.5000',
+                     price='10.25', uom='meter', purchaseuom='roll')
+            for i in range(rows)
+        )
+        renderer = JSONRenderer()
+
+        for serializer_class, queryset in [
+                (MaterialSerializer, Material.objects.order_by('id')),
+                (ArticleInfoSerializer, ArticleInfo.objects.order_by('id'))]:
+            label = serializer_class.__name__
+            count = queryset.count()
+            plan = values_plan(serializer_class())
+            lookups = {lookup for _, lookup, _ in plan}
+
+            slow = self.measure(
+                f'{label}', count,
+                lambda: renderer.render(
+                    serializer_class(queryset.all(), many=True).data
+                )
+            )
+            fast = self.measure(
+                f'{label} values()', count,
+                lambda: renderer.render(
+                    render_values(plan, queryset.values(*lookups))
+                )
+            )
+            if slow != fast:
+                self.stderr.write(f'{label} output differs')
+
+    def bench_serve(self, rows):
+        """
+        Concurrent read requests over rows variants and materials,
+        served by WSGI and ASGI at the same number of worker threads
+        """
+        per_item = len(Category.values)
+        articles = self.sample_articles(-(-rows // per_item))
+        self.sample_variants(articles, self.sample_colors(1))
+        infos = ArticleInfo.objects.filter(user=self.user)
+        ArticleCatalog.objects.sync(infos)
+        Material.objects.bulk_create(
+            Material(code=f'~{i}', name=f'benchmark sole {i}')
+            for i in range(rows)
+        )
+        token = Token.objects.create(user=self.user)
+        headers = {'authorization': f'Token {token.key}'}
+        pk = infos.order_by('id').values_list('id', flat=True).first()
+        paths = [
+            ('/api/article/items/', ''),
+            ('/api/article/articles/', 'category=g'),
+            (f'/api/article/articles/{pk}/', ''),
+            ('/api/bom/materials/', 'q=sole 42'),
+        ] * 50
+
+        try:
+            with override_settings(API_CACHE_TIMEOUT=0,
+                                   ALLOWED_HOSTS=['localhost']):
+                for label, urlconf, serve in [
+                        ('wsgi', None, self.serve_wsgi),
+                        ('asgi, sync views', None, self.serve_asgi),
+                        ('asgi, async views', 'app.urls_async',
+                         self.serve_asgi)]:
+                    with override_settings(ASYNC_URLCONF=urlconf):
+                        self.measure_serve(label, rows, serve, paths,
+                                           headers)
+        finally:
+            infos.delete()
+            Article.objects.filter(user=self.user).delete()
+            Color.objects.filter(user=self.user).delete()
+            Material.objects.filter(code__startswith='~').delete()
+
+    bench_serve.commits = True
+
+    def measure_serve(self, label, rows, serve, paths, headers):
+        """Serve the requests, reporting the throughput"""
+        start = time.perf_counter()
+        statuses = serve(paths, headers)
+        duration = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{label:<32} rows={rows:<8} workers={self.workers:<4} '
+            f'requests={len(paths):<6} time={duration * 1000:.1f}ms '
+            f'rps={len(paths) / duration:.0f}'
+        )
+        if set(statuses) != {200}:
+            self.stderr.write(f'{label} failed: {sorted(set(statuses))}')
+
+    def serve_wsgi(self, paths, headers):
+        """Status codes of the requests served by WSGI worker threads"""
+        handler = WSGIHandler()
+
+        def request(path):
+            path, query = path
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path,
+                'QUERY_STRING': query, 'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+                'wsgi.input': StringIO(),
+            }
+            environ.update(
+                (f"HTTP_{name.upper().replace('-', '_')}", value)
+                for name, value in headers.items()
+            )
+            status = []
+            response = handler(environ, lambda line, *args: status.append(
+                int(line.split()[0])
+            ))
+            response.close()
+            return status[0]
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(request, paths))
+
+    def serve_asgi(self, paths, headers):
+        """
+        Status codes of the requests served by ASGI, all at once, with
+        workers threads for the sync code
+        """
+        handler = ASGIHandler()
+        scope_headers = [(b'host', b'localhost')] + [
+            (name.encode(), value.encode()) for name, value in headers.items()
+        ]
+
+        async def request(path):
+            path, query = path
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'},
+                'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': path, 'query_string': query.encode(),
+                'headers': scope_headers, 'server': ('localhost', 80),
+            }
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                messages.append(message)
+
+            await handler(scope, receive, send)
+            return messages[0]['status']
+
+        async def serve():
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(self.workers)
+            )
+            return await asyncio.gather(*map(request, paths))
+
+        return asyncio.run(serve())
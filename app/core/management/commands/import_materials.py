@@ -0,0 +1,60 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bom import importer
+
+
+class Command(BaseCommand):
+    """
+    Django command to upsert the material master from a supplier CSV file,
+    matching materials on code.
+    """
+    help = 'Import materials from a CSV file, updating them by code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Materials CSV file, - for stdin')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report new and changed materials without writing them'
+        )
+        parser.add_argument('--chunk-size', type=int,
+                            default=importer.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        try:
+            if options['file'] == '-':
+                report = importer.import_materials(
+                    sys.stdin, dry_run, options['chunk_size']
+                )
+            else:
+                with open(options['file'], newline='',
+                          encoding='utf-8-sig') as stream:
+                    report = importer.import_materials(
+                        stream, dry_run, options['chunk_size']
+                    )
+        except (OSError, UnicodeDecodeError) as error:
+            raise CommandError(error)
+        except importer.ImportFileError as error:
+            raise CommandError('\n'.join(error.errors))
+
+        if dry_run:
+            for values in report['diff']['new']:
+                self.stdout.write(f"+ {values['code']}")
+            for change in report['diff']['changed']:
+                fields = ', '.join(
+                    f"{field}: {diff['old']} -> {diff['new']}"
+                    for field, diff in change['fields'].items()
+                )
+                self.stdout.write(f"~ {change['code']} {fields}")
+        for error in report['errors']:
+            self.stderr.write(error)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would create' if dry_run else 'Created'} "
+            f"{report['created']}, update {report['updated']}, "
+            f"unchanged {report['unchanged']}, "
+            f"errors {len(report['errors'])}, "
+            f"recosted {report['recosted']} in {report['duration_ms']}ms"
+        ))
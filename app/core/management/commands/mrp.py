@@ -0,0 +1,63 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.utils.encoders import JSONEncoder
+
+from bom import mrp
+from bom.queries import BomDepthError, parse_as_of
+from bom.serializers import RequirementSerializer
+
+
+class Command(BaseCommand):
+    """
+    Django command to plan the material requirement of a production plan,
+    a CSV file of artid, pairs lines with a header row.
+    """
+    help = 'Material requirement of a production plan CSV (artid, pairs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan', help='Plan CSV file, - for stdin')
+        parser.add_argument('--output', choices=['csv', 'json'],
+                            default='csv')
+        parser.add_argument('--as-of',
+                            help='Cost at the prices as of a date/datetime')
+
+    def read_plan(self, stream):
+        """Plan lines of the CSV, skipping its header"""
+        reader = csv.reader(stream)
+        next(reader, None)
+        return mrp.parse_plan((row + ['', ''])[:2] for row in reader if row)
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            try:
+                as_of = parse_as_of(options['as_of'])
+            except ValueError as error:
+                raise CommandError(error)
+
+        try:
+            if options['plan'] == '-':
+                plan = self.read_plan(sys.stdin)
+            else:
+                with open(options['plan'], newline='') as stream:
+                    plan = self.read_plan(stream)
+            rows = mrp.requirements(plan, as_of)
+        except OSError as error:
+            raise CommandError(error)
+        except mrp.PlanError as error:
+            raise CommandError('\n'.join(error.errors))
+        except BomDepthError as error:
+            raise CommandError(error)
+
+        data = RequirementSerializer(rows, many=True).data
+        if options['output'] == 'json':
+            self.stdout.write(json.dumps(data, cls=JSONEncoder))
+            return
+
+        fields = list(RequirementSerializer().fields)
+        writer = csv.writer(self.stdout, lineterminator='\n')
+        writer.writerow(fields)
+        writer.writerows([row[field] for field in fields] for row in data)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from core.models import ArticleInfo
+
+from bom.costing import recost
+
+
+class Command(BaseCommand):
+    """Django command to roll material costs up into ArticleInfo.basic"""
+    help = 'Recompute basic cost of the article infos from their boms'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'artids', nargs='*',
+            help='Artids to recost, the whole catalog by default'
+        )
+
+    def handle(self, *args, **options):
+        articleinfo_ids = None
+        if options['artids']:
+            articleinfo_ids = ArticleInfo.objects.filter(
+                artid__in=options['artids']
+            ).values_list('pk', flat=True)
+
+        report = recost(articleinfo_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Costed {report['costed']} article infos, "
+            f"changed {report['changed']} in {report['duration_ms']}ms"
+        ))
+        if report['skipped']:
+            self.stderr.write(
+                f"Skipped {len(report['skipped'])} article infos, "
+                f"cost unknown, over the basic limit or boms nested too "
+                f"deep: {report['skipped']}"
+            )
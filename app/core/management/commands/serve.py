@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from gunicorn.app.base import BaseApplication
+
+from core.db import pool
+
+from bom.search import material_index
+
+
+def pre_fork(server, worker):
+    """Fork without the database connections of the master"""
+    connections.close_all()
+    pool.close_all()
+
+
+def post_fork(server, worker):
+    """Reset the state the fork copied from the master"""
+    material_index.after_fork()
+
+
+class Server(BaseApplication):
+    """Gunicorn serving an application loaded beforehand"""
+
+    def __init__(self, application, config):
+        self.application = application
+        self.config = config
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.config.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+class Command(BaseCommand):
+    """
+    Django command to serve the api by pre-forked gunicorn workers.
+    The master loads the application and builds the search index once,
+    workers share them copy-on-write and start right away.
+    Signals to the master: HUP replaces the workers gracefully, USR2
+    starts a new master on new code (then WINCH, QUIT the old one),
+    TERM shuts down gracefully.
+    """
+    help = 'Serve the api by pre-forked gunicorn workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bind', default='0.0.0.0:8000',
+            help='Address to listen on'
+        )
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='Serve app.asgi by uvicorn workers instead of app.wsgi, '
+                 'with async views if ASYNC_VIEWS=1'
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            default=int(os.environ.get('WEB_CONCURRENCY', 0))
+            or multiprocessing.cpu_count() * 2 + 1,
+            help='Worker processes, $WEB_CONCURRENCY or 2 per cpu + 1'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Threads of every WSGI worker'
+        )
+        parser.add_argument(
+            '--max-requests', type=int, default=1000,
+            help='Requests a worker serves before it is replaced, 0 never'
+        )
+        parser.add_argument(
+            '--max-requests-jitter', type=int, default=100,
+            help='Random extra requests, workers are not replaced at once'
+        )
+        parser.add_argument(
+            '--timeout', type=int, default=30,
+            help='Seconds a silent worker is given before it is killed'
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=int, default=30,
+            help='Seconds workers are given to finish on reload, shutdown'
+        )
+        parser.add_argument(
+            '--pid', help='File to write the pid of the master to'
+        )
+
+    def config(self, options):
+        """Gunicorn settings of the options"""
+        config = {
+            'bind': options['bind'],
+            'workers': options['workers'],
+            'threads': options['threads'],
+            'max_requests': options['max_requests'],
+            'max_requests_jitter': options['max_requests_jitter'],
+            'timeout': options['timeout'],
+            'graceful_timeout': options['graceful_timeout'],
+            'pidfile': options['pid'],
+            'preload_app': True,
+            'pre_fork': pre_fork,
+            'post_fork': post_fork,
+        }
+        if options['asgi']:
+            config['worker_class'] = 'uvicorn.workers.UvicornWorker'
+        elif options['threads'] > 1:
+            config['worker_class'] = 'gthread'
+        return config
+
+    def load_application(self, asgi):
+        """The application, with its search index built"""
+        module = import_module('app.asgi' if asgi else 'app.wsgi')
+        material_index.wait()
+        return module.application
+
+    def handle(self, *args, **options):
+        application = self.load_application(options['asgi'])
+        Server(application, self.config(options)).run()
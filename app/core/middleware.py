@@ -0,0 +1,141 @@
+"""
+Middlewares for the api
+"""
+import asyncio
+import time
+
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.utils.functional import classproperty
+
+from core.db import pool, routers
+
+
+class QueryStats:
+    """Execute wrapper counting queries and the time spent running them"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+    def report(self, response):
+        """Add the counts, the connection pool counters to the headers"""
+        response['X-DB-Query-Count'] = str(self.count)
+        response['X-DB-Query-Time'] = f'{self.duration * 1000:.3f}ms'
+        pool_stats = pool.stats()
+        if pool_stats:
+            response['X-DB-Pool'] = ' '.join(
+                f'{counter}={value}' for counter, value in pool_stats.items()
+            )
+
+
+@contextmanager
+def count_queries():
+    """
+    QueryStats of the queries run by this thread meanwhile, None while
+    settings.DEBUG_SQL_HEADERS is off
+    """
+    if not getattr(settings, 'DEBUG_SQL_HEADERS', False):
+        yield None
+        return
+
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+class QueryCountMiddleware:
+    """
+    Report the number of queries and the database time of each request
+    in the "X-DB-Query-Count", "X-DB-Query-Time" response headers, the
+    connection pool counters of the process in "X-DB-Pool".
+    Only active while settings.DEBUG_SQL_HEADERS is on.
+
+    Sync only, under ASGI it runs on the thread of the sync views, which
+    run their queries. Async with settings.ASYNC_URLCONF, not to hold
+    that thread: the async views (core.asyncviews) report their own.
+    """
+    sync_capable = True
+
+    @classproperty
+    def async_capable(cls):
+        return bool(settings.ASYNC_URLCONF)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance as a coroutine function, like Django does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.get_response(request)
+
+        with count_queries() as stats:
+            response = self.get_response(request)
+        if stats is not None:
+            stats.report(response)
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Pin the token of every successful write to the primary database for
+    settings.REPLICA_PIN_SECONDS, its own writes are read back even
+    while the replicas lag behind.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def process(self, request, response):
+        """Pin after unsafe requests which did not fail"""
+        if (request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+                and response.status_code < 400):
+            routers.pin(request)
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+
+class AsyncViewsMiddleware:
+    """
+    Route the requests of the ASGI handler by settings.ASYNC_URLCONF
+    when set, which serves the read heavy endpoints by async views.
+    Other requests are routed by ROOT_URLCONF.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if settings.ASYNC_URLCONF and isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASYNC_URLCONF
+        return self.get_response(request)
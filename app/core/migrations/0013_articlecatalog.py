@@ -0,0 +1,48 @@
+# Generated by Django 3.1.14 on 2026-10-17 11:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_catalog(apps, schema_editor):
+    """Fill the catalog from the existing article infos"""
+    ArticleInfo = apps.get_model('core', 'ArticleInfo')
+    ArticleCatalog = apps.get_model('core', 'ArticleCatalog')
+
+    rows = ArticleInfo.objects.values_list(
+        'id', 'article__artno', 'color__name', 'mcategory', 'price', 'active'
+    )
+    ArticleCatalog.objects.bulk_create(
+        ArticleCatalog(
+            articleinfo_id=pk, artno=artno, color=color,
+            mcategory=mcategory, price=price, active=active
+        )
+        for pk, artno, color, mcategory, price, active in rows.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_auto_20201012_1549'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleCatalog',
+            fields=[
+                ('articleinfo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog', serialize=False, to='core.articleinfo')),
+                ('artno', models.CharField(max_length=6)),
+                ('color', models.CharField(max_length=25)),
+                ('mcategory', models.CharField(max_length=10)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='material',
+            name='uom',
+            field=models.CharField(blank=True, choices=[('pairs', 'Pair'), ('kilogram', 'Kilogram'), ('meter', 'Meter'), ('cone', 'Cone'), ('roll', 'Roll'), ('nos', 'Nos'), ('gram', 'Gram')], max_length=15),
+        ),
+        migrations.RunPython(populate_catalog, migrations.RunPython.noop),
+    ]
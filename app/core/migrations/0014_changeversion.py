@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-17 11:19
+
+from django.db import migrations, models
+import uuid
+
+
+def create_versions(apps, schema_editor):
+    """Initial change versions of the versioned models"""
+    ChangeVersion = apps.get_model('core', 'ChangeVersion')
+    ChangeVersion.objects.bulk_create(
+        ChangeVersion(name=name)
+        for name in ['core.article', 'core.color', 'core.articleinfo',
+                     'core.material']
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_articlecatalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('version', models.UUIDField(default=uuid.uuid4)),
+            ],
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
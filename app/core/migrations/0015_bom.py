@@ -0,0 +1,49 @@
+# Generated by Django 3.1.14 on 2026-10-17 11:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_versions(apps, schema_editor):
+    """Initial change versions of the bom models"""
+    ChangeVersion = apps.get_model('core', 'ChangeVersion')
+    ChangeVersion.objects.bulk_create(
+        [ChangeVersion(name=name) for name in ['core.bom', 'core.bomline']],
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_changeversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bom',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=30, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('articleinfo', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bom', to='core.articleinfo')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BomLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('bom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='core.bom')),
+                ('component', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='used_in', to='core.bom')),
+                ('material', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='bom_lines', to='core.material')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bomline',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('component__isnull', True), ('material__isnull', False)), models.Q(('component__isnull', False), ('material__isnull', True)), _connector='OR'), name='bomline_material_or_component'),
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-17 11:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_bom'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CostChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_basic', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('new_basic', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('articleinfo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cost_changes', to='core.articleinfo')),
+                ('material', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cost_changes', to='core.material')),
+            ],
+        ),
+    ]
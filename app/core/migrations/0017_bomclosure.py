@@ -0,0 +1,59 @@
+# Generated by Django 3.1.14 on 2026-10-17 11:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BACKFILL_SQL = """
+WITH RECURSIVE closure (ancestor_id, descendant_id, quantity, depth) AS (
+    SELECT id, id, CAST(1 AS NUMERIC), 0 FROM core_bom
+    UNION ALL
+    SELECT closure.ancestor_id, line.component_id,
+           closure.quantity * line.quantity, closure.depth + 1
+    FROM closure
+    JOIN core_bomline line ON line.bom_id = closure.descendant_id
+    WHERE line.component_id IS NOT NULL AND closure.depth < 16
+)
+SELECT ancestor_id, descendant_id, SUM(quantity), COUNT(*)
+FROM closure
+GROUP BY ancestor_id, descendant_id
+"""
+
+
+def backfill_closure(apps, schema_editor):
+    """Closure of the boms created before it"""
+    BomClosure = apps.get_model('core', 'BomClosure')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(BACKFILL_SQL)
+        rows = cursor.fetchall()
+
+    BomClosure.objects.bulk_create(
+        (BomClosure(ancestor_id=ancestor, descendant_id=descendant,
+                    quantity=quantity, paths=paths)
+         for ancestor, descendant, quantity, paths in rows),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_costchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BomClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=8, max_digits=24)),
+                ('paths', models.PositiveIntegerField(default=1)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='core.bom')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='core.bom')),
+            ],
+            options={
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.14 on 2026-10-17 12:04
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Prices known before the history are taken as held since ever
+EARLIEST = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def backfill_prices(apps, schema_editor):
+    """History row of the current price of every material"""
+    Material = apps.get_model('core', 'Material')
+    MaterialPrice = apps.get_model('core', 'MaterialPrice')
+    MaterialPrice.objects.bulk_create(
+        (MaterialPrice(material_id=pk, price=price, effective_from=EARLIEST)
+         for pk, price in Material.objects.values_list('id', 'price')),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_bomclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialPrice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('effective_from', models.DateTimeField(default=django.utils.timezone.now)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='core.material')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='materialprice',
+            index=models.Index(fields=['material', 'effective_from'], name='core_materi_materia_a15e12_idx'),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,500 @@
+"""
+Mixins shared by the api viewsets
+"""
+import csv
+import hashlib
+import json
+
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Prefetch, ProtectedError, QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from core.db import routers
+from core.models import ChangeVersion
+
+
+def _plan(model, serializer):
+    """
+    Walk the fields of a serializer for the given model.
+    Returns select_related paths, Prefetch objects and the field names
+    for only(), which is None when the whole row may be needed.
+    """
+    select, prefetch, only = [], [], {model._meta.pk.name}
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            only = None
+            continue
+
+        source_attrs = field.source_attrs
+        name = source_attrs[0]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Property or method, can touch anything on the instance
+            only = None
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            field = field.child
+        elif isinstance(field, ManyRelatedField):
+            field = field.child_relation
+
+        if not model_field.is_relation:
+            if only is not None:
+                only.add(name)
+            continue
+
+        if model_field.concrete and only is not None:
+            only.add(name)
+        related_model = model_field.related_model
+
+        if isinstance(field, serializers.BaseSerializer):
+            rel_select, rel_prefetch, rel_only = _plan(related_model, field)
+        elif isinstance(field, RelatedField) or len(source_attrs) > 1:
+            if (isinstance(field, RelatedField) and
+                    len(source_attrs) == 1 and
+                    not model_field.many_to_many and
+                    not model_field.one_to_many and
+                    field.use_pk_only_optimization()):
+                # Primary key is available on the row itself
+                continue
+            rel_select, rel_prefetch, rel_only = [], [], None
+        else:
+            continue
+
+        if model_field.many_to_many or model_field.one_to_many:
+            queryset = related_model._default_manager.all()
+            if rel_only is not None and model_field.one_to_many:
+                # Prefetching matches rows on the reverse foreign key
+                rel_only.add(model_field.field.name)
+            queryset = _apply(queryset, rel_select, rel_prefetch, rel_only)
+            prefetch.append(Prefetch(name, queryset=queryset))
+        else:
+            select.append(name)
+            select.extend(f'{name}__{path}' for path in rel_select)
+            prefetch.extend(
+                Prefetch(f'{name}__{lookup.prefetch_through}',
+                         queryset=lookup.queryset)
+                for lookup in rel_prefetch
+            )
+
+    return select, prefetch, only
+
+
+def _apply(queryset, select, prefetch, only):
+    """Apply a planned select_related, prefetch_related, only()"""
+    seen = {
+        lookup if isinstance(lookup, str) else lookup.prefetch_to
+        for lookup in queryset._prefetch_related_lookups
+    }
+    prefetch = [
+        lookup for lookup in prefetch if lookup.prefetch_to not in seen
+    ]
+
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only is not None:
+        queryset = queryset.only(*only)
+    return queryset
+
+
+def plan_queryset(queryset, serializer):
+    """
+    Add the select_related, prefetch_related and only() needed for
+    rendering the queryset through the serializer, so the query count
+    does not grow with the number of rows or nested items.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    return _apply(queryset, *_plan(queryset.model, serializer))
+
+
+class QueryPlanMixin:
+    """
+    Viewset mixin planning the related lookups of the read actions
+    from the serializer of the action.
+    """
+
+    def filter_queryset(self, queryset):
+        """Planned queryset on top of the filtered one"""
+        queryset = super().filter_queryset(queryset)
+
+        if (self.request.method in SAFE_METHODS and
+                isinstance(queryset, QuerySet) and
+                queryset._fields is None):
+            queryset = plan_queryset(queryset, self.get_serializer())
+        return queryset
+
+
+# Fields whose to_representation returns values() output unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.ChoiceField, serializers.BooleanField,
+    serializers.IntegerField, serializers.PrimaryKeyRelatedField,
+)
+
+
+def _decimal_converter(field):
+    """
+    Converter of a decimal field. Values already at the field's decimal
+    places, as the database returns them, skip quantizing.
+    """
+    coerce_to_string = getattr(field, 'coerce_to_string',
+                               api_settings.COERCE_DECIMAL_TO_STRING)
+    if (not coerce_to_string or field.localize or
+            field.decimal_places is None):
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    def convert(value):
+        if value.is_finite() and value.as_tuple().exponent == exponent:
+            return format(value, 'f')
+        return field.to_representation(value)
+    return convert
+
+
+def values_plan(serializer, sources=None):
+    """
+    Plan for rendering rows of values() like the serializer does.
+    Returns (field name, values() lookup, converter) for every readable
+    field, the converter being None where the value passes as is.
+    Related fields other than primary keys need a lookup in sources.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    sources = sources or {}
+    plan = []
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in sources:
+            plan.append((name, sources[name], None))
+            continue
+        if (field.source == '*' or
+                isinstance(field, (serializers.BaseSerializer,
+                                   ManyRelatedField)) or
+                (isinstance(field, RelatedField) and
+                 not isinstance(field, serializers.PrimaryKeyRelatedField))):
+            raise ImproperlyConfigured(
+                f'Field "{name}" of {type(serializer).__name__} needs a '
+                f'values() lookup in the sources'
+            )
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            converter = None
+        elif isinstance(field, serializers.DecimalField):
+            converter = _decimal_converter(field)
+        else:
+            converter = field.to_representation
+        plan.append((name, '__'.join(field.source_attrs), converter))
+
+    return plan
+
+
+def render_values(plan, rows):
+    """Serialized data of the values() rows, following the plan"""
+    names = [name for name, _, _ in plan]
+    getter = itemgetter(*[lookup for _, lookup, _ in plan])
+    if len(plan) == 1:
+        getter = (lambda get: lambda row: (get(row),))(getter)
+    converters = [
+        (name, converter) for name, _, converter in plan
+        if converter is not None
+    ]
+
+    data = []
+    for row in rows:
+        item = dict(zip(names, getter(row)))
+        for name, converter in converters:
+            value = item[name]
+            if value is not None:
+                item[name] = converter(value)
+        data.append(item)
+    return data
+
+
+def normalize_params(query_params, lists=()):
+    """
+    Normalized form of the query params, so equivalent filters are equal.
+    Comma separated values of the params in lists, which filter on any
+    of the values, are stripped, lowercased, deduplicated and sorted.
+    Other params are kept exact, as their order or case may matter
+    (opaque cursors, icontains filters).
+    """
+    params = []
+    for key in sorted(query_params):
+        values = query_params.getlist(key)
+        if key in lists:
+            values = sorted({
+                value.strip().lower()
+                for param in values for value in param.split(',')
+            })
+        params.append((key, ','.join(values)))
+    return params
+
+
+class ChangeVersionMixin:
+    """
+    Viewset mixin fingerprinting requests with the change versions of
+    cache_models, the models whose writes change the responses.
+    """
+    cache_models = ()
+    # Params filtering on any of their comma separated values
+    list_params = ()
+
+    def get_change_versions(self):
+        """Change versions of cache_models, read once per request"""
+        if not hasattr(self, '_change_versions'):
+            self._change_versions = ChangeVersion.objects.versions(
+                *self.cache_models
+            )
+        return self._change_versions
+
+    def get_request_fingerprint(self, request, *extra):
+        """Digest of the request url, normalized params, change versions"""
+        parts = [
+            connection.settings_dict['NAME'], request.get_host(),
+            request.path,
+            normalize_params(request.query_params, self.list_params),
+            self.get_change_versions(), *extra
+        ]
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+class CachedListMixin(ChangeVersionMixin):
+    """
+    Viewset mixin caching the list responses.
+    Entries are keyed on the normalized query params and the change
+    versions of cache_models, any write to those models invalidates them.
+    """
+
+    def get_list_cache_key(self, request):
+        """Cache key of the list response for the request"""
+        digest = self.get_request_fingerprint(request)
+        return f'api:list:{type(self).__name__}:{digest}'
+
+    def list(self, request, *args, **kwargs):
+        """List response from the cache, when available"""
+        timeout = settings.API_CACHE_TIMEOUT
+        if not timeout:
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, timeout)
+        return response
+
+
+class NotModified(Exception):
+    """Raised when the client already has the current representation"""
+
+
+class ConditionalGetMixin(ChangeVersionMixin):
+    """
+    Viewset mixin adding an ETag to list and retrieve responses.
+    The ETag is derived from the change versions of cache_models and the
+    request, a matching If-None-Match is answered with 304 Not Modified
+    right after authentication, before any queryset or serializer work.
+    """
+    conditional_actions = ('list', 'retrieve')
+    etag = None
+
+    def get_etag(self, request):
+        """ETag of the response for the request"""
+        return quote_etag(self.get_request_fingerprint(
+            request, request.accepted_renderer.format
+        ))
+
+    def initial(self, request, *args, **kwargs):
+        """Check If-None-Match once the request is authorized"""
+        super().initial(request, *args, **kwargs)
+
+        if self.action in self.conditional_actions:
+            self.etag = self.get_etag(request)
+            if_none_match = parse_etags(
+                request.META.get('HTTP_IF_NONE_MATCH', '')
+            )
+            if self.etag in if_none_match or '*' in if_none_match:
+                raise NotModified
+
+    def handle_exception(self, exc):
+        """Empty 304 response for not modified requests"""
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Add the ETag to successful responses"""
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.etag and response.status_code in (
+                status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.etag
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    Viewset mixin sending the reads of replica_actions to the replicas
+    (core.db.routers), unless the token of the request wrote recently.
+    Reads start once the request is authenticated, list ahead of it the
+    mixins reading the change versions, so they come from the replica
+    along with the data.
+    """
+    replica_actions = ('list', 'retrieve')
+    replica_reading = None
+
+    def initial(self, request, *args, **kwargs):
+        """Read from the replicas after authentication"""
+        super().initial(request, *args, **kwargs)
+
+        if (self.action in self.replica_actions
+                and not routers.pinned(request)):
+            self.replica_reading = routers.reading.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Back to the primary"""
+        if self.replica_reading is not None:
+            routers.reading.reset(self.replica_reading)
+            self.replica_reading = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class InUse(APIException):
+    """The instance is still used, by the boms named in the detail"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Still used by other boms.'
+    default_code = 'in_use'
+
+
+class ProtectedDestroyMixin:
+    """
+    Viewset mixin answering 409 Conflict to deletes stopped by the bom
+    lines still using the instance, or a bom deleted along with it
+    (BomLine.material, BomLine.component are protected). The detail
+    names the boms of those lines.
+    """
+
+    def perform_destroy(self, instance):
+        try:
+            super().perform_destroy(instance)
+        except ProtectedError as error:
+            boms = sorted({line.bom.code for line in error.protected_objects})
+            raise InUse({
+                'detail': f'Still used by {len(boms)} bom(s).',
+                'boms': boms
+            })
+
+
+class FastListMixin:
+    """
+    Viewset mixin rendering list responses straight from values() rows,
+    skipping the model instances and most of the serializer machinery.
+    The output is identical to the serializer's, joined fields are given
+    as values() lookups in fast_list_sources.
+    """
+    fast_list = True
+    fast_list_sources = {}
+
+    def list(self, request, *args, **kwargs):
+        """List rendered from values() rows"""
+        if not self.fast_list:
+            return super().list(request, *args, **kwargs)
+
+        plan = values_plan(self.get_serializer(), self.fast_list_sources)
+        lookups = {lookup for _, lookup, _ in plan}
+        paginator = self.paginator
+        if paginator is not None and hasattr(paginator, 'get_ordering'):
+            lookups.update(
+                field.lstrip('-') for field in
+                paginator.get_ordering(request, None, self)
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.prefetch_related(None).values(*lookups)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(render_values(plan, page))
+        return Response(render_values(plan, queryset))
+
+
+class Echo:
+    """File like object returning what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+class ExportMixin:
+    """
+    Viewset mixin adding an "export" action streaming the filtered
+    queryset as CSV or NDJSON (?output=csv|ndjson).
+    Rows come from a server side cursor, so memory stays flat
+    whatever the number of rows.
+    """
+    # (column, values_list() lookup) pairs of the exported rows
+    export_fields = ()
+    export_chunk_size = 2000
+
+    def export_rows(self):
+        """Tuples of the exported columns, fetched in chunks"""
+        lookups = [lookup for _, lookup in self.export_fields]
+        return self.get_queryset().order_by('pk').values_list(
+            *lookups
+        ).iterator(chunk_size=self.export_chunk_size)
+
+    def stream_csv(self, rows):
+        """CSV lines of the header and rows"""
+        writer = csv.writer(Echo())
+        yield writer.writerow([column for column, _ in self.export_fields])
+        for row in rows:
+            yield writer.writerow(row)
+
+    def stream_ndjson(self, rows):
+        """A JSON object per line for every row"""
+        columns = [column for column, _ in self.export_fields]
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)),
+                             cls=DjangoJSONEncoder) + '\n'
+
+    @action(detail=False)
+    def export(self, request):
+        """Stream the filtered rows as a CSV or NDJSON attachment"""
+        output = request.query_params.get('output', 'csv').strip().lower()
+        if output == 'csv':
+            content = self.stream_csv(self.export_rows())
+            content_type = 'text/csv'
+        elif output == 'ndjson':
+            content = self.stream_ndjson(self.export_rows())
+            content_type = 'application/x-ndjson'
+        else:
+            raise ValidationError({'output': 'Use one of csv, ndjson.'})
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f'{self.basename}.{output}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
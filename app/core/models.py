@@ -1,7 +1,13 @@
 """
 Core models for the api
 """
-from django.db import models
+import uuid
+
+from decimal import Decimal
+
+from django.db import connection, models
+from django.db.models.functions import Concat
+from django.utils import timezone
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, \
                                         PermissionsMixin
 from django.conf import settings
@@ -116,6 +122,32 @@ class Article(models.Model):
         return self.artno
 
 
+class ArticleInfoQuerySet(models.QuerySet):
+    """QuerySet for the ArticleInfo model"""
+
+    def regenerate_artids(self):
+        """
+        Rewrite artid of the rows from their article, color and category.
+        Done as a single UPDATE, whatever the number of rows.
+        """
+        artno = Article.objects.filter(
+            pk=models.OuterRef('article_id')
+        ).values('artno')[:1]
+        code = Color.objects.filter(
+            pk=models.OuterRef('color_id')
+        ).values('code')[:1]
+
+        updated = self.update(artid=Concat(
+            models.Subquery(artno), models.Value('-'),
+            models.Subquery(code), models.Value('-'),
+            models.F('category'),
+            output_field=models.CharField()
+        ))
+        ChangeVersion.objects.touch(self.model)
+
+        return updated
+
+
 class ArticleInfo(models.Model):
     """
     More detailed model of article. color, category wise informations.
@@ -140,10 +172,61 @@ class ArticleInfo(models.Model):
     active = models.BooleanField(default=True)
     export = models.BooleanField(default=False)
 
+    objects = ArticleInfoQuerySet.as_manager()
+
     def __str__(self):
         return self.artid
 
 
+class ArticleCatalogManager(models.Manager):
+    """Manager for keeping the public catalog in sync with ArticleInfo"""
+
+    def sync(self, articleinfos):
+        """
+        Rebuild the catalog rows of the given ArticleInfo queryset.
+        Costs a fixed number of queries regardless of the row count.
+        """
+        rows = articleinfos.values_list(
+            'id', 'article__artno', 'color__name', 'mcategory', 'price',
+            'active'
+        )
+        catalog = [
+            self.model(
+                articleinfo_id=pk, artno=artno, color=color,
+                mcategory=mcategory, price=price, active=active
+            )
+            for pk, artno, color, mcategory, price, active in rows
+        ]
+        self.filter(articleinfo_id__in=[row.pk for row in catalog]).delete()
+        self.bulk_create(catalog)
+
+        return catalog
+
+
+class ArticleCatalog(models.Model):
+    """
+    Denormalized read model of ArticleInfo for the public api.
+    Rows are maintained through signals on Article, Color and ArticleInfo.
+    """
+
+    articleinfo = models.OneToOneField(
+        ArticleInfo,
+        primary_key=True,
+        related_name='catalog',
+        on_delete=models.CASCADE
+    )
+    artno = models.CharField(max_length=6)
+    color = models.CharField(max_length=25)
+    mcategory = models.CharField(max_length=10)
+    price = models.DecimalField(max_digits=5, decimal_places=2)
+    active = models.BooleanField(default=True)
+
+    objects = ArticleCatalogManager()
+
+    def __str__(self):
+        return f"{self.artno} {self.color}"
+
+
 class Uom(models.TextChoices):
     """
     All Available Unit of Measurments
@@ -184,3 +267,322 @@ class Material(models.Model):
 
     def __str__(self):
         return self.name
+
+
+# Deepest sub assembly nesting walked in the bom graph
+BOM_MAX_DEPTH = 16
+
+
+class Bom(models.Model):
+    """
+    Bill of materials of an article variant, or of a sub assembly
+    (upper, sole...) which is itself used in other boms.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+    )
+    code = models.CharField(max_length=30, unique=True)
+    name = models.CharField(max_length=100)
+    articleinfo = models.OneToOneField(
+        ArticleInfo,
+        related_name='bom',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True
+    )
+
+    def __str__(self):
+        return self.code
+
+
+class BomLine(models.Model):
+    """
+    Line of a bom, consuming either a material or a sub assembly bom.
+    Quantity is per pair (unit) of the bom, in the uom of the material.
+    """
+    bom = models.ForeignKey(
+        Bom,
+        related_name='lines',
+        on_delete=models.CASCADE
+    )
+    material = models.ForeignKey(
+        Material,
+        related_name='bom_lines',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
+    component = models.ForeignKey(
+        Bom,
+        related_name='used_in',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
+    quantity = models.DecimalField(max_digits=12, decimal_places=4)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(material__isnull=False, component__isnull=True)
+                    | models.Q(material__isnull=True, component__isnull=False)
+                ),
+                name='bomline_material_or_component'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bom} {self.material or self.component}"
+
+
+class BomClosureManager(models.Manager):
+    """Manager keeping the transitive closure of the bom graph"""
+
+    REBUILD_SQL = """
+    WITH RECURSIVE closure (ancestor_id, descendant_id, quantity, depth) AS (
+        SELECT id, id, CAST(1 AS NUMERIC), 0 FROM {bom}
+        UNION ALL
+        SELECT closure.ancestor_id, line.component_id,
+               closure.quantity * line.quantity, closure.depth + 1
+        FROM closure
+        JOIN {line} line ON line.bom_id = closure.descendant_id
+        WHERE line.component_id IS NOT NULL AND closure.depth < %s
+    )
+    SELECT ancestor_id, descendant_id, SUM(quantity), COUNT(*)
+    FROM closure
+    GROUP BY ancestor_id, descendant_id
+    """
+
+    def rebuild(self):
+        """
+        Recompute the whole closure from the bom lines,
+        for bulk writes of lines which bypass the signals.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(self.REBUILD_SQL.format(
+                bom=Bom._meta.db_table, line=BomLine._meta.db_table
+            ), [BOM_MAX_DEPTH])
+            rows = cursor.fetchall()
+
+        self.all().delete()
+        self.bulk_create(
+            (self.model(ancestor_id=ancestor, descendant_id=descendant,
+                        quantity=quantity, paths=paths)
+             for ancestor, descendant, quantity, paths in rows),
+            batch_size=1000
+        )
+
+    def link(self, bom_id, component_id, quantity, sign=1):
+        """
+        Add (sign=1) or remove (sign=-1) the paths through a line using
+        component_id in bom_id. Every ancestor of the bom reaches every
+        descendant of the component through it, the quantities and path
+        counts of those pairs change by the product of the joined paths.
+        """
+        ancestors = list(self.filter(descendant_id=bom_id).values_list(
+            'ancestor_id', 'quantity', 'paths'
+        ))
+        descendants = list(self.filter(ancestor_id=component_id).values_list(
+            'descendant_id', 'quantity', 'paths'
+        ))
+        if not ancestors or not descendants:
+            return
+
+        existing = {
+            (row.ancestor_id, row.descendant_id): row
+            for row in self.filter(
+                ancestor_id__in={row[0] for row in ancestors},
+                descendant_id__in={row[0] for row in descendants}
+            )
+        }
+        quantity = Decimal(str(quantity))
+        created, updated, deleted = [], [], []
+        for ancestor, up_quantity, up_paths in ancestors:
+            for descendant, down_quantity, down_paths in descendants:
+                row = existing.get((ancestor, descendant))
+                if row is None:
+                    row = self.model(ancestor_id=ancestor,
+                                     descendant_id=descendant,
+                                     quantity=0, paths=0)
+                    created.append(row)
+                row.quantity += sign * up_quantity * quantity * down_quantity
+                row.paths += sign * up_paths * down_paths
+                if row.pk is None:
+                    continue
+                elif row.paths > 0:
+                    updated.append(row)
+                else:
+                    deleted.append(row.pk)
+
+        if deleted:
+            self.filter(pk__in=deleted).delete()
+        if updated:
+            self.bulk_update(updated, ['quantity', 'paths'])
+        created = [row for row in created if row.paths > 0]
+        if created:
+            self.bulk_create(created)
+
+
+class BomClosure(models.Model):
+    """
+    Transitive closure of the bom graph, every bom is its own ancestor.
+    Quantity of the descendant per unit of the ancestor, summed over
+    the paths between them.
+    """
+    ancestor = models.ForeignKey(
+        Bom,
+        related_name='descendant_links',
+        on_delete=models.CASCADE
+    )
+    descendant = models.ForeignKey(
+        Bom,
+        related_name='ancestor_links',
+        on_delete=models.CASCADE
+    )
+    quantity = models.DecimalField(max_digits=24, decimal_places=8)
+    paths = models.PositiveIntegerField(default=1)
+
+    objects = BomClosureManager()
+
+    class Meta:
+        unique_together = (('ancestor', 'descendant'),)
+
+    def __str__(self):
+        return f"{self.ancestor} > {self.descendant}"
+
+
+class CostChange(models.Model):
+    """
+    Log of a basic cost change written by the costing engine,
+    with the material whose price or cf change caused it, if any.
+    """
+    articleinfo = models.ForeignKey(
+        ArticleInfo,
+        related_name='cost_changes',
+        on_delete=models.CASCADE
+    )
+    material = models.ForeignKey(
+        Material,
+        related_name='cost_changes',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    old_basic = models.DecimalField(max_digits=6, decimal_places=2)
+    new_basic = models.DecimalField(max_digits=6, decimal_places=2)
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.articleinfo} {self.old_basic} -> {self.new_basic}"
+
+
+class MaterialPriceManager(models.Manager):
+    """Manager answering the prices of materials as of an instant"""
+
+    # Every price holds from its effective_from up to the next one of its
+    # material, prices as of an instant are the ranges containing it
+    AS_OF_SQL = """
+    SELECT history.material_id, history.price
+    FROM (
+        SELECT material_id, price, effective_from,
+               LEAD(effective_from) OVER (
+                   PARTITION BY material_id ORDER BY effective_from, id
+               ) AS effective_to
+        FROM {history}
+    ) history
+    WHERE history.effective_from <= %s
+      AND (history.effective_to IS NULL OR history.effective_to > %s)
+    """
+
+    def as_of_sql(self, when):
+        """Sql and params of the (material_id, price) rows as of when"""
+        when = connection.ops.adapt_datetimefield_value(when)
+        return self.AS_OF_SQL.format(
+            history=self.model._meta.db_table
+        ), [when, when]
+
+    def prices_as_of(self, when):
+        """Price of every material as of when, by a single query"""
+        sql, params = self.as_of_sql(when)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {
+                material_id: self.model._meta.get_field('price').to_python(
+                    price
+                ) for material_id, price in cursor.fetchall()
+            }
+
+    def price_as_of(self, material_id, when):
+        """Price of the material as of when, None before its history"""
+        return self.filter(
+            material_id=material_id, effective_from__lte=when
+        ).order_by('-effective_from', '-id').values_list(
+            'price', flat=True
+        ).first()
+
+
+class MaterialPrice(models.Model):
+    """
+    Append only price history of the materials, written on every price
+    change. Bulk writes of Material.price have to append it themselves.
+    """
+    material = models.ForeignKey(
+        Material,
+        related_name='prices',
+        on_delete=models.CASCADE
+    )
+    price = models.DecimalField(max_digits=5, decimal_places=2)
+    effective_from = models.DateTimeField(default=timezone.now)
+
+    objects = MaterialPriceManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['material', 'effective_from'])]
+
+    def __str__(self):
+        return f"{self.material} {self.price} from {self.effective_from}"
+
+
+class ChangeVersionManager(models.Manager):
+    """Manager for reading and bumping the change versions of models"""
+
+    def touch(self, *model_classes):
+        """
+        Give the models a new change version.
+        Called on every write, bulk writes have to call it themselves.
+        The row of a model stays locked until the writing transaction
+        ends, so concurrent writes of a model wait on each other: keep
+        write transactions short, touch once per bulk write.
+        """
+        names = [model._meta.label_lower for model in model_classes]
+        version = uuid.uuid4()
+
+        if self.filter(name__in=names).update(version=version) < len(names):
+            self.bulk_create(
+                [self.model(name=name, version=version) for name in names],
+                ignore_conflicts=True
+            )
+
+    def versions(self, *model_classes):
+        """Current change versions of the models, with a single query"""
+        names = [model._meta.label_lower for model in model_classes]
+        versions = dict(
+            self.filter(name__in=names).values_list('name', 'version')
+        )
+        return [versions.get(name) for name in names]
+
+
+class ChangeVersion(models.Model):
+    """
+    Change version of a model, replaced on every write to its table.
+    Used for invalidating cached responses of the api.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    version = models.UUIDField(default=uuid.uuid4)
+
+    objects = ChangeVersionManager()
+
+    def __str__(self):
+        return f"{self.name} {self.version}"
@@ -0,0 +1,22 @@
+"""
+Pagination classes shared by the api viewsets
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Opaque cursor pagination on an indexed, unique ordering.
+    The ordering comes from the view's "ordering" attribute, so every
+    page is a single index range scan, however deep the cursor is.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        """Use the ordering declared on the view, if any"""
+        ordering = getattr(view, 'ordering', self.ordering)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
@@ -0,0 +1,145 @@
+"""
+Signal handlers keeping denormalized data in sync with the core models
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import token_cache
+
+from core.models import Article, Color, ArticleInfo, ArticleCatalog, \
+                        Material, MaterialPrice, Bom, BomLine, BomClosure, \
+                        ChangeVersion
+
+
+# Models whose writes invalidate cached responses of the api
+VERSIONED_MODELS = (Article, Color, ArticleInfo, Material, Bom, BomLine)
+# User fields whose change revokes the cached tokens of the user
+AUTH_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser')
+
+
+@receiver(post_save, sender=ArticleInfo)
+def sync_articleinfo_catalog(sender, instance, **kwargs):
+    """Rebuild the catalog row of the saved article info"""
+    ArticleCatalog.objects.sync(ArticleInfo.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Article)
+def sync_article_catalog(sender, instance, created, **kwargs):
+    """Propagate a changed artno to the catalog"""
+    if not created:
+        ArticleCatalog.objects.filter(
+            articleinfo__article=instance
+        ).update(artno=instance.artno)
+
+
+@receiver(post_save, sender=Color)
+def sync_color_catalog(sender, instance, created, **kwargs):
+    """Propagate a changed color name to the catalog"""
+    if not created:
+        ArticleCatalog.objects.filter(
+            articleinfo__color=instance
+        ).update(color=instance.name)
+
+
+@receiver(pre_save, sender=Material)
+def remember_material_price(sender, instance, **kwargs):
+    """Keep the saved price of a material, to see it changing"""
+    instance._saved_price = None
+    if instance.pk is not None:
+        instance._saved_price = Material.objects.filter(
+            pk=instance.pk
+        ).values_list('price', flat=True).first()
+
+
+@receiver(post_save, sender=Material)
+def record_material_price(sender, instance, **kwargs):
+    """Append a new or changed price to the price history"""
+    price = Decimal(str(instance.price))
+    if price != getattr(instance, '_saved_price', None):
+        MaterialPrice.objects.create(material=instance, price=price)
+
+
+@receiver(post_save, sender=Bom)
+def link_bom_closure(sender, instance, created, **kwargs):
+    """Every bom is its own ancestor in the closure"""
+    if created:
+        BomClosure.objects.create(ancestor=instance, descendant=instance,
+                                  quantity=1)
+
+
+@receiver(pre_save, sender=BomLine)
+def remember_bom_line(sender, instance, **kwargs):
+    """Keep the saved state of a line, to unlink it from the closure"""
+    instance._closure_link = None
+    if instance.pk is not None:
+        instance._closure_link = BomLine.objects.filter(
+            pk=instance.pk, component__isnull=False
+        ).values_list('bom_id', 'component_id', 'quantity').first()
+
+
+@receiver(post_save, sender=BomLine)
+def link_bom_line_closure(sender, instance, **kwargs):
+    """Move the paths through a changed line in the closure"""
+    link = getattr(instance, '_closure_link', None)
+    if link is not None:
+        BomClosure.objects.link(*link, sign=-1)
+    if instance.component_id is not None:
+        BomClosure.objects.link(instance.bom_id, instance.component_id,
+                                instance.quantity)
+
+
+@receiver(post_delete, sender=BomLine)
+def unlink_bom_line_closure(sender, instance, **kwargs):
+    """Remove the paths through a deleted line from the closure"""
+    if instance.component_id is not None:
+        BomClosure.objects.link(instance.bom_id, instance.component_id,
+                                instance.quantity, sign=-1)
+
+
+def touch_change_version(sender, **kwargs):
+    """Bump the change version of the written model"""
+    ChangeVersion.objects.touch(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(touch_change_version, sender=model)
+    post_delete.connect(touch_change_version, sender=model)
+
+
+@receiver(post_delete, sender=Token)
+def revoke_cached_token(sender, instance, **kwargs):
+    """Deleted tokens authenticate no more"""
+    token_cache.revoke([instance.key])
+
+
+@receiver(pre_save, sender=get_user_model())
+def remember_user_auth(sender, instance, update_fields=None, **kwargs):
+    """Keep the saved fields authenticating a user, to see them changing"""
+    instance._saved_auth = None
+    if instance.pk is not None and (update_fields is None
+                                    or set(update_fields) & set(AUTH_FIELDS)):
+        instance._saved_auth = sender.objects.filter(
+            pk=instance.pk
+        ).values_list(*AUTH_FIELDS).first()
+
+
+@receiver(post_save, sender=get_user_model())
+def revoke_cached_user_tokens(sender, instance, created, update_fields=None,
+                              **kwargs):
+    """
+    Deactivation, a new password, staff flags apply at once, to the
+    tokens of the user only
+    """
+    if created or (update_fields is not None
+                   and not set(update_fields) & set(AUTH_FIELDS)):
+        return
+    saved = getattr(instance, '_saved_auth', None)
+    if saved == tuple(getattr(instance, field) for field in AUTH_FIELDS):
+        return
+    token_cache.revoke(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
@@ -0,0 +1,44 @@
+"""
+Test helpers shared by the test suites of all the apps
+"""
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class _AssertMaxQueriesContext(CaptureQueriesContext):
+    """Fails the test when more queries than the budget were executed"""
+
+    def __init__(self, test_case, budget, connection):
+        self.test_case = test_case
+        self.budget = budget
+        super().__init__(connection)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+
+        executed = len(self)
+        self.test_case.assertLessEqual(
+            executed, self.budget,
+            '%d queries executed, budget is %d\n%s' % (
+                executed, self.budget,
+                '\n'.join(
+                    '%d. %s' % (i, query['sql'])
+                    for i, query in enumerate(self.captured_queries, start=1)
+                )
+            )
+        )
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for asserting query budgets of endpoints, like:
+
+        with self.assertQueryBudget(2):
+            self.client.get(url)
+    """
+
+    def assertQueryBudget(self, budget, using='default'):
+        """Executed queries inside the block must not exceed the budget"""
+        return _AssertMaxQueriesContext(self, budget, connections[using])
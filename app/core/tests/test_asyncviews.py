@@ -0,0 +1,129 @@
+"""
+Test the async views of the ASGI deployment
+"""
+import asyncio
+
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, \
+                        TransactionTestCase, override_settings
+from django.urls import resolve, reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core.middleware import AsyncViewsMiddleware
+from core.models import Article, ArticleInfo, Color, Material
+
+
+@override_settings(ASYNC_URLCONF='app.urls_async', API_CACHE_TIMEOUT=0)
+class AsyncViewTests(TransactionTestCase):
+    """
+    Test the read heavy endpoints through their async views. The views
+    query on threads of their own, hence transactions are committed.
+    """
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('test@kalalokia.xyz',
+                                                    'testpass')
+        self.token = Token.objects.create(user=user)
+        self.client = AsyncClient()
+
+        article = Article.objects.create(user=user, artno='3290')
+        self.infos = [
+            ArticleInfo.objects.create(
+                user=user, article=article, category='g', price=270,
+                color=Color.objects.create(user=user, code=code, name=code),
+                artid=f'3290-{code}-g'
+            ) for code in ('bk', 'br')
+        ]
+        for code, name in [('4-so01-0001', 'Black Sole'),
+                           ('4-so01-0002', 'Brown Sole')]:
+            Material.objects.create(code=code, name=name)
+
+    def get(self, url, data=None):
+        """Authenticated request, the query string in the url"""
+        if data:
+            url = f'{url}?{urlencode(data)}'
+        return self.client.get(url, authorization=f'Token {self.token.key}')
+
+    def test_routes_async(self):
+        """Test only the read heavy routes are async"""
+        for name, args in [('article:article-minimal-list', []),
+                           ('article:articleinfo-list', []),
+                           ('article:articleinfo-detail', [1]),
+                           ('bom:material-list', [])]:
+            func = resolve(reverse(name, args=args), 'app.urls_async').func
+            self.assertTrue(asyncio.iscoroutinefunction(func), name)
+
+        func = resolve(reverse('article:color-list'), 'app.urls_async').func
+        self.assertFalse(asyncio.iscoroutinefunction(func))
+
+    def test_asgi_requests_routed(self):
+        """Test only ASGI requests are routed by ASYNC_URLCONF"""
+        middleware = AsyncViewsMiddleware(lambda request: request)
+
+        request = middleware(AsyncRequestFactory().get('/'))
+        self.assertEqual(request.urlconf, 'app.urls_async')
+        request = middleware(RequestFactory().get('/'))
+        self.assertFalse(hasattr(request, 'urlconf'))
+        with override_settings(ASYNC_URLCONF=None):
+            request = middleware(AsyncRequestFactory().get('/'))
+        self.assertFalse(hasattr(request, 'urlconf'))
+
+    async def test_public_items(self):
+        """Test the public items list"""
+        res = await self.get(reverse('article:article-minimal-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.json()['results']), 2)
+
+    async def test_articleinfo_list_retrieve(self):
+        """Test the article info list, filters and retrieve"""
+        res = await self.get(reverse('article:articleinfo-list'),
+                             {'color': 'br'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([info['artid'] for info in res.json()['results']],
+                         ['3290-br-g'])
+
+        res = await self.get(
+            reverse('article:articleinfo-detail', args=[self.infos[0].id])
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['artid'], '3290-bk-g')
+
+        res = await AsyncClient().get(reverse('article:articleinfo-list'))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_material_search(self):
+        """Test the material list searches"""
+        res = await self.get(reverse('bom:material-list'),
+                             {'q': 'black sole'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['code'] for row in res.json()['results']],
+                         ['4-so01-0001'])
+
+    async def test_concurrent(self):
+        """Test concurrent requests, along with writes"""
+        url = reverse('article:articleinfo-list')
+        responses = await asyncio.gather(*[self.get(url)
+                                           for _ in range(8)])
+
+        self.assertEqual({res.status_code for res in responses},
+                         {status.HTTP_200_OK})
+        await sync_to_async(ArticleInfo.objects.filter(
+            id=self.infos[1].id
+        ).update)(active=False)
+        res = await self.get(url, {'active': 'true'})
+        self.assertEqual(len(res.json()['results']), 1)
+
+    @override_settings(DEBUG_SQL_HEADERS=True)
+    async def test_query_headers(self):
+        """Test the queries run by the worker thread are reported"""
+        res = await self.get(reverse('article:article-minimal-list'))
+
+        self.assertEqual(res['X-DB-Query-Count'], '2')
@@ -0,0 +1,162 @@
+"""
+Test the cached token authentication
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import CachedTokenAuthentication, token_cache, \
+                                GENERATION_KEY, revocation_key
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test tokens are looked up once, revoked at once"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz', 'testpass', name='Test'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = self.token_client(self.token)
+
+    def token_client(self, token):
+        """Client authenticated by the token"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def test_lookup_cached(self):
+        """Test only the first request looks the token up"""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.data['email'], 'test@kalalokia.xyz')
+
+    def test_token_deleted(self):
+        """Test deleted tokens are rejected right away"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivated(self):
+        """Test tokens of deactivated users are rejected right away"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_changed(self):
+        """Test a password change drops the cached user"""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {'password': 'newpassword'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(token_cache.get(self.token.key))
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    def test_other_saves_kept(self):
+        """Test new users, profile edits keep the cached tokens"""
+        self.client.get(ME_URL)
+
+        get_user_model().objects.create_user('other@kalalokia.xyz',
+                                             'testpass')
+        self.user.name = 'Changed'
+        self.user.save()
+
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+    def test_revoked_per_user(self):
+        """Test deactivating a user revokes only the tokens of the user"""
+        other = get_user_model().objects.create_user('other@kalalokia.xyz',
+                                                     'testpass')
+        other_client = self.token_client(Token.objects.create(user=other))
+        self.client.get(ME_URL)
+        other_client.get(ME_URL)
+
+        other.is_active = False
+        other.save()
+
+        res = other_client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+    def test_revoked_by_other_process(self):
+        """Test generations published elsewhere drop the tokens"""
+        self.client.get(ME_URL)
+        cache.set(GENERATION_KEY, 'other')
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+        cache.set(revocation_key(self.token.key), 'other')
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    def test_bulk_update_revoked(self):
+        """Test bulk writes take effect once followed by revoke()"""
+        self.client.get(ME_URL)
+        get_user_model().objects.filter(id=self.user.id).update(
+            is_active=False
+        )
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+        token_cache.revoke()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_requests_get_copies(self):
+        """Test changes to the user of a request stay with the request"""
+        authentication = CachedTokenAuthentication()
+        user, _ = authentication.authenticate_credentials(self.token.key)
+        user.name = 'Changed'
+
+        user, token = authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.name, 'Test')
+        self.assertIs(token.user, user)
+
+    @override_settings(TOKEN_CACHE_TTL=0)
+    def test_ttl(self):
+        """Test expired entries are looked up again"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    @override_settings(TOKEN_CACHE_SIZE=1)
+    def test_size(self):
+        """Test the least recently used tokens are evicted"""
+        other = Token.objects.create(user=get_user_model().objects.create_user(
+            'other@kalalokia.xyz', 'testpass'
+        ))
+        self.client.get(ME_URL)
+        self.token_client(other).get(ME_URL)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertIsNotNone(token_cache.get(other.key))
@@ -1,9 +1,14 @@
+from importlib.util import find_spec
+from io import StringIO
+from unittest import skipUnless
 from unittest.mock import patch
 
 from django.core.management import call_command
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from core.models import Article, ArticleInfo, Color, Bom
+
 
 class CommandTest(TestCase):
 
@@ -21,3 +26,70 @@ class CommandTest(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+class BenchmarkCommandTest(TestCase):
+
+    def test_benchmark_artids(self):
+        """Test artid benchmark reports constant queries, rolls back data"""
+        out = StringIO()
+        call_command('benchmark', 'artids', '--rows', '10', '50', stdout=out)
+        lines = out.getvalue().splitlines()
+
+        queries = {}
+        for line in lines:
+            label = line.split('rows=')[0].strip()
+            queries.setdefault(label, set()).add(line.split()[-2])
+
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(len(queries['rename article']), 1)
+        self.assertEqual(len(queries['recode color']), 1)
+        self.assertFalse(Article.objects.exists())
+        self.assertFalse(ArticleInfo.objects.exists())
+        self.assertFalse(Color.objects.exists())
+
+    def test_benchmark_explode(self):
+        """Test bom explosion benchmark costs a single query"""
+        out = StringIO()
+        call_command('benchmark', 'explode', '--rows', '20', stdout=out)
+
+        self.assertIn('queries=1 ', out.getvalue())
+        self.assertFalse(Bom.objects.exists())
+
+
+@skipUnless(find_spec('gunicorn'), 'Needs gunicorn')
+class ServeCommandTest(TestCase):
+    """Test the serve command configures gunicorn, preloads the app"""
+
+    def serve(self, *args):
+        """Run the command up to the server start, the server"""
+        with patch('core.management.commands.serve.Server.run',
+                   autospec=True) as run, \
+                patch('bom.search.material_index.warm'):
+            call_command('serve', *args)
+        (server,), _ = run.call_args
+        return server
+
+    def test_serve_wsgi(self):
+        """Test workers, threads, recycling, the preloaded wsgi app"""
+        from app.wsgi import application
+
+        server = self.serve('--workers', '3', '--threads', '4',
+                            '--max-requests', '500')
+
+        self.assertIs(server.load(), application)
+        self.assertEqual(server.cfg.workers, 3)
+        self.assertEqual(server.cfg.threads, 4)
+        self.assertEqual(server.cfg.max_requests, 500)
+        self.assertTrue(server.cfg.preload_app)
+        self.assertEqual(server.cfg.worker_class_str, 'gthread')
+
+    def test_serve_asgi(self):
+        """Test uvicorn workers serve app.asgi"""
+        from app.asgi import application
+
+        server = self.serve('--asgi')
+
+        self.assertIs(server.load(), application)
+        self.assertEqual(server.cfg.worker_class_str,
+                         'uvicorn.workers.UvicornWorker')
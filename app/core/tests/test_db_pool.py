@@ -0,0 +1,198 @@
+"""
+Test the database connection pool
+"""
+import sqlite3
+import threading
+
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+
+from core.db import pool
+
+
+def check(sqlite_connection):
+    """Whether a sqlite connection still answers"""
+    try:
+        sqlite_connection.execute('SELECT 1')
+    except sqlite3.Error:
+        return False
+    return True
+
+
+def connect():
+    """A new in memory sqlite connection"""
+    return sqlite3.connect(':memory:', check_same_thread=False)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test reuse, checks and recycling of pooled connections"""
+
+    def test_reuse(self):
+        """Test released connections are reused, the latest first"""
+        connections = pool.ConnectionPool(check=check)
+        first = connections.acquire(connect)
+        second = connections.acquire(connect)
+        connections.release(first)
+        connections.release(second)
+
+        self.assertIs(connections.acquire(connect), second)
+        self.assertIs(connections.acquire(connect), first)
+        self.assertEqual(connections.stats(), {
+            'opened': 2, 'reused': 2, 'failed': 0, 'recycled': 0,
+            'closed': 0, 'timeouts': 0, 'idle': 0, 'in_use': 2,
+        })
+
+    def test_health_check(self):
+        """Test broken connections are replaced"""
+        connections = pool.ConnectionPool(check=check)
+        broken = connections.acquire(connect)
+        connections.release(broken)
+        broken.close()
+
+        self.assertIsNot(connections.acquire(connect), broken)
+        stats = connections.stats()
+        self.assertEqual((stats['failed'], stats['opened']), (1, 2))
+
+    def test_health_check_interval(self):
+        """Test recently used connections are not checked"""
+        connections = pool.ConnectionPool(check=check, health_check=60)
+        broken = connections.acquire(connect)
+        connections.release(broken)
+        broken.close()
+
+        self.assertIs(connections.acquire(connect), broken)
+
+    def test_max_lifetime(self):
+        """Test connections past their lifetime are closed, not reused"""
+        connections = pool.ConnectionPool(check=check, max_lifetime=0)
+        old = connections.acquire(connect)
+        connections.release(old)
+
+        self.assertFalse(check(old))
+        self.assertEqual(connections.stats()['closed'], 1)
+
+        connections.max_lifetime = None
+        old = connections.acquire(connect)
+        connections.release(old)
+        connections.max_lifetime = 0
+        self.assertIsNot(connections.acquire(connect), old)
+        self.assertEqual(connections.stats()['recycled'], 1)
+
+    def test_max_size(self):
+        """Test idle connections over max_size are closed"""
+        connections = pool.ConnectionPool(check=check, max_size=1)
+        first = connections.acquire(connect)
+        second = connections.acquire(connect)
+        connections.release(first)
+        connections.release(second)
+
+        self.assertTrue(check(first))
+        self.assertFalse(check(second))
+        self.assertEqual(connections.stats()['idle'], 1)
+
+    def test_max_connections(self):
+        """Test acquire waits for a connection once max_connections open"""
+        connections = pool.ConnectionPool(check=check, max_connections=1,
+                                          timeout=0)
+        first = connections.acquire(connect)
+
+        with self.assertRaises(pool.PoolTimeout):
+            connections.acquire(connect)
+        self.assertEqual(connections.stats()['timeouts'], 1)
+
+        connections.timeout = 10
+        threading.Timer(0.1, connections.release, [first]).start()
+        self.assertIs(connections.acquire(connect), first)
+
+        threading.Timer(0.1, connections.discard, [first, 'closed']).start()
+        self.assertIsNot(connections.acquire(connect), first)
+        self.assertEqual(connections.stats()['opened'], 2)
+
+    def test_connect_failed(self):
+        """Test failing connects are counted, raised, free their place"""
+        connections = pool.ConnectionPool(check=check, max_connections=1,
+                                          timeout=0)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            connections.acquire(
+                lambda: sqlite3.connect('/nonexistent/directory/db')
+            )
+        self.assertEqual(connections.stats()['failed'], 1)
+        self.assertIsNotNone(connections.acquire(connect))
+
+    def test_forget_pools(self):
+        """Test forked processes start without the pools of the parent"""
+        pools = dict(pool.pools)
+        parent = pool.get_pool('test')
+        try:
+            pool.forget_pools()
+
+            self.assertIsNot(pool.get_pool('test'), parent)
+            self.assertIn(parent, pool.inherited)
+        finally:
+            del pool.inherited[-len(pools) - 1:]
+            pool.pools.clear()
+            pool.pools.update(pools)
+
+
+@skipUnless(connection.vendor == 'postgresql'
+            and connection.settings_dict.get('POOL'),
+            'Needs a pooled PostgreSQL database')
+class PostgresPoolTests(TransactionTestCase):
+    """Test the pooled PostgreSQL backend"""
+
+    def backend_pid(self):
+        """Process id of the server side of the connection"""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_connection_reused(self):
+        """Test closed connections are handed out again"""
+        pid = self.backend_pid()
+        connection.close()
+        reused = connection.pool.stats()['reused']
+
+        self.assertEqual(self.backend_pid(), pid)
+        self.assertEqual(connection.pool.stats()['reused'], reused + 1)
+
+    def test_closed_connection_replaced(self):
+        """Test connections found closed fail the health check"""
+        pid = self.backend_pid()
+        connection.close()
+        with connection.pool.lock:
+            conn, _ = connection.pool.idle[-1]
+            connection.pool.idle[-1] = (conn, 0)
+        conn.close()
+
+        self.assertNotEqual(self.backend_pid(), pid)
+
+    def test_transaction_rolled_back(self):
+        """Test connections are put back outside of transactions"""
+        connection.set_autocommit(False)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pooled (id int)')
+        connection.close()
+        connection.set_autocommit(True)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.pooled')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_session_reset(self):
+        """Test settings, locks of a session end with its request"""
+        pid = self.backend_pid()
+        with connection.cursor() as cursor:
+            cursor.execute("SET statement_timeout = '5s'")
+            cursor.execute('SELECT pg_advisory_lock(22)')
+        connection.close()
+
+        self.assertEqual(self.backend_pid(), pid)
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '0')
+            cursor.execute("SELECT count(*) FROM pg_locks "
+                           "WHERE locktype = 'advisory'")
+            self.assertEqual(cursor.fetchone()[0], 0)
@@ -0,0 +1,106 @@
+"""
+Test the values() fast path of the list endpoints
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.mixins import values_plan, render_values
+from core.models import ArticleInfo, Material
+
+from article import views as article_views
+from article.serializers import ArticlePublicSerializer
+from article.test import samples
+from bom import views as bom_views
+
+
+@override_settings(API_CACHE_TIMEOUT=0)
+class FastListTests(TestCase):
+    """Test fast path responses are identical to the serializer ones"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@kalalokia.xyz',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+        colors = [
+            samples.color(user=self.user),
+            samples.color(user=self.user, code='br', name='brown'),
+        ]
+        for artno in ['3290', 'd4303', 'k6012']:
+            article = samples.article(user=self.user, artno=artno)
+            for color in colors:
+                for category in ['g', 'k']:
+                    samples.article_info(
+                        user=self.user, article=article, color=color,
+                        category=category, price=299.5, basic=120
+                    )
+        for number in range(5):
+            Material.objects.create(
+                code=f'5-co07-{number:04}', name=f'm40 {number}',
+                category='component', uom='meter', purchaseuom='cone',
+                cf='1500.0001', price='2.5', active=number % 2 == 0
+            )
+
+    def assertSameContent(self, viewset, url, params):
+        """Fast, serializer responses render to the same bytes"""
+        fast = self.client.get(url, params)
+        with patch.object(viewset, 'fast_list', False):
+            slow = self.client.get(url, params)
+
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_articleinfo_list(self):
+        """Test the article info list, filtered and paginated"""
+        url = reverse('article:articleinfo-list')
+        res = self.assertSameContent(
+            article_views.ArticleInfoViewSet, url,
+            {'brand': 'pride,debongo', 'page_size': 3}
+        )
+
+        self.assertSameContent(
+            article_views.ArticleInfoViewSet, res.data['next'], {}
+        )
+
+    def test_public_list(self):
+        """Test the public catalog list"""
+        self.assertSameContent(
+            article_views.ArticlePublicViewSet,
+            reverse('article:article-minimal-list'), {}
+        )
+
+    def test_material_list(self):
+        """Test the material list"""
+        self.assertSameContent(
+            bom_views.MaterialViewSet, reverse('bom:material-list'),
+            {'active': 'true'}
+        )
+
+    def test_joined_sources(self):
+        """Test related fields rendered from joined values() lookups"""
+        serializer = ArticlePublicSerializer()
+        sources = {'article': 'article__artno', 'color': 'color__name'}
+        plan = values_plan(serializer, sources)
+        queryset = ArticleInfo.objects.order_by('id')
+
+        rows = queryset.values(*{lookup for _, lookup, _ in plan})
+
+        self.assertEqual(
+            render_values(plan, rows),
+            ArticlePublicSerializer(queryset, many=True).data
+        )
+
+    def test_related_fields_need_sources(self):
+        """Test string related fields without a lookup are refused"""
+        with self.assertRaises(ImproperlyConfigured):
+            values_plan(ArticlePublicSerializer())
@@ -0,0 +1,41 @@
+"""
+Test the middlewares of the api
+"""
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+
+ARTICLE_PUBLIC_URL = reverse('article:article-minimal-list')
+
+
+class QueryCountMiddlewareTests(TestCase):
+    """Test the query count response headers"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    @override_settings(DEBUG_SQL_HEADERS=True, API_CACHE_TIMEOUT=0)
+    def test_headers_reported(self):
+        """Test query count, time are reported when the flag is on"""
+        res = self.client.get(ARTICLE_PUBLIC_URL)
+
+        self.assertEqual(res['X-DB-Query-Count'], '2')
+        self.assertTrue(res['X-DB-Query-Time'].endswith('ms'))
+
+    @override_settings(DEBUG_SQL_HEADERS=True, API_CACHE_TIMEOUT=0,
+                       ASYNC_URLCONF=None)
+    async def test_headers_reported_asgi(self):
+        """Test the queries of sync views are reported under ASGI"""
+        res = await AsyncClient().get(ARTICLE_PUBLIC_URL)
+
+        self.assertEqual(res['X-DB-Query-Count'], '2')
+
+    @override_settings(DEBUG_SQL_HEADERS=False)
+    def test_headers_hidden(self):
+        """Test no headers are added when the flag is off"""
+        res = self.client.get(ARTICLE_PUBLIC_URL)
+
+        self.assertFalse(res.has_header('X-DB-Query-Count'))
+        self.assertFalse(res.has_header('X-DB-Query-Time'))
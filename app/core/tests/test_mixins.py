@@ -0,0 +1,77 @@
+"""
+Test the viewset mixins
+"""
+from django.http import QueryDict
+from django.test import TestCase
+
+from core.mixins import plan_queryset, normalize_params
+from core.models import Article, ArticleInfo
+
+from article import serializers
+
+
+class PlanQuerysetTests(TestCase):
+    """Test planning related lookups from the serializer fields"""
+
+    def test_plan_string_related_fields(self):
+        """Test string related foreign keys are select related"""
+        queryset = plan_queryset(
+            ArticleInfo.objects.all(),
+            serializers.ArticleInfoDetailSerializer()
+        )
+
+        self.assertEqual(
+            queryset.query.select_related, {'article': {}, 'color': {}}
+        )
+        self.assertNotIn('user', queryset.query.deferred_loading[0])
+
+    def test_plan_primary_key_fields(self):
+        """Test primary key related fields need no join"""
+        queryset = plan_queryset(
+            ArticleInfo.objects.all(),
+            serializers.ArticleInfoSerializer()
+        )
+        fields, defer = queryset.query.deferred_loading
+
+        self.assertFalse(queryset.query.select_related)
+        self.assertFalse(defer)
+        self.assertEqual(
+            fields,
+            {'id', 'artid', 'article', 'color', 'category', 'mcategory',
+             'price', 'active', 'basic', 'export'}
+        )
+
+    def test_plan_nested_serializer(self):
+        """Test nested many serializers are prefetched, with their joins"""
+        queryset = plan_queryset(
+            Article.objects.all(),
+            serializers.ArticleDetailSerializer()
+        )
+        prefetch, = queryset._prefetch_related_lookups
+
+        self.assertEqual(prefetch.prefetch_to, 'items')
+        self.assertEqual(
+            prefetch.queryset.query.select_related,
+            {'article': {}, 'color': {}}
+        )
+
+
+class NormalizeParamsTests(TestCase):
+    """Test normalizing query params for the cache keys"""
+
+    def test_equivalent_filters_equal(self):
+        """Test order, case, spaces of list values are ignored"""
+        params1 = QueryDict('brand=Pride,debongo&active=true')
+        params2 = QueryDict('active=true&brand=debongo, pride,pride')
+
+        self.assertEqual(normalize_params(params1, ('brand',)),
+                         normalize_params(params2, ('brand',)))
+
+    def test_other_params_kept_exact(self):
+        """Test the cursor, substring filters are not normalized"""
+        for params1, params2 in [('cursor=cD0x', 'cursor=Cd0X'),
+                                 ('name=black,box', 'name=box,black')]:
+            self.assertNotEqual(
+                normalize_params(QueryDict(params1), ('brand',)),
+                normalize_params(QueryDict(params2), ('brand',))
+            )
@@ -0,0 +1,163 @@
+"""
+Test the routing of the reads to the read replicas
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import checks
+from core.db import routers
+from core.models import Article, Color, Material
+
+
+ARTICLE_INFO_URL = reverse('article:articleinfo-list')
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """Test the replica choice of the reads, outside of transactions"""
+    databases = {DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.state = routers.monitor.checked, routers.monitor.available
+
+    def tearDown(self):
+        routers.monitor.checked, routers.monitor.available = self.state
+
+    def measured(self, available):
+        """Replicas as if just measured"""
+        routers.monitor.checked = time.monotonic()
+        routers.monitor.available = available
+
+    @override_settings(DATABASE_REPLICAS=['replica0', 'replica1'])
+    def test_reads_routed(self):
+        """Test reads go to the replicas only under replica_reads()"""
+        self.measured(['replica1'])
+
+        self.assertIsNone(self.router.db_for_read(Material))
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Material), 'replica1')
+            self.assertEqual(self.router.db_for_write(Material),
+                             DEFAULT_DB_ALIAS)
+            with transaction.atomic():
+                self.assertIsNone(self.router.db_for_read(Material))
+
+    @override_settings(DATABASE_REPLICAS=['replica0'])
+    def test_unhealthy_replicas(self):
+        """Test reads fall back to the primary without healthy replicas"""
+        self.measured([])
+
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Material),
+                             DEFAULT_DB_ALIAS)
+
+    @override_settings(DATABASE_REPLICAS=[DEFAULT_DB_ALIAS],
+                       REPLICA_CHECK_INTERVAL=60)
+    def test_monitor_lag(self):
+        """Test replicas lagging too much are left out"""
+        routers.monitor.checked = None
+        with override_settings(REPLICA_MAX_LAG=-1):
+            self.assertEqual(routers.monitor.healthy(), [])
+
+        self.assertEqual(routers.monitor.healthy(), [])
+        routers.monitor.checked -= 60
+        self.assertEqual(routers.monitor.healthy(), [DEFAULT_DB_ALIAS])
+
+    def test_shared_cache_required(self):
+        """Test replicas are refused with a cache of the process"""
+        locmem = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }}
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/bom-app-cache'
+        }}
+        with override_settings(DATABASE_REPLICAS=['replica0'],
+                               CACHES=locmem):
+            errors = checks.check_replica_pins(None)
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+        with override_settings(DATABASE_REPLICAS=['replica0'],
+                               CACHES=shared):
+            self.assertEqual(checks.check_replica_pins(None), [])
+        with override_settings(DATABASE_REPLICAS=[], CACHES=locmem):
+            self.assertEqual(checks.check_replica_pins(None), [])
+
+    def test_no_migrations_on_replicas(self):
+        """Test replicas are left to the replication"""
+        with override_settings(DATABASE_REPLICAS=['replica0']):
+            self.assertFalse(self.router.allow_migrate('replica0', 'core'))
+            self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS,
+                                                        'core'))
+
+
+class ReplicaReadTests(TestCase):
+    """Test list, retrieve read the replicas unless the token wrote"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'staff@kalalokia.xyz', 'staffpass', is_staff=True
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+        self.article = Article.objects.create(user=self.user, artno='3290')
+        self.color = Color.objects.create(user=self.user, code='bk',
+                                          name='black')
+        self.reading = []
+
+    def record(self, execute, sql, params, many, context):
+        """Whether each query may read from the replicas"""
+        self.reading.append(routers.reading.get())
+        return execute(sql, params, many, context)
+
+    def get(self, url):
+        """Request, recording the routing of its queries"""
+        self.reading = []
+        with connection.execute_wrapper(self.record):
+            return self.client.get(url)
+
+    @override_settings(API_CACHE_TIMEOUT=0)
+    def test_reads_after_authentication(self):
+        """Test the token is checked on the primary, the rest replicas"""
+        res = self.get(ARTICLE_INFO_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(self.reading[0])
+        self.assertTrue(all(self.reading[1:]))
+        self.assertFalse(routers.reading.get())
+
+        self.get(reverse('article:color-list'))
+        self.assertFalse(any(self.reading))
+
+    @override_settings(API_CACHE_TIMEOUT=0)
+    def test_pinned_after_write(self):
+        """Test the token reads the primary after its writes"""
+        res = self.client.post(ARTICLE_INFO_URL, {
+            'article': self.article.id, 'color': self.color.id,
+            'category': 'g'
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.get(ARTICLE_INFO_URL)
+        self.assertFalse(any(self.reading))
+
+        self.client.credentials()
+        self.get(reverse('article:article-minimal-list'))
+        self.assertTrue(all(self.reading))
+
+    def test_failed_write_not_pinned(self):
+        """Test rejected writes do not pin"""
+        self.client.post(ARTICLE_INFO_URL, {'category': 'g'})
+
+        with override_settings(API_CACHE_TIMEOUT=0):
+            self.get(ARTICLE_INFO_URL)
+        self.assertTrue(any(self.reading))